@@ -0,0 +1,164 @@
+"""
+Admission Control - Bounded concurrency for the classification stage
+A host-wide gate of CLASSIFY_SLOTS slots (one flock()ed file per slot, shared
+by every gunicorn worker; a holder also writes its pid into the file, so the
+slots in use can be counted without taking any) limits how many classifications run at once. Work
+that cannot get a slot quickly is deferred instead of piling up on threads,
+and webhook intake answers 503 + Retry-After once the job backlog is too deep.
+"""
+
+import asyncio
+import fcntl
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Optional
+
+import structured_log
+
+log = structured_log.get_logger('admission')
+
+GATE_DIR = os.getenv('ADMISSION_DIR', '/tmp/admissions_gate')
+# Classifications running at once across all workers on this host
+CLASSIFY_SLOTS = int(os.getenv('CLASSIFY_SLOTS', '4'))
+# Callers allowed to wait for a slot per process; beyond that, defer at once
+CLASSIFY_QUEUE_DEPTH = int(os.getenv('CLASSIFY_QUEUE_DEPTH', '2'))
+# How long a waiting caller keeps trying before deferring
+CLASSIFY_GATE_WAIT = float(os.getenv('CLASSIFY_GATE_WAIT', '5'))
+# Queued jobs beyond which webhook intake returns 503 (0 = never)
+MAX_BACKLOG = int(os.getenv('ADMISSION_MAX_BACKLOG', '1000'))
+RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '30'))
+POLL_INTERVAL = 0.1
+
+
+class GateFull(Exception):
+    """No slot became free in time; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after: int = RETRY_AFTER):
+        super().__init__(f"Classification capacity exhausted - retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ConcurrencyGate:
+    """Host-wide counting semaphore built from `slots` lock files"""
+
+    def __init__(self, name: str, slots: int, queue_depth: int, wait: float, gate_dir: str = GATE_DIR):
+        self.name = name
+        self.slots = slots
+        self.queue_depth = queue_depth
+        self.wait = wait
+        self.gate_dir = Path(gate_dir)
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _path(self, i: int) -> str:
+        return str(self.gate_dir / f"{self.name}_{i}.lock")
+
+    def _try_slot(self) -> Optional[int]:
+        """Lock any free slot file and mark it held; returns its fd or None if all are taken"""
+        self.gate_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(self.slots):
+            fd = os.open(self._path(i), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, str(os.getpid()).encode(), 0)
+            return fd
+        return None
+
+    def _release(self, fd: int):
+        os.ftruncate(fd, 0)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _enter_queue(self):
+        with self._waiting_lock:
+            if self._waiting >= self.queue_depth:
+                raise GateFull()
+            self._waiting += 1
+
+    def _leave_queue(self):
+        with self._waiting_lock:
+            self._waiting -= 1
+
+    def in_use(self) -> int:
+        """Slots currently held on this host, counted from their marks without taking any"""
+        held = 0
+        for i in range(self.slots):
+            try:
+                if os.path.getsize(self._path(i)) == 0:
+                    continue
+                fd = os.open(self._path(i), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                # A worker that died keeps its mark but not its lock: a shared probe only
+                # succeeds on such a stale file, never on a slot that is really held
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                held += 1
+            finally:
+                os.close(fd)
+        return held
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the block, or raise GateFull after waiting `wait` seconds"""
+        fd = self._try_slot()
+        if fd is None:
+            self._enter_queue()
+            try:
+                deadline = time.monotonic() + self.wait
+                while fd is None:
+                    if time.monotonic() > deadline:
+                        raise GateFull()
+                    time.sleep(POLL_INTERVAL)
+                    fd = self._try_slot()
+            finally:
+                self._leave_queue()
+        try:
+            yield
+        finally:
+            self._release(fd)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Same as slot(), but waits without blocking the event loop"""
+        fd = self._try_slot()
+        if fd is None:
+            self._enter_queue()
+            try:
+                deadline = time.monotonic() + self.wait
+                while fd is None:
+                    if time.monotonic() > deadline:
+                        raise GateFull()
+                    await asyncio.sleep(POLL_INTERVAL)
+                    fd = self._try_slot()
+            finally:
+                self._leave_queue()
+        try:
+            yield
+        finally:
+            self._release(fd)
+
+
+def backlog_full(queued: int, incoming: int = 1) -> bool:
+    """True if accepting `incoming` more jobs would exceed the backlog limit"""
+    return MAX_BACKLOG > 0 and queued + incoming > MAX_BACKLOG
+
+
+# Global gate instance
+_gate = None
+
+def get_classification_gate() -> ConcurrencyGate:
+    """Get the gate guarding STEPS 4-7 (singleton)"""
+    global _gate
+    if _gate is None:
+        _gate = ConcurrencyGate('classify', CLASSIFY_SLOTS, CLASSIFY_QUEUE_DEPTH, CLASSIFY_GATE_WAIT)
+    return _gate
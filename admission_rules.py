@@ -0,0 +1,419 @@
+"""
+Admission Rules - UCL's admission requirements as a deterministic rules engine
+The rules in MULTI_FORM_SYSTEM_INSTRUCTION that don't need judgment are
+applied locally, over the forms and the documents' facts (document_facts):
+
+    documents show no High School             -> Certificación Básica
+    ministerial bachelor's (+ transcript)     -> Postgrado - Maestría
+    ministerial master's (+ transcript)       -> Postgrado - Doctorado
+    secular degree only                       -> Pregrado, never Postgrado
+    Postgrado target without degree documents -> PENDING DOCUMENT VERIFICATION
+    Certificación target                      -> Certificación (open access)
+    recommender named as spouse/family        -> flagged for manual review
+
+A case the rules settle is classified without calling Gemini (classification
+type 'rules'). Anything needing judgment - ministry experience standing in for
+a degree, degrees of unknown orientation, missing transcripts, an unclear
+target - goes to the model. When the model fails, the same evaluation gives a
+best-effort result instead of a fixed placeholder (still typed 'fallback' when
+the rules weren't certain, so the job is retried; its last attempt keeps it,
+flagged for manual review).
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+import structured_log
+from classification_framework import PROGRAM_DETAILS
+from recomendacion_pastoral import FORM_CONFIG as RECOMMENDATION_FORM
+
+log = structured_log.get_logger('classifier')
+
+SHORT_CIRCUIT = os.getenv('ADMISSION_RULES_SHORT_CIRCUIT', '1') == '1'
+
+LEVELS = ['certificacion', 'pregrado', 'maestria', 'doctorado']
+LEVEL_LABELS = {
+    'certificacion': 'Certificación Básica',
+    'pregrado': 'Pregrado - Licenciatura',
+    'maestria': 'Postgrado - Maestría',
+    'doctorado': 'Postgrado - Doctorado',
+}
+PENDING = 'PENDING DOCUMENT VERIFICATION'
+# PROGRAM_DETAILS names start with the level's program type
+PROGRAM_PREFIXES = {'certificacion': 'Certificado', 'pregrado': 'Licenciatura', 'maestria': 'Maestría',
+                    'doctorado': 'Doctorado'}
+
+# document_facts degree levels, lowest first
+DEGREES = ['none', 'high_school', 'technical', 'bachelor', 'master', 'doctorate']
+DEGREE_DOCUMENTS = ('diploma', 'transcript', 'degree_certificate')
+# Degree each level requires, and the documents that show it
+REQUIRED_DEGREE = {'maestria': 'bachelor', 'doctorado': 'master'}
+REQUIRED_DOCUMENTS = {
+    'pregrado': ["PDF título High School/técnico/profesional"],
+    'maestria': ["PDF de título de licenciatura ministerial", "Transcripción oficial de licenciatura ministerial"],
+    'doctorado': ["PDF de título de maestría ministerial", "Transcripción oficial de maestría ministerial"],
+}
+
+# Target level from 'Study Level Selected' / program interest, checked in this order:
+# undergraduate first, so "Undergraduate" and "Licenciatura" never read as a graduate target
+TARGETS = [
+    ('pregrado', re.compile(r'\b(?:licenciaturas?|pregrado|bachelor(?:\'?s)?|undergrad(?:uate)?)\b', re.I)),
+    ('doctorado', re.compile(r'\b(?:doctor\w*|d\.\s?min|dmin|ph\.\s?d|phd|th\.\s?d|thd)\b', re.I)),
+    ('maestria', re.compile(r'\b(?:maestr[ií]as?|masters?|m\.\s?div|mdiv|postgrados?|posgrados?|'
+                            r'(?:post-?)?graduate)\b', re.I)),
+    ('certificacion', re.compile(r'\bcertific\w*', re.I)),
+]
+YEARS = re.compile(r'(\d{1,2})\s*(?:años|anos|years?)', re.I)
+# A short answer naming the recommender as family (long free text is left to the model).
+# "Hermano"/"brother" usually means a fellow believer and "son" is a Spanish verb, so they only
+# count with a family cue.
+RELATIVE = re.compile(r'\b(c[oó]nyuge|espos[oa]|marido|padre|madre|pap[aá]|mam[aá]|hij[oa]|'
+                      r'suegr[oa]|cuñad[oa]|t[ií][oa]|prim[oa]|abuel[oa]|familiar|spouse|husband|wife|'
+                      r'father|mother|daughter|relative|(?:my|his|her)\s+son|'
+                      r'(?:mi|su|tu|my|his|her)\s+(?:herman[oa]|brother|sister)|'
+                      r'(?:herman[oa]|brother|sister)\s+(?:de\s+sangre|biol[oó]gic[oa]|carnal|by\s+blood))\b', re.I)
+RELATIVE_MAX_CHARS = 60
+# Names and addresses in the recommendation form ("Iglesia Hermanos en Cristo") are not answers
+NOT_RELATIONSHIP = (set(RECOMMENDATION_FORM['field_mappings']) | set(RECOMMENDATION_FORM['field_mappings'].values())
+                    | set(RECOMMENDATION_FORM['named_mappings'].values()))
+
+
+@dataclass
+class Profile:
+    """What the rules know about an applicant"""
+    target: Optional[str] = None
+    program_interest: str = ''
+    degrees: List[Dict] = field(default_factory=list)   # degree document facts
+    ministry_years: Optional[int] = None
+    ministry_position: str = ''
+    recommender: str = ''
+    relative: Optional[str] = None                      # relationship word naming family
+    same_surname: bool = False
+    # All forms in and every uploaded document read; otherwise only open-access rules are certain
+    complete: bool = False
+
+
+@dataclass
+class Decision:
+    level: str                      # a LEVELS key or PENDING
+    certain: bool
+    confidence: int
+    rules: List[str]
+    educational_assessment: str
+    documents_missing: List[str] = field(default_factory=list)
+    pathway_explanation: Optional[str] = None
+    notes: List[str] = field(default_factory=list)
+
+
+# --- NORMALIZATION ---
+
+def _target(*texts) -> Optional[str]:
+    for text in texts:
+        if not text or not isinstance(text, str):
+            continue
+        for level, pattern in TARGETS:
+            if pattern.search(text):
+                return level
+    return None
+
+
+def _rank(degree_level: Optional[str]) -> int:
+    return DEGREES.index(degree_level) if degree_level in DEGREES else -1
+
+
+def _strings(data: Dict, skip=()) -> List[str]:
+    return [value.strip() for key, value in (data or {}).items()
+            if key not in skip and isinstance(value, str) and value.strip()]
+
+
+def _forms(app, marker: str) -> List[Dict]:
+    """data_snapshot of the application's forms whose type mentions marker"""
+    if app is None:
+        return []
+    return [form.data_snapshot or {} for form in app.forms_submitted if marker in str(form.form_type).lower()]
+
+
+def normalize(student_data: Dict, app=None, facts: Optional[List[Dict]] = None, unread: int = 0) -> Profile:
+    """unread: uploaded documents without facts (the rules can't see them)"""
+    profile = Profile(program_interest=str(student_data.get('program_interest') or ''),
+                      complete=app is not None and not unread)
+    profile.target = _target(student_data.get('study_level_selected'), student_data.get('program_interest'))
+    profile.degrees = [fact for fact in facts or [] if fact.get('document_type') in DEGREE_DOCUMENTS
+                       or _rank(fact.get('degree_level')) > 0]
+
+    experience = _forms(app, 'experiencia') + [student_data]
+    years = []
+    for data in experience:
+        for key in ('years_attending_church', 'element_55'):
+            if str(data.get(key, '')).strip().isdigit():
+                years.append(int(str(data[key]).strip()))
+        years += [int(match) for text in _strings(data) for match in YEARS.findall(text)]
+        profile.ministry_position = profile.ministry_position or str(data.get('ministry_position')
+                                                                     or data.get('element_64') or '')
+    profile.ministry_years = max(years) if years else None
+
+    for data in _forms(app, 'recomend'):
+        profile.recommender = profile.recommender or str(data.get('pastor_name') or data.get('element_12') or '')
+        for text in _strings(data, NOT_RELATIONSHIP):
+            match = RELATIVE.search(text) if len(text) <= RELATIVE_MAX_CHARS else None
+            if match and not profile.relative:
+                profile.relative = match.group(1)
+    last_name = student_data.get('applicant_last_name') or \
+        ' '.join(str(student_data.get('applicant_name') or '').split()[1:])
+    surnames = {word.lower() for word in str(last_name).split() if len(word) > 2}
+    profile.same_surname = bool(surnames & {word.lower() for word in profile.recommender.split()[1:]})
+    return profile
+
+
+# --- RULES ---
+
+def _highest(degrees: List[Dict], orientation: Optional[str] = None) -> int:
+    return max((_rank(fact.get('degree_level')) for fact in degrees
+                if orientation is None or fact.get('orientation') == orientation), default=-1)
+
+
+def _has_transcript(degrees: List[Dict], degree_level: str) -> bool:
+    return any(fact.get('document_type') == 'transcript' and fact.get('orientation') == 'ministerial'
+               and _rank(fact.get('degree_level')) >= _rank(degree_level) for fact in degrees)
+
+
+def _describe(degrees: List[Dict]) -> str:
+    described = []
+    for fact in degrees:
+        title = fact.get('degree_title') or fact.get('degree_level') or 'document'
+        details = ', '.join(str(part) for part in (fact.get('orientation'), fact.get('institution'), fact.get('year'))
+                            if part)
+        described.append(f"{title} ({fact.get('document_type')}{', ' + details if details else ''})")
+    return '; '.join(described)
+
+
+def decide(profile: Profile) -> Decision:
+    """Apply the admission rules; certain=False leaves the case to the model"""
+    decision = _decide(profile)
+    if not profile.complete and decision.rules != ['certificacion_open_access']:
+        decision.certain = False
+    # A degree document whose level couldn't be read (illegible scan) may hold anything
+    if any(_rank(fact.get('degree_level')) < 0 for fact in profile.degrees) \
+            and decision.rules != ['certificacion_open_access']:
+        decision.certain = False
+    return decision
+
+
+def _decide(profile: Profile) -> Decision:
+    verified = _describe(profile.degrees)
+    highest = _highest(profile.degrees)
+    ministerial = _highest(profile.degrees, 'ministerial')
+    target = profile.target
+
+    if target == 'certificacion':
+        return Decision('certificacion', True, 90, ['certificacion_open_access'],
+                        "Certificación programs are open access - no prerequisites required."
+                        + (f" Documents: {verified}." if verified else ''))
+
+    if not profile.degrees:
+        if target in REQUIRED_DEGREE:
+            return Decision(PENDING, True, 30, ['postgrado_requires_documents'],
+                            f"Applicant selected {LEVEL_LABELS[target]} but no degree documents were provided. "
+                            "Cannot verify education level.",
+                            documents_missing=REQUIRED_DOCUMENTS[target],
+                            notes=["CRITICAL: Cannot proceed without document verification."])
+        # Ministry experience may stand in for a degree at Pregrado - a judgment call
+        level = 'pregrado' if target == 'pregrado' else 'certificacion'
+        return Decision(level, False, 40 if target else 20, ['no_degree_documents'],
+                        "No degree documents provided; education level is unverified.",
+                        documents_missing=REQUIRED_DOCUMENTS['pregrado'])
+
+    if highest < 0:
+        return Decision('pregrado' if target else 'certificacion', False, 30, ['degree_level_unknown'],
+                        f"Degree documents provided ({verified}) but their level could not be read.")
+
+    if highest < _rank('high_school'):
+        # Only reached when a document explicitly reports degree_level 'none'
+        pathway = None
+        if target in LEVELS[1:]:
+            pathway = (f"Certificación Básica requires no prior studies. Completing High School (or an equivalent) "
+                       f"opens the way to Pregrado and later {LEVEL_LABELS[target]}.")
+        return Decision('certificacion', True, 90, ['no_high_school'],
+                        f"No High School shown in the documents ({verified}). Certificación programs are open "
+                        "access - no prerequisites required.", pathway_explanation=pathway)
+
+    if ministerial >= _rank('master'):
+        qualified = 'doctorado'
+    elif ministerial >= _rank('bachelor'):
+        qualified = 'maestria'
+    else:
+        qualified = 'pregrado'
+    level = qualified if target is None else LEVELS[min(LEVELS.index(qualified), LEVELS.index(target))]
+
+    if level in REQUIRED_DEGREE:
+        required = REQUIRED_DEGREE[level]
+        if not _has_transcript(profile.degrees, required):
+            # A diploma without its transcript is a "some documents" case - the model weighs it
+            return Decision(level, False, 70, ['ministerial_degree_without_transcript'],
+                            f"Ministerial {required}'s degree shown ({verified}) but no official transcript.",
+                            documents_missing=REQUIRED_DOCUMENTS[level][1:])
+        pathway = None
+        if target and LEVELS.index(level) < LEVELS.index(target):
+            pathway = f"Complete {LEVEL_LABELS[level]} -> Advance to {LEVEL_LABELS[target]}."
+        return Decision(level, True, 92, [f'ministerial_{required}'],
+                        f"Verified ministerial {required}'s degree with official transcript: {verified}.",
+                        pathway_explanation=pathway)
+
+    if target in REQUIRED_DEGREE:
+        # Over-aspiring: the degrees don't reach the target
+        if _highest(profile.degrees, 'unknown') >= _rank('bachelor'):
+            return Decision('pregrado', False, 50, ['degree_orientation_unknown'],
+                            f"Degree of unclear field ({verified}); whether it is ministerial decides the level.")
+        secular = _highest(profile.degrees, 'secular') >= _rank('bachelor')
+        assessment = (f"Secular degree ({verified}) does not meet the ministerial education requirement for "
+                      f"{LEVEL_LABELS[target]}. Must complete a ministerial bachelor's first." if secular else
+                      f"Documents ({verified}) show no ministerial bachelor's, required for {LEVEL_LABELS[target]}.")
+        return Decision('pregrado', True, 78, ['secular_degree_not_postgrado' if secular else 'below_target'],
+                        assessment,
+                        pathway_explanation=f"Complete Licenciatura en Teología (4 years, may accelerate with prior "
+                                            f"learning credit) -> Advance to {LEVEL_LABELS[target]}. This pathway "
+                                            "ensures strong theological foundation for graduate studies.")
+
+    if target is None:
+        return Decision(level, False, 60, ['no_target'], f"Documents: {verified}. No study level selected.")
+    return Decision('pregrado', True, 88, ['high_school_for_pregrado'],
+                    f"Has the education Pregrado requires: {verified}.")
+
+
+# --- OUTPUT ---
+
+def programs(level: Optional[str], interest: str = '') -> List[str]:
+    """Up to three PROGRAM_DETAILS programs of a level, those matching the applicant's interest first"""
+    prefix = PROGRAM_PREFIXES.get(level)
+    if not prefix:
+        return []
+    words = {word for word in re.findall(r'\w{4,}', interest.lower())}
+    names = [name for name in PROGRAM_DETAILS if name.startswith(prefix)]
+    names.sort(key=lambda name: -len(words & set(re.findall(r'\w{4,}', name.lower()))))
+    return names[:3]
+
+
+def _explanation(program: str) -> str:
+    details = PROGRAM_DETAILS[program]
+    return f"{details['focus']}. {details['duration']}, {details['credits']}, {details['format']}."
+
+
+def _next_steps(decision: Decision, profile: Profile, recommended: List[str]) -> List[str]:
+    if decision.level == PENDING:
+        return [f"Submit {document}" for document in decision.documents_missing] + \
+               ["Once received, final classification will be provided"]
+    steps = [f"Enroll in {recommended[0]}"] if recommended else []
+    if decision.pathway_explanation and decision.level == 'pregrado':
+        steps.append("Request evaluation of ministry experience for possible credit")
+        steps.append(f"Plan to advance to {LEVEL_LABELS[profile.target]} upon completion")
+    steps += [f"Submit {document}" for document in decision.documents_missing]
+    steps.append("Submit activation payment" if decision.level == 'certificacion' else "Submit admission payment")
+    return steps
+
+
+def _ministry_assessment(profile: Profile) -> str:
+    if profile.ministry_years is None and not profile.ministry_position:
+        return "Not stated in structured form fields - see the Experiencia Ministerial form."
+    parts = []
+    if profile.ministry_years is not None:
+        parts.append(f"{profile.ministry_years} years reported")
+    if profile.ministry_position:
+        parts.append(f"position: {profile.ministry_position}")
+    text = '; '.join(parts)
+    return text[0].upper() + text[1:] + '. Ministry experience enhances but does not replace degree requirements.'
+
+
+def _recommendation_assessment(profile: Profile, notes: List[str]) -> str:
+    if profile.relative:
+        notes.append(f"FLAG: recommendation appears to come from a family member ('{profile.relative}') - "
+                     "manual review required.")
+        return f"Recommender described as '{profile.relative}' - spouse/family recommendations are not acceptable."
+    if profile.same_surname:
+        notes.append("Recommender shares the applicant's surname - verify they are not family.")
+    if profile.recommender:
+        return f"Recommendation from {profile.recommender}; quality not assessed by the rules."
+    return "Pending review."
+
+
+def classification(decision: Decision, profile: Profile, stage: int = 2, forms_analyzed: int = 0) -> Dict:
+    """A classification in the shape Gemini returns (Stage 1 or Stage 2 fields)"""
+    level = LEVEL_LABELS.get(decision.level, decision.level)
+    recommended = programs(decision.level, profile.program_interest)
+    notes = list(decision.notes)
+    confidence = decision.confidence
+    recommendation = _recommendation_assessment(profile, notes)
+    if profile.relative:
+        confidence = min(confidence, 60)
+    reasoning = {
+        'educational_assessment': decision.educational_assessment,
+        'ministry_experience_assessment': _ministry_assessment(profile),
+        'pastoral_recommendation_assessment': recommendation,
+        'documents_missing': decision.documents_missing,
+    }
+    if decision.pathway_explanation:
+        reasoning['pathway_explanation'] = decision.pathway_explanation
+    notes.append(f"Classified by admission rules: {', '.join(decision.rules)}.")
+
+    result = {
+        'recommended_level': level,
+        'recommended_programs': recommended,
+        'program_explanations': {program: _explanation(program) for program in recommended},
+        'confidence_score': confidence,
+        'reasoning': reasoning,
+        'next_steps': _next_steps(decision, profile, recommended),
+        'admissions_notes': ' '.join(notes),
+        'classification_type': 'rules',
+        'stage': stage,
+        'rules': decision.rules,
+    }
+    if stage == 1:
+        result['justification'] = decision.educational_assessment
+        result['pending_documents'] = ["Experiencia Ministerial", "Recomendación Pastoral"]
+    else:
+        result['forms_analyzed'] = forms_analyzed
+    return result
+
+
+def evaluate(student_data: Dict, app=None, facts: Optional[List[Dict]] = None,
+             unread: int = 0) -> Tuple[Profile, Decision]:
+    profile = normalize(student_data, app, facts, unread)
+    return profile, decide(profile)
+
+
+def short_circuit(student_data: Dict, app=None, facts: Optional[List[Dict]] = None,
+                  unread: int = 0) -> Optional[Dict]:
+    """The rules' classification when they settle the case (no model call needed), else None"""
+    if not SHORT_CIRCUIT:
+        return None
+    profile, decision = evaluate(student_data, app, facts, unread)
+    stage = 2 if app is not None else 1
+    if not decision.certain:
+        metrics.ADMISSION_RULES_TOTAL.inc(stage=str(stage), outcome='model')
+        return None
+    metrics.ADMISSION_RULES_TOTAL.inc(stage=str(stage), outcome='decided')
+    result = classification(decision, profile, stage, len(app.forms_submitted) if app is not None else 0)
+    log.info(f"Stage {stage} - Rules: {result['recommended_level']}", rules=decision.rules)
+    return result
+
+
+def fallback(student_data: Dict, app=None, facts: Optional[List[Dict]] = None, unread: int = 0) -> Dict:
+    """
+    Rule-based classification for when the model fails. Typed 'fallback' (so the
+    job is retried and nothing is cached) unless the rules were certain; the
+    job's last attempt stores it as is, marked for manual review.
+    """
+    profile, decision = evaluate(student_data or {}, app, facts, unread)
+    result = classification(decision, profile, 2 if app is not None else 1,
+                            len(app.forms_submitted) if app is not None else 0)
+    metrics.ADMISSION_RULES_TOTAL.inc(stage=str(result['stage']), outcome='fallback')
+    if not decision.certain:
+        result['classification_type'] = 'fallback'
+        result['stage'] = 0
+        result['confidence_score'] = min(result['confidence_score'], 40)
+        result['admissions_notes'] = ("⚠️ ATENCIÓN: Clasificación automática falló - resultado provisional de las "
+                                      "reglas de admisión. Revisar manualmente. " + result['admissions_notes'])
+        result.setdefault('justification', result['reasoning']['educational_assessment'])
+    return result
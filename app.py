@@ -1,7 +1,10 @@
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 import os
 import json
+import logging
+import threading
+import time
 from dotenv import load_dotenv
 from flask_cors import CORS
 
@@ -11,26 +14,71 @@ import estados_unidos
 import latinoamerica
 import experiencia_ministerial
 import recomendacion_pastoral
-import gemini_classifier
+# gemini_classifier (Vertex AI) and docx_generator (python-docx) are imported on
+# first use - see warm_imports()
 import salesforce_client
-import docx_generator
 import email_sender
 import application_tracker
 import api_routes
-import machform_client
+import job_queue
+import stage_graph
+import applicant_lock
+import idempotency
+import classification_cache
+import classification_events
+import document_prefetch
+import batch_ingest
+import admission
+import gemini_guard
+import metrics
+import structured_log
 
 # Load environment variables
 load_dotenv()
 
+log = structured_log.get_logger('webhook')
+# DEBUG-only dump of file-like fields; enable with LOG_LEVELS=field_analysis=DEBUG
+field_log = structured_log.get_logger('field_analysis')
+
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Salesforce Client
-sf_client = salesforce_client.SalesforceClient()
+# Initialize Salesforce Client - workers log in on a background thread at boot
+# (see below) and pipeline calls wait for it via ensure_connected()
+sf_client = salesforce_client.SalesforceClient(connect=False)
 
 # Register API routes
 api_routes.register_api_routes(app, sf_client)
 
+# Background job queue - webhooks are persisted and processed by worker threads
+jobs = job_queue.get_queue()
+
+# Dedup store for MachForm redeliveries / double submissions
+idempotency_store = idempotency.get_store()
+
+# Gemini results keyed by their inputs (None when CLASSIFICATION_CACHE=0)
+result_cache = classification_cache.get_cache()
+
+# Bounds concurrent STEPS 4-7 across all workers on this host
+classification_gate = admission.get_classification_gate()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def count_request(response):
+    metrics.HTTP_TOTAL.inc(method=request.method, endpoint=request.endpoint or 'unmatched', status=response.status_code)
+    return response
+
+@app.teardown_request
+def stop_request_timer(exc):
+    if 'request_started' in g:
+        metrics.HTTP_IN_FLIGHT.dec()
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_started,
+                                     method=request.method, endpoint=request.endpoint or 'unmatched')
+
 @app.route('/', methods=['GET'])
 def home():
     return "LOGOS UCL - Multi-Form Admissions System (v2.0)"
@@ -40,46 +88,52 @@ def health():
     """Health check endpoint"""
     return jsonify({
         "status": "healthy",
-        "salesforce": "connected" if sf_client else "disconnected"
+        "salesforce": sf_client.state,
+        "jobs": jobs.counts(),
+        "idempotency": idempotency_store.stats(),
+        "classification_cache": result_cache.stats() if result_cache else None,
+        "gemini": gemini_guard.get_guard().status()
     })
 
-def process_webhook(raw_data, form_type, form_config_module):
-    print("\n" + "="*60)
-    print("📨 WEBHOOK RECEIVED")
-    print("="*60)
-    print(f"📦 Data fields received: {len(raw_data)}")
-    print(f"📄 Processing Form Type: {form_type}")
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until the background Salesforce login has succeeded"""
+    body = {"ready": sf_client.ready, "salesforce": sf_client.state}
+    return jsonify(body), 200 if sf_client.ready else 503
 
-    # ENHANCED: Check ALL fields for potential file data
-    print("\n🔍 DETAILED FIELD ANALYSIS:")
-    print("-" * 60)
-    
-    for key, value in raw_data.items():
-        value_str = str(value)
-        
-        # Check if value looks like a file path or URL
-        is_file_related = (
-            'file' in key.lower() or 
-            'upload' in key.lower() or 
-            'document' in key.lower() or
-            'attach' in key.lower() or
-            '.pdf' in value_str.lower() or
-            '.jpg' in value_str.lower() or
-            '.png' in value_str.lower() or
-            '.doc' in value_str.lower() or
-            '/data/' in value_str or
-            'machform/data/' in value_str or
-            value_str.startswith('http')
-        )
-        
-        if is_file_related:
-            value_preview = value_str[:300] + "..." if len(value_str) > 300 else value_str
-            print(f"📎 {key}: {value_preview}")
-    
-    print("-" * 60)
-    print("="*60 + "\n")
+def process_webhook(raw_data, form_type, form_config_module, job_id=None, send_emails=True):
+    """
+    Run the full admissions pipeline for one form submission.
+    Returns (response_body, status_code). When job_id is given, each STEP is
+    recorded on the job so /jobs/<job_id> can report progress.
+    send_emails=False runs everything except the Resend emails (backfill dry runs).
+    """
+    stages = metrics.StageTimer(form_type)
+    with metrics.pipeline(form_type) as run:
+        try:
+            body, status_code = _process_webhook(raw_data, form_type, form_config_module, job_id, send_emails, stages)
+        except Exception:
+            stages.finish('error')
+            raise
+        stages.finish('error' if status_code >= 400 else 'ok')
+        run['outcome'] = body.get('status', 'ok')
+    return body, status_code
+
+def _process_webhook(raw_data, form_type, form_config_module, job_id, send_emails, stages):
+    def report_stage(stage):
+        stages.enter(stage)
+        if job_id:
+            jobs.update_stage(job_id, stage)
+
+    # Side effects already committed by an earlier attempt of this job are skipped
+    ledger = job_queue.StageLedger(jobs, job_id)
+
+    log.info("📨 Webhook received", form_type=form_type, fields=len(raw_data), job_id=job_id)
+    if field_log.sampled():
+        log_field_analysis(raw_data)
 
     # STEP 1: Extract Data using the specific module
+    report_stage("extract")
     try:
         student_data = form_config_module.extract_student_data(raw_data)
         # Ensure form_name is set correctly (force overwrite with the trusted type)
@@ -87,86 +141,97 @@ def process_webhook(raw_data, form_type, form_config_module):
 
         # Old file retrieval logic removed - moved to gemini_classifier.py
         
-        print(f"\n🔍 STEP 1: Data Extraction")
-        print(f"✓ Applicant: {student_data.get('applicant_name')}")
-        print(f"✓ Email: {student_data.get('email')}")
+        log.info("🔍 STEP 1: Data extracted", applicant=student_data.get('applicant_name'),
+                 email=student_data.get('email'))
     except Exception as e:
-        print(f"❌ Error extracting data: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 400
+        log.error(f"❌ Error extracting data: {e}", form_type=form_type)
+        return {"status": "error", "message": str(e)}, 400
 
     # STEP 2: Store in Salesforce
-    print("\n💾 STEP 2: Salesforce Integration")
+    report_stage("salesforce")
     lead_id = None
     all_forms_complete = False
     previous_form_count = 0
     new_form_count = 0
     
     if sf_client:
-        try:
-            # Find or create Lead
-            email = student_data.get('email', 'unknown@example.com')
-            first_name = student_data.get('applicant_first_name', 'Unknown')
-            last_name = student_data.get('applicant_last_name', 'Unknown')
-            
-            lead_id = sf_client.find_or_create_lead(email, first_name, last_name)
-            
-            if lead_id:
+        # Find or create Lead
+        email = student_data.get('email', 'unknown@example.com')
+        first_name = student_data.get('applicant_first_name', 'Unknown')
+        last_name = student_data.get('applicant_last_name', 'Unknown')
+
+        # Serialize every webhook for this applicant (across threads and workers)
+        # so concurrent forms never race on Lead creation or the form count
+        with applicant_lock.applicant_lock(email):
+            sf_client.ensure_connected()
+            lead_id = ledger.run("lead", lambda: require(
+                sf_client.find_or_create_lead(email, first_name, last_name),
+                "Could not create/find Lead in Salesforce"
+            ))
+
+            # A retry must not mistake the Form_Submission it already created for a duplicate
+            if not ledger.done("form_submission"):
                 # CHECK FOR DUPLICATES
                 is_duplicate = sf_client.check_duplicate_form_type(lead_id, form_type)
-                
+
                 if is_duplicate:
-                    print(f"⚠️ DUPLICATE SUBMISSION: {form_type} already exists for this Lead")
-                    
+                    log.warning("⚠️ DUPLICATE SUBMISSION: form type already exists for this Lead",
+                                form_type=form_type, lead_id=lead_id)
+
                     # Send Warning Email
                     recipient = student_data.get('email')
                     if recipient:
-                        print(f"[EMAIL] Sending DUPLICATE WARNING to {recipient}")
-                        email_sender.send_email_with_attachment(
+                        ledger.run("duplicate_warning_email", lambda: send_email(
+                            send_emails,
                             recipient=recipient,
                             student_data=student_data,
                             email_type="duplicate_warning"
-                        )
-                    
-                    return jsonify({
+                        ))
+
+                    return {
                         "status": "warning",
                         "message": "Duplicate form submission detected - warning email sent",
                         "form_detected": form_type
-                    }), 200
+                    }, 200
 
                 # Create Form Submission record
-                sf_client.create_form_submission(lead_id, form_type, json.dumps(raw_data, ensure_ascii=False))
-                
-                # Track counts BEFORE and AFTER update
-                # Handle Salesforce eventual consistency: Query might not show the new record immediately
-                submitted_types_list = sf_client.get_submitted_form_types(lead_id)
-                
-                # Ensure current form is counted even if query lags
-                if form_type not in submitted_types_list:
-                        submitted_types_list.append(form_type)
-                
-                # Deduplicate just in case
-                submitted_types_set = set(submitted_types_list)
-                
-                new_form_count = len(submitted_types_set)
-                previous_form_count = new_form_count - 1 
-                
-                # Update Lead form count (this puts the count in the Lead record, mostly for reference/CRM view)
-                all_forms_complete = sf_client.update_lead_form_count(lead_id)
-                
-                print(f"✓ Salesforce records created/updated")
-                print(f"✓ Form Count: {previous_form_count} -> {new_form_count}")
-                print(f"✓ All forms complete: {all_forms_complete}")
-            else:
-                print("⚠️ Could not create/find Lead in Salesforce")
-        except Exception as e:
-            print(f"⚠️ Salesforce error: {e}")
+                ledger.run("form_submission", lambda: require(
+                    sf_client.create_form_submission(lead_id, form_type, json.dumps(raw_data, ensure_ascii=False)),
+                    "Could not create Form_Submission"
+                ))
+
+            # Track counts BEFORE and AFTER update
+            # Handle Salesforce eventual consistency: Query might not show the new record immediately
+            submitted_types_list = require(sf_client.get_submitted_form_types(lead_id),
+                                           "Could not read submitted form types")
+
+            # Ensure current form is counted even if query lags
+            if form_type not in submitted_types_list:
+                submitted_types_list.append(form_type)
+
+            # Deduplicate just in case
+            submitted_types_set = set(submitted_types_list)
+
+            new_form_count = len(submitted_types_set)
+            previous_form_count = new_form_count - 1
+
+            # Update Lead form count (this puts the count in the Lead record, mostly for reference/CRM view)
+            all_forms_complete = ledger.run("lead_form_count", lambda: require(
+                sf_client.update_lead_form_count(lead_id),
+                "Could not update Lead form count"
+            ))
+
+            log.info("💾 STEP 2: Salesforce records created/updated", lead_id=lead_id,
+                     form_count=f"{previous_form_count} -> {new_form_count}",
+                     all_forms_complete=all_forms_complete)
     else:
-        print("⚠️ Salesforce not connected - skipping")
+        log.warning("⚠️ Salesforce not connected - skipping")
 
     # STEP 3: Logic Gates (Email & Classification)
     if new_form_count < 3 and sf_client:
         # Case 1: Incomplete Application (Forms 1 or 2)
-        print(f"\n📧 Sending ACKNOWLEDGMENT email ({new_form_count}/3 forms)")
+        report_stage("acknowledgment_email")
+        log.info(f"📧 Sending ACKNOWLEDGMENT email ({new_form_count}/3 forms)", lead_id=lead_id)
         
         # Determine missing forms
         submitted_types_now = submitted_types_set if 'submitted_types_set' in locals() else set()
@@ -180,87 +245,157 @@ def process_webhook(raw_data, form_type, form_config_module):
         if not any("Recomendación" in t for t in submitted_types_now):
             missing_forms.append("Recomendación Pastoral")
 
-        email_sender.send_email_with_attachment(
+        # Download uploaded documents in the background so the final classification finds them on disk
+        if document_prefetch.ENABLED and student_data.get('email'):
+            ledger.run("document_prefetch", lambda: jobs.enqueue("prefetch", {"email": student_data['email']}))
+
+        ledger.run("acknowledgment_email", lambda: send_email(
+            send_emails,
             recipient=student_data.get('email'),
             student_data=student_data,
             email_type="acknowledgment",
             missing_forms=missing_forms,
             form_count=new_form_count
-        )
+        ))
         
-        print("✅ SUCCESS - Acknowledgment sent (skipping classification)")
-        return jsonify({
+        log.info("✅ SUCCESS - Acknowledgment sent (skipping classification)", lead_id=lead_id)
+        return {
             "status": "success",
             "message": "Form received, acknowledgment sent",
             "progress": f"{new_form_count}/3"
-        })
+        }, 200
 
     elif previous_form_count < 3 and new_form_count == 3:
         # Case 2: Just Completed (Transition 2 -> 3)
-        print("\n🤖 STEP 4: AI Classification (Stage 2 Triggered)")
+        log.info("🤖 STEP 4: AI Classification (Stage 2 Triggered)", lead_id=lead_id)
         # Proceed to classification logic below
     else:
         # Case 3: Already complete or weird state
         if sf_client and new_form_count > 3:
-                print(f"⚠️ Extra form submitted ({new_form_count}/3). Skipping re-classification.")
-                return jsonify({"status": "success", "message": "Extra form received"}), 200
-        print("\n🤖 STEP 4: AI Classification (Fallback/Local flow)")
+                log.info(f"⚠️ Extra form submitted ({new_form_count}/3). Skipping re-classification.", lead_id=lead_id)
+                return {"status": "success", "message": "Extra form received"}, 200
+        log.info("🤖 STEP 4: AI Classification (Fallback/Local flow)")
+
+    stages.finish()
+    return run_classification(student_data, form_type, lead_id, all_forms_complete, new_form_count,
+                              job_id=job_id, send_emails=send_emails)
 
-    # STEP 4: Classify student
+def run_classification(student_data, form_type, lead_id, all_forms_complete, new_form_count, job_id=None, send_emails=True):
+    """
+    STEPS 4-7: classify, store the classification, render the DOCX and send the
+    final email. Runs as a stage graph so independent stages execute concurrently.
+    Returns (response_body, status_code).
+    """
+    def report_stage(stage):
+        if job_id:
+            jobs.update_stage(job_id, stage)
+
+    ledger = job_queue.StageLedger(jobs, job_id)
     classification_status = 'Final' if new_form_count >= 3 else 'Preliminary'
+    use_comprehensive = bool(all_forms_complete and sf_client and lead_id)
+
+    def fetch_submissions(results):
+        # If all forms complete and we have Salesforce, get comprehensive data
+        if not use_comprehensive:
+            return None
+        return sf_client.get_all_form_submissions(lead_id)
+
+    def fetch_documents(results):
+        import gemini_classifier
+        return gemini_classifier.fetch_uploaded_documents(student_data.get('email'))
+
+    def classify(results):
+        # STEP 4: Classify student
+        import gemini_classifier
+        all_submissions = results['submissions']
+        if use_comprehensive:
+            log.info("🤖 STEP 4: Classify student - Stage 2 (comprehensive - all forms)", lead_id=lead_id)
+            # Combine all form data for comprehensive analysis
+            classification_input = student_data.copy()
+            classification_input['all_submissions'] = all_submissions
+            classification_input['total_forms'] = len(all_submissions)
+        else:
+            log.info("🤖 STEP 4: Classify student - Stage 1 (single-form/fallback)", lead_id=lead_id)
+            classification_input = student_data
+
+        # Stage 2 fields are pushed to the dashboard's SSE stream as Gemini writes them
+        progress = classification_events.publisher(lead_id)
+        try:
+            classification = ledger.run("classification", lambda: require_classified(
+                gemini_classifier.classify_student(classification_input, documents=results['documents'],
+                                                   progress=progress),
+                ledger.final_attempt
+            ))
+        except Exception as e:
+            if progress:
+                progress('failed', {'error': str(e)})
+            raise
+        if progress:
+            progress('complete', {'classification': classification, 'status': classification_status})
+        log.info("✓ Classified", recommended_level=classification.get('recommended_level'),
+                 programs=classification.get('recommended_programs'), status=classification_status)
+        return classification
+
+    def store_classification(results):
+        # STEP 5: Store Classification in Salesforce
+        if not (sf_client and lead_id):
+            return None
+        classification_id = ledger.run("store_classification", lambda: require(
+            sf_client.create_classification(lead_id, results['classification'], status=classification_status),
+            "Could not store Classification"
+        ))
+        log.info("💾 STEP 5: Classification saved to Salesforce", lead_id=lead_id, classification_id=classification_id)
+        return classification_id
+
+    def generate_report(results):
+        # STEP 6: Generate DOCX report
+        import docx_generator
+        docx_path = docx_generator.generate_report(
+            student_data=student_data,
+            classification=results['classification']
+        )
+        log.info("📄 STEP 6: Report saved", path=docx_path)
+        return docx_path
+
+    def send_final_email(results):
+        # STEP 7: Send email
+        recipient = os.getenv('RECIPIENT_EMAIL', 'web@logos.edu')
+        sent = ledger.run("final_email", lambda: send_email(
+            send_emails,
+            recipient=recipient,
+            student_data=student_data,
+            classification=results['classification'],
+            docx_path=results['report'],
+            email_type="final"
+        ))
+        log.info("📧 STEP 7: Final recommendation email", sent=sent)
+        return sent
+
+    graph = stage_graph.StageGraph(metrics.track_stages(form_type, [
+        stage_graph.Stage("submissions", fetch_submissions),
+        stage_graph.Stage("documents", fetch_documents),
+        stage_graph.Stage("classification", classify, deps=["submissions", "documents"]),
+        stage_graph.Stage("store_classification", store_classification, deps=["classification"]),
+        stage_graph.Stage("report", generate_report, deps=["classification"]),
+        stage_graph.Stage("final_email", send_final_email, deps=["report"]),
+    ]))
+    try:
+        with classification_gate.slot():
+            results, stage_timings = graph.run(on_stage_start=report_stage)
+    except admission.GateFull as e:
+        return defer_classification(student_data, form_type, lead_id, all_forms_complete, new_form_count,
+                                    send_emails, e.retry_after)
+    except stage_graph.StageFailed as e:
+        # Gemini over quota or down: fail fast and come back when it should have recovered
+        if not isinstance(e.error, gemini_guard.GeminiUnavailable):
+            raise
+        return defer_classification(student_data, form_type, lead_id, all_forms_complete, new_form_count,
+                                    send_emails, e.error.retry_after, reason=str(e.error))
+
+    log.info("✅ SUCCESS - Processing complete", lead_id=lead_id,
+             stage_timings={name: timing.get('duration') for name, timing in stage_timings.items()})
     
-    # If all forms complete and we have Salesforce, get comprehensive data
-    if all_forms_complete and sf_client and lead_id:
-        print("[CLASSIFIER] Using Stage 2 (comprehensive - all forms)")
-        all_submissions = sf_client.get_all_form_submissions(lead_id)
-        
-        # Combine all form data for comprehensive analysis
-        comprehensive_data = student_data.copy()
-        comprehensive_data['all_submissions'] = all_submissions
-        comprehensive_data['total_forms'] = len(all_submissions)
-        
-        classification = gemini_classifier.classify_student(comprehensive_data)
-    else:
-        print("[CLASSIFIER] Using Stage 1 (single-form/fallback)")
-        classification = gemini_classifier.classify_student(student_data)
-    
-    print(f"✓ Level: {classification.get('recommended_level')}")
-    print(f"✓ Programs: {classification.get('recommended_programs')}")
-    print(f"✓ Status: {classification_status}")
-    
-    # STEP 5: Store Classification in Salesforce
-    if sf_client and lead_id:
-        print("\n💾 STEP 5: Store Classification")
-        sf_client.create_classification(lead_id, classification, status=classification_status)
-        print("✓ Classification saved to Salesforce")
-    
-    # STEP 6: Generate DOCX report
-    print("\n📄 STEP 6: Generate Report")
-    docx_path = docx_generator.generate_report(
-        student_data=student_data,
-        classification=classification
-    )
-    print(f"✓ Report saved: {docx_path}")
-    
-    # STEP 7: Send email
-    print("\n📧 STEP 7: Send Email")
-    recipient = os.getenv('RECIPIENT_EMAIL', 'web@logos.edu')
-    print("[EMAIL] Sending FINAL recommendation email")
-    
-    email_sender.send_email_with_attachment(
-        recipient=recipient,
-        student_data=student_data,
-        classification=classification,
-        docx_path=docx_path,
-        email_type="final"
-    )
-    print("✓ Email sent successfully")
-    
-    print("\n" + "="*60)
-    print("✅ SUCCESS - Processing complete")
-    print("="*60 + "\n")
-    
-    return jsonify({
+    return {
         "status": "success",
         "form_detected": form_type,
         "applicant": student_data.get('applicant_name'),
@@ -269,70 +404,323 @@ def process_webhook(raw_data, form_type, form_config_module):
         "all_forms_complete": all_forms_complete,
         "classification_status": classification_status,
         "report_generated": True,
-        "email_sent": True
-    })
+        "email_sent": True,
+        "stage_timings": stage_timings
+    }, 200
+
+def defer_classification(student_data, form_type, lead_id, all_forms_complete, new_form_count, send_emails, retry_after,
+                         reason="Classification capacity full"):
+    """
+    The classification gate is full (or Gemini is unavailable): queue STEPS 4-7
+    as a delayed classify job (STEPS 1-3 already ran, so the webhook itself must
+    not be retried).
+    """
+    job_id = jobs.enqueue("classify", {
+        "student_data": student_data,
+        "form_type": form_type,
+        "lead_id": lead_id,
+        "all_forms_complete": all_forms_complete,
+        "form_count": new_form_count,
+        "send_emails": send_emails
+    }, delay=retry_after)
+    metrics.DEFERRED_TOTAL.inc(form_type=form_type)
+    log.warning(f"⏸️ {reason} - deferred {retry_after}s", lead_id=lead_id, classify_job_id=job_id)
+    return {
+        "status": "deferred",
+        "form_detected": form_type,
+        "salesforce_lead_id": lead_id,
+        "classify_job_id": job_id,
+        "retry_after": retry_after
+    }, 202
+
+class StageError(Exception):
+    """A pipeline side effect failed; the job is retried from its last checkpoint"""
+
+def require(value, message):
+    """Raise StageError if a client call reported failure by returning None"""
+    if value is None:
+        raise StageError(message)
+    return value
+
+def require_classified(classification, final_attempt=False):
+    """
+    The fallback classification means Gemini failed - retry rather than store it.
+    On the last attempt keep it: it is the rules' provisional result, flagged for manual review.
+    """
+    if classification.get('classification_type') == 'fallback':
+        if not final_attempt:
+            raise StageError("Gemini classification failed - got the fallback classification")
+        log.warning("⚠️ Gemini classification failed on the last attempt - keeping the rules' provisional result")
+    return classification
+
+def send_email(send_emails, **kwargs):
+    """Send through email_sender unless this is a dry run; a failed send raises StageError"""
+    if not send_emails:
+        log.info(f"Dry run - skipping {kwargs.get('email_type')} email", recipient=kwargs.get('recipient'))
+        return False
+    if not email_sender.send_email_with_attachment(**kwargs):
+        raise StageError(f"Could not send {kwargs.get('email_type')} email")
+    return True
+
+def log_field_analysis(raw_data):
+    """DETAILED FIELD ANALYSIS: log every field that looks like a file path or URL"""
+    file_fields = {}
+    for key, value in raw_data.items():
+        value_str = str(value)
+        key_lower = key.lower()
+        value_lower = value_str.lower()
+
+        # Check if value looks like a file path or URL
+        is_file_related = (
+            any(word in key_lower for word in ('file', 'upload', 'document', 'attach')) or
+            any(ext in value_lower for ext in ('.pdf', '.jpg', '.png', '.doc')) or
+            '/data/' in value_str or
+            value_str.startswith('http')
+        )
+
+        if is_file_related:
+            value_preview = value_str[:300] + "..." if len(value_str) > 300 else value_str
+            file_fields[key] = value_preview
+
+    field_log.emit(logging.DEBUG, "🔍 DETAILED FIELD ANALYSIS", fields=len(raw_data), file_fields=file_fields)
 
 def get_safe_data():
     """Helper to safely get JSON or Form data"""
     if request.is_json:
-        print("📨 WEBHOOK RECEIVED (JSON format)")
+        log.debug("📨 Webhook payload (JSON format)")
         return request.get_json()
     else:
-        print("📨 WEBHOOK RECEIVED (Form data format)")
+        log.debug("📨 Webhook payload (Form data format)")
         return request.form.to_dict()
 
+# Route slug -> form type (also used by the backfill CLI)
+FORM_SLUGS = {
+    "estados-unidos": "Solicitud Oficial de Admisión Estados Unidos y el Mundo",
+    "latinoamerica": "Solicitud Oficial de Admisión Latinoamérica",
+    "experiencia": "Formulario de Experiencia Ministerial",
+    "recomendacion": "Formulario de Recomendación Pastoral",
+}
+
+# Guidance returned by the old single /webhook/machform endpoint
+DEPRECATED_WEBHOOK_BODY = {
+  "error": "Please use form-specific endpoints",
+  "endpoints": {
+    "estados_unidos": "/webhook/estados-unidos",
+    "latinoamerica": "/webhook/latinoamerica",
+    "experiencia": "/webhook/experiencia",
+    "recomendacion": "/webhook/recomendacion",
+    "batch": "/webhook/batch"
+  }
+}
+
+# Form type -> extraction module for each webhook
+FORM_MODULES = {
+    "Solicitud Oficial de Admisión Estados Unidos y el Mundo": estados_unidos,
+    "Solicitud Oficial de Admisión Latinoamérica": latinoamerica,
+    "Formulario de Experiencia Ministerial": experiencia_ministerial,
+    "Formulario de Recomendación Pastoral": recomendacion_pastoral,
+}
+
+def run_webhook_job(job):
+    """Job handler: run the pipeline for a persisted webhook payload"""
+    payload = job['payload']
+    form_type = payload['form_type']
+    body, status_code = process_webhook(
+        raw_data=payload['raw_data'],
+        form_type=form_type,
+        form_config_module=FORM_MODULES[form_type],
+        job_id=job['id']
+    )
+    if status_code >= 400:
+        # Bad payloads fail the same way every time - dead-letter without retrying
+        raise job_queue.PermanentError(body.get('message', f"Pipeline returned {status_code}"))
+    return body
+
+def run_classify_job(job):
+    """Job handler: STEPS 4-7 for an application completed outside process_webhook (batch import, deferral)"""
+    payload = job['payload']
+    with metrics.pipeline(payload['form_type']) as run:
+        body, _ = run_classification(
+            student_data=payload['student_data'],
+            form_type=payload['form_type'],
+            lead_id=payload['lead_id'],
+            all_forms_complete=payload.get('all_forms_complete', True),
+            new_form_count=payload['form_count'],
+            job_id=job['id'],
+            send_emails=payload.get('send_emails', True)
+        )
+        run['outcome'] = body.get('status', 'ok')
+    return body
+
+def run_prefetch_job(job):
+    """Job handler: download an applicant's uploads ahead of the final classification"""
+    return document_prefetch.prefetch(job['payload']['email'])
+
+def enqueue_webhook(form_type):
+    """
+    Validate the incoming payload, persist it and return 202 with the job id.
+    Redeliveries of the same entry replay the original response instead of
+    queueing the pipeline again.
+    """
+    raw_data = get_safe_data()
+    if not raw_data:
+        return jsonify({"status": "error", "message": "No data received"}), 400
+
+    def accept():
+        # Not stored by the idempotency store (status >= 400), so the retry is processed
+        if admission.backlog_full(jobs.pending_count()):
+            return shed_load(request.endpoint)
+        job_id = jobs.enqueue("webhook", {"form_type": form_type, "raw_data": raw_data})
+        return {
+            "status": "accepted",
+            "job_id": job_id,
+            "form_detected": form_type,
+            "status_url": f"/jobs/{job_id}"
+        }, 202
+
+    key = idempotency.make_key(form_type, raw_data)
+    body, status_code, replayed = idempotency_store.remember(key, accept)
+    if replayed:
+        log.info("♻️ Duplicate delivery - replaying response", job_id=body.get('job_id'))
+    response = jsonify(body)
+    response.headers['Idempotent-Replayed'] = 'true' if replayed else 'false'
+    if status_code == 503:
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response, status_code
+
+def shed_load(endpoint):
+    """503 body for intake while the job backlog is over ADMISSION_MAX_BACKLOG"""
+    metrics.REJECTED_TOTAL.inc(endpoint=endpoint)
+    log.warning("🚦 Job backlog full - rejecting intake", endpoint=endpoint)
+    return {
+        "status": "error",
+        "message": "Service is at capacity - retry later",
+        "retry_after": admission.RETRY_AFTER
+    }, 503
+
 # --- SPECIFIC ROUTES ---
 
 @app.route('/webhook/estados-unidos', methods=['POST'])
 def webhook_estados_unidos():
-    raw_data = get_safe_data()
-    return process_webhook(
-        raw_data=raw_data,
-        form_type="Solicitud Oficial de Admisión Estados Unidos y el Mundo",
-        form_config_module=estados_unidos
-    )
+    return enqueue_webhook("Solicitud Oficial de Admisión Estados Unidos y el Mundo")
 
 @app.route('/webhook/latinoamerica', methods=['POST'])
 def webhook_latinoamerica():
-    raw_data = get_safe_data()
-    return process_webhook(
-        raw_data=raw_data,
-        form_type="Solicitud Oficial de Admisión Latinoamérica",
-        form_config_module=latinoamerica
-    )
+    return enqueue_webhook("Solicitud Oficial de Admisión Latinoamérica")
 
 @app.route('/webhook/experiencia', methods=['POST'])
 def webhook_experiencia():
-    raw_data = get_safe_data()
-    return process_webhook(
-        raw_data=raw_data,
-        form_type="Formulario de Experiencia Ministerial",
-        form_config_module=experiencia_ministerial
-    )
+    return enqueue_webhook("Formulario de Experiencia Ministerial")
 
 @app.route('/webhook/recomendacion', methods=['POST'])
 def webhook_recomendacion():
-    raw_data = get_safe_data()
-    return process_webhook(
-        raw_data=raw_data,
-        form_type="Formulario de Recomendación Pastoral",
-        form_config_module=recomendacion_pastoral
-    )
+    return enqueue_webhook("Formulario de Recomendación Pastoral")
+
+@app.route('/webhook/batch', methods=['POST'])
+def webhook_batch():
+    """
+    Bulk import / MachForm replay.
+    Body: [{"form_type": ..., "payload": {...}}, ...] (or {"items": [...]}).
+    Salesforce work is grouped per applicant; completed applications are
+    queued for classification. Returns per-item outcomes.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "message": "Expected a non-empty array of {form_type, payload}"}), 400
+    if len(items) > batch_ingest.MAX_BATCH_ITEMS:
+        return jsonify({"status": "error", "message": f"At most {batch_ingest.MAX_BATCH_ITEMS} items per batch"}), 413
+    if admission.backlog_full(jobs.pending_count(), incoming=len(items)):
+        body, status_code = shed_load(request.endpoint)
+        return jsonify(body), status_code, {'Retry-After': str(body['retry_after'])}
+
+    def enqueue_classification(student_data, form_type, lead_id, form_count):
+        return jobs.enqueue("classify", {
+            "student_data": student_data,
+            "form_type": form_type,
+            "lead_id": lead_id,
+            "form_count": form_count
+        })
+
+    sf_client.ensure_connected()
+    result = batch_ingest.ingest_batch(items, sf_client, FORM_MODULES, on_complete=enqueue_classification)
+    return jsonify({"status": "completed", **result})
+
+# --- JOB STATUS ---
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report how far a queued webhook has progressed"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs', methods=['GET'])
+def job_counts():
+    """Queue depth per status"""
+    return jsonify(jobs.counts())
+
+@app.route('/jobs/dead-letters', methods=['GET'])
+def dead_letters():
+    """Jobs that exhausted their retries (or failed permanently), newest first"""
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(jobs.dead_letters(limit=limit))
+
+@app.route('/jobs/dead-letters/<job_id>/requeue', methods=['POST'])
+def requeue_dead_letter(job_id):
+    """Retry a dead job from its last checkpoint"""
+    if not jobs.requeue(job_id):
+        return jsonify({"error": "Dead job not found"}), 404
+    log.info("🔁 Dead job requeued", job_id=job_id)
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+# --- METRICS ---
+
+def collect_queue_depth():
+    for status, count in jobs.counts().items():
+        metrics.QUEUE_JOBS.set(count, status=status)
+    metrics.CLASSIFY_SLOTS_IN_USE.set(classification_gate.in_use())
+
+metrics.register_collector(collect_queue_depth)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (merged across gunicorn workers)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def warm_imports():
+    """
+    Import the heavy pipeline modules on a background thread after boot, so the
+    first classification doesn't pay for them either (WARM_IMPORTS=0 to skip)
+    """
+    if os.getenv('WARM_IMPORTS', '1') != '1':
+        return
+
+    def warm():
+        started = time.perf_counter()
+        import gemini_classifier, docx_generator  # noqa: F401
+        log.info("Heavy imports warmed", seconds=round(time.perf_counter() - started, 2))
+
+    threading.Thread(target=warm, name="warm-imports", daemon=True).start()
+
+# Start background workers for this process (CLI tools that import app opt out)
+worker_pool = job_queue.get_worker_pool()
+worker_pool.register("webhook", run_webhook_job)
+worker_pool.register("classify", run_classify_job)
+worker_pool.register("prefetch", run_prefetch_job)
+if os.getenv('JOB_WORKERS_AUTOSTART', '1') == '1':
+    sf_client.connect_in_background()
+    worker_pool.start()
+    metrics.start_flusher()
+    warm_imports()
 
 # --- DEPRECATED ROUTE ---
 
 @app.route('/webhook/machform', methods=['POST'])
 def webhook_deprecated():
-    return jsonify({
-      "error": "Please use form-specific endpoints",
-      "endpoints": {
-        "estados_unidos": "/webhook/estados-unidos",
-        "latinoamerica": "/webhook/latinoamerica",
-        "experiencia": "/webhook/experiencia",
-        "recomendacion": "/webhook/recomendacion"
-      }
-    }), 400
+    return jsonify(DEPRECATED_WEBHOOK_BODY), 400
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
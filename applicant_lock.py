@@ -0,0 +1,96 @@
+"""
+Applicant Lock - Per-applicant mutual exclusion across gunicorn workers
+Serializes every webhook for the same (normalized) email while webhooks for
+different applicants run fully in parallel. Uses flock() on one small file per
+applicant, so it works across threads and processes on the same host.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+import structured_log
+
+log = structured_log.get_logger('lock')
+
+LOCK_DIR = os.getenv('APPLICANT_LOCK_DIR', '/tmp/admissions_locks')
+LOCK_TIMEOUT = float(os.getenv('APPLICANT_LOCK_TIMEOUT', '60'))
+POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    """Raised when an applicant lock could not be acquired in time"""
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form used for Lead lookups and lock keys"""
+    return email.strip().lower() if email else ''
+
+
+def _lock_path(email: str, scope: str = '') -> Path:
+    key = hashlib.sha256(normalize_email(email).encode('utf-8')).hexdigest()[:32]
+    return Path(LOCK_DIR) / f"{key}{'.' + scope if scope else ''}.lock"
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+@contextmanager
+def applicant_lock(email: str, timeout: float = LOCK_TIMEOUT, scope: str = ''):
+    """
+    Hold an exclusive lock for this applicant for the duration of the block.
+    Raises LockTimeout if another request keeps it longer than timeout seconds.
+    A scope names a separate lock for the same applicant (e.g. 'documents').
+    """
+    path = _lock_path(email, scope)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Each acquisition opens its own file description so flock() also
+    # excludes other threads of this process, not just other processes
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    started = time.monotonic()
+    try:
+        while not _try_lock(fd):
+            if time.monotonic() - started > timeout:
+                raise LockTimeout(f"Timed out waiting for applicant lock ({timeout}s)")
+            time.sleep(POLL_INTERVAL)
+
+        waited = time.monotonic() - started
+        if waited > 0.1:
+            log.info(f"Waited {waited:.2f}s for applicant lock")
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@asynccontextmanager
+async def applicant_lock_async(email: str, timeout: float = LOCK_TIMEOUT, scope: str = ''):
+    """Same lock as applicant_lock, but waits without blocking the event loop"""
+    path = _lock_path(email, scope)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    started = time.monotonic()
+    try:
+        while not _try_lock(fd):
+            if time.monotonic() - started > timeout:
+                raise LockTimeout(f"Timed out waiting for applicant lock ({timeout}s)")
+            await asyncio.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -10,6 +10,10 @@ from typing import Dict, List, Optional, Set
 from dataclasses import dataclass, asdict
 from enum import Enum
 
+import structured_log
+
+log = structured_log.get_logger('tracker')
+
 
 class ApplicationStatus(Enum):
     """Application status states"""
@@ -87,12 +91,12 @@ class ApplicationTracker:
                         email: ApplicantApplication.from_dict(app_data)
                         for email, app_data in data.items()
                     }
-                print(f"[TRACKER] Loaded {len(self.applications)} applications")
+                log.info(f"Loaded {len(self.applications)} applications")
             except Exception as e:
-                print(f"[TRACKER] Error loading: {e}")
+                log.error(f"Error loading: {e}")
                 self.applications = {}
         else:
-            print(f"[TRACKER] No existing tracking file, starting fresh")
+            log.info("No existing tracking file, starting fresh")
     
     def save(self):
         """Save applications to file"""
@@ -103,9 +107,9 @@ class ApplicationTracker:
             }
             with open(self.storage_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
-            print(f"[TRACKER] Saved {len(self.applications)} applications")
+            log.debug(f"Saved {len(self.applications)} applications")
         except Exception as e:
-            print(f"[TRACKER] Error saving: {e}")
+            log.error(f"Error saving: {e}")
     
     def get_or_create_application(self, email: str, name: str) -> ApplicantApplication:
         """Get existing application or create new one"""
@@ -128,7 +132,7 @@ class ApplicationTracker:
                 required_forms=required_forms,
                 classification_results=None
             )
-            print(f"[TRACKER] Created new application for {name} ({email})")
+            log.info(f"Created new application for {name} ({email})")
         
         return self.applications[email]
     
@@ -178,8 +182,8 @@ class ApplicationTracker:
         # Save
         self.save()
         
-        print(f"[TRACKER] Recorded {form_config.form_name} for {name}")
-        print(f"[TRACKER] Status: {app.status} | Forms: {len(app.forms_submitted)}/{len(app.required_forms)}")
+        log.info(f"Recorded {form_config.form_name} for {name}")
+        log.info(f"Status: {app.status} | Forms: {len(app.forms_submitted)}/{len(app.required_forms)}")
         
         return app
     
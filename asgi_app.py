@@ -0,0 +1,606 @@
+"""
+ASGI Webhook Service - asyncio variant of app.py
+Same routes (/webhook/*, /jobs/*, /api/*, /health) on one event loop: every
+outbound call is async and independent I/O runs concurrently, so one process
+holds dozens of in-flight classifications instead of one per thread.
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+The Flask app (app.py under gunicorn) remains the sync option.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match, Route
+
+# Jobs are run by the async workers below, not app.py's worker threads
+os.environ.setdefault('JOB_WORKERS_AUTOSTART', '0')
+
+import admission
+import api_routes
+import applicant_lock
+import async_clients
+import batch_ingest
+import idempotency
+import classification_cache
+import classification_events
+import document_prefetch
+import gemini_guard
+import job_queue
+import metrics
+import structured_log
+
+from app import (DEPRECATED_WEBHOOK_BODY, FORM_MODULES, FORM_SLUGS, StageError, defer_classification,
+                 require, require_classified, shed_load, warm_imports)
+
+log = structured_log.get_logger('asgi')
+
+load_dotenv()
+
+# In-flight pipeline runs per process
+ASYNC_JOB_CONCURRENCY = int(os.getenv('ASYNC_JOB_CONCURRENCY', '32'))
+
+sf = async_clients.AsyncSalesforceClient()
+mf = async_clients.AsyncMachFormClient()
+jobs = job_queue.get_queue()
+idempotency_store = idempotency.get_store()
+result_cache = classification_cache.get_cache()
+classification_gate = admission.get_classification_gate()
+http = None
+_worker_tasks = []
+
+
+async def required(coroutine, message):
+    """Await a client call and raise StageError if it returned None"""
+    return require(await coroutine, message)
+
+
+async def send_email(send_emails=True, **kwargs):
+    """Send through Resend unless this is a dry run; a failed send raises StageError so the job is retried"""
+    if not send_emails:
+        log.info(f"Dry run - skipping {kwargs.get('email_type')} email", recipient=kwargs.get('recipient'))
+        return False
+    if not await async_clients.send_email_async(http, **kwargs):
+        raise StageError(f"Could not send {kwargs.get('email_type')} email")
+    return True
+
+
+async def process_webhook_async(raw_data, form_type, form_config_module, job_id=None):
+    """Async counterpart of app.process_webhook. Returns (response_body, status_code)."""
+    stages = metrics.StageTimer(form_type)
+    with metrics.pipeline(form_type) as run:
+        try:
+            body, status_code = await _process_webhook_async(raw_data, form_type, form_config_module, job_id, stages)
+        except Exception:
+            stages.finish('error')
+            raise
+        stages.finish('error' if status_code >= 400 else 'ok')
+        run['outcome'] = body.get('status', 'ok')
+    return body, status_code
+
+
+async def _process_webhook_async(raw_data, form_type, form_config_module, job_id, stages):
+    async def report_stage(stage):
+        stages.enter(stage)
+        if job_id:
+            await asyncio.to_thread(jobs.update_stage, job_id, stage)
+
+    ledger = await asyncio.to_thread(job_queue.StageLedger, jobs, job_id)
+
+    # STEP 1: Extract Data using the specific module
+    await report_stage("extract")
+    try:
+        student_data = form_config_module.extract_student_data(raw_data)
+        student_data['form_name'] = form_type
+    except Exception as e:
+        log.error(f"❌ Error extracting data: {e}", form_type=form_type)
+        return {"status": "error", "message": str(e)}, 400
+
+    # STEP 2: Store in Salesforce
+    await report_stage("salesforce")
+    lead_id = None
+    all_forms_complete = False
+    new_form_count = 0
+    submitted_types = set()
+
+    if not sf.connected:
+        # The login may have failed at startup; a retried job tries again
+        await sf.connect()
+
+    if sf.connected:
+        email = student_data.get('email', 'unknown@example.com')
+        async with applicant_lock.applicant_lock_async(email):
+            lead_id = await ledger.run_async("lead", lambda: required(sf.find_or_create_lead(
+                email,
+                student_data.get('applicant_first_name', 'Unknown'),
+                student_data.get('applicant_last_name', 'Unknown')
+            ), "Could not create/find Lead in Salesforce"))
+
+            # A retry must not mistake the Form_Submission it already created for a duplicate
+            if not ledger.done("form_submission"):
+                if await sf.check_duplicate_form_type(lead_id, form_type):
+                    log.warning("⚠️ DUPLICATE SUBMISSION: form type already exists for this Lead",
+                                form_type=form_type, lead_id=lead_id)
+                    if student_data.get('email'):
+                        await ledger.run_async("duplicate_warning_email", lambda: send_email(
+                            recipient=student_data.get('email'),
+                            student_data=student_data, email_type="duplicate_warning"
+                        ))
+                    return {
+                        "status": "warning",
+                        "message": "Duplicate form submission detected - warning email sent",
+                        "form_detected": form_type
+                    }, 200
+
+                await ledger.run_async("form_submission", lambda: required(
+                    sf.create_form_submission(lead_id, form_type, json.dumps(raw_data, ensure_ascii=False)),
+                    "Could not create Form_Submission"
+                ))
+
+            submitted_types = set(require(await sf.get_submitted_form_types(lead_id),
+                                          "Could not read submitted form types")) | {form_type}
+            new_form_count = len(submitted_types)
+            all_forms_complete = await ledger.run_async("lead_form_count", lambda: required(
+                sf.update_lead_form_count(lead_id), "Could not update Lead form count"
+            ))
+            log.info("💾 STEP 2: Salesforce records created/updated", lead_id=lead_id,
+                     form_count=f"{new_form_count - 1} -> {new_form_count}")
+    else:
+        log.warning("⚠️ Salesforce not connected - skipping")
+
+    # STEP 3: Logic Gates (Email & Classification)
+    if new_form_count < 3 and sf.connected:
+        await report_stage("acknowledgment_email")
+        missing_forms = []
+        if not any("Solicitud" in t for t in submitted_types):
+            missing_forms.append("Solicitud Oficial de Admisión")
+        if not any("Experiencia" in t for t in submitted_types):
+            missing_forms.append("Experiencia Ministerial")
+        if not any("Recomendación" in t for t in submitted_types):
+            missing_forms.append("Recomendación Pastoral")
+
+        # Download uploaded documents in the background so the final classification finds them on disk
+        if document_prefetch.ENABLED and student_data.get('email'):
+            await ledger.run_async("document_prefetch", lambda: asyncio.to_thread(
+                jobs.enqueue, "prefetch", {"email": student_data['email']}
+            ))
+
+        await ledger.run_async("acknowledgment_email", lambda: send_email(
+            recipient=student_data.get('email'), student_data=student_data,
+            email_type="acknowledgment", missing_forms=missing_forms, form_count=new_form_count
+        ))
+        return {
+            "status": "success",
+            "message": "Form received, acknowledgment sent",
+            "progress": f"{new_form_count}/3"
+        }, 200
+
+    if sf.connected and new_form_count > 3:
+        log.info(f"⚠️ Extra form submitted ({new_form_count}/3). Skipping re-classification.", lead_id=lead_id)
+        return {"status": "success", "message": "Extra form received"}, 200
+
+    stages.finish()
+    return await run_classification_async(student_data, form_type, lead_id, all_forms_complete,
+                                          new_form_count, report_stage, ledger)
+
+
+async def run_classification_async(student_data, form_type, lead_id, all_forms_complete, new_form_count,
+                                   report_stage, ledger, send_emails=True):
+    """STEPS 4-7 behind the classification gate; deferred as a classify job when it is full"""
+    try:
+        async with classification_gate.slot_async():
+            return await _classify_and_report(student_data, form_type, lead_id, all_forms_complete,
+                                              new_form_count, report_stage, ledger, send_emails)
+    except admission.GateFull as e:
+        return await asyncio.to_thread(defer_classification, student_data, form_type, lead_id,
+                                       all_forms_complete, new_form_count, send_emails, e.retry_after)
+    except gemini_guard.GeminiUnavailable as e:
+        return await asyncio.to_thread(defer_classification, student_data, form_type, lead_id,
+                                       all_forms_complete, new_form_count, send_emails, e.retry_after, str(e))
+
+
+async def _classify_and_report(student_data, form_type, lead_id, all_forms_complete, new_form_count,
+                               report_stage, ledger, send_emails=True):
+    """STEPS 4-7 with independent I/O gathered concurrently (same graph as app.run_classification)"""
+    classification_status = 'Final' if new_form_count >= 3 else 'Preliminary'
+    use_comprehensive = bool(all_forms_complete and sf.connected and lead_id)
+    timings = {}
+    started = time.perf_counter()
+
+    async def timed(name, coroutine):
+        t0 = time.perf_counter()
+        await report_stage(name)
+        try:
+            with metrics.stage(form_type, name):
+                return await coroutine
+        finally:
+            timings[name] = {'start': round(t0 - started, 3), 'duration': round(time.perf_counter() - t0, 3)}
+
+    async def no_submissions():
+        return None
+
+    # Submissions and documents are independent
+    all_submissions, documents = await asyncio.gather(
+        timed("submissions", sf.get_all_form_submissions(lead_id) if use_comprehensive else no_submissions()),
+        timed("documents", mf.fetch_uploaded_documents(student_data.get('email')))
+    )
+
+    classification_input = student_data
+    if use_comprehensive:
+        classification_input = student_data.copy()
+        classification_input['all_submissions'] = all_submissions
+        classification_input['total_forms'] = len(all_submissions)
+    progress = classification_events.publisher(lead_id)
+
+    async def classify():
+        import gemini_classifier
+        return require_classified(await gemini_classifier.classify_student_async(classification_input, documents,
+                                                                                 progress),
+                                  ledger.final_attempt)
+
+    try:
+        classification = await timed("classification", ledger.run_async("classification", classify))
+    except Exception as e:
+        if progress:
+            await asyncio.to_thread(progress, 'failed', {'error': str(e)})
+        raise
+    if progress:
+        await asyncio.to_thread(progress, 'complete', {'classification': classification,
+                                                       'status': classification_status})
+
+    async def store():
+        if sf.connected and lead_id:
+            return await ledger.run_async("store_classification", lambda: required(
+                sf.create_classification(lead_id, classification, status=classification_status),
+                "Could not store Classification"
+            ))
+
+    async def report_and_email():
+        import docx_generator
+        # DOCX rendering is CPU work - keep it off the event loop
+        docx_path = await timed("report", asyncio.to_thread(
+            docx_generator.generate_report, student_data=student_data, classification=classification
+        ))
+        return await timed("final_email", ledger.run_async("final_email", lambda: send_email(
+            send_emails, recipient=os.getenv('RECIPIENT_EMAIL', 'web@logos.edu'), student_data=student_data,
+            classification=classification, docx_path=docx_path, email_type="final"
+        )))
+
+    await asyncio.gather(timed("store_classification", store()), report_and_email())
+    timings['_total'] = {'duration': round(time.perf_counter() - started, 3)}
+
+    return {
+        "status": "success",
+        "form_detected": form_type,
+        "applicant": student_data.get('applicant_name'),
+        "email": student_data.get('email'),
+        "salesforce_lead_id": lead_id,
+        "all_forms_complete": all_forms_complete,
+        "classification_status": classification_status,
+        "report_generated": True,
+        "email_sent": True,
+        "stage_timings": timings
+    }, 200
+
+
+# --- BACKGROUND JOB WORKERS ---
+
+async def run_job(job):
+    payload = job['payload']
+    if job['kind'] == 'webhook':
+        form_type = payload['form_type']
+        body, status_code = await process_webhook_async(
+            payload['raw_data'], form_type, FORM_MODULES[form_type], job_id=job['id']
+        )
+        if status_code >= 400:
+            raise job_queue.PermanentError(body.get('message', f"Pipeline returned {status_code}"))
+        return body
+    if job['kind'] == 'classify':
+        async def report_stage(stage):
+            await asyncio.to_thread(jobs.update_stage, job['id'], stage)
+        ledger = await asyncio.to_thread(job_queue.StageLedger, jobs, job['id'])
+        with metrics.pipeline(payload['form_type']) as run:
+            body, _ = await run_classification_async(
+                payload['student_data'], payload['form_type'], payload['lead_id'],
+                payload.get('all_forms_complete', True), payload['form_count'], report_stage, ledger,
+                send_emails=payload.get('send_emails', True)
+            )
+            run['outcome'] = body.get('status', 'ok')
+        return body
+    if job['kind'] == 'prefetch':
+        return await document_prefetch.prefetch_async(mf, payload['email'])
+    raise job_queue.PermanentError(f"No handler registered for job kind '{job['kind']}'")
+
+
+async def job_claimer(ready: asyncio.Queue, idle: asyncio.Semaphore):
+    """
+    The process's only claimer: takes a job whenever a worker is idle and waits
+    on the queue's wakeup (as WorkerPool does) instead of every worker polling.
+    """
+    name = f"async-worker-{os.getpid()}"
+    while True:
+        await idle.acquire()
+        job = None
+        while not job:
+            try:
+                job = await asyncio.to_thread(jobs.claim, name)
+            except Exception as e:
+                log.error(f"Error claiming job: {e}")
+            if not job:
+                await asyncio.to_thread(jobs.wait_for_work, job_queue.POLL_INTERVAL)
+        await ready.put(job)
+
+
+async def job_worker(ready: asyncio.Queue, idle: asyncio.Semaphore):
+    while True:
+        job = await ready.get()
+        try:
+            with metrics.WORKERS_BUSY.track():
+                result = await run_job(job)
+            await asyncio.to_thread(jobs.complete, job['id'], result or {})
+        except Exception as e:
+            log.exception(f"❌ Job {job['id']} failed: {e}", job_id=job['id'], kind=job['kind'])
+            await asyncio.to_thread(jobs.retry_or_bury, job, str(e), isinstance(e, job_queue.PermanentError))
+        finally:
+            idle.release()
+
+
+async def startup():
+    global http
+    http = httpx.AsyncClient(timeout=async_clients.HTTP_TIMEOUT)
+    # Connect in the background so the server accepts requests immediately
+    asyncio.get_running_loop().create_task(sf.connect())
+    ready, idle = asyncio.Queue(), asyncio.Semaphore(ASYNC_JOB_CONCURRENCY)
+    _worker_tasks.append(asyncio.get_running_loop().create_task(job_claimer(ready, idle)))
+    for _ in range(ASYNC_JOB_CONCURRENCY):
+        _worker_tasks.append(asyncio.get_running_loop().create_task(job_worker(ready, idle)))
+    metrics.WORKERS_TOTAL.inc(ASYNC_JOB_CONCURRENCY)
+    metrics.start_flusher()
+    warm_imports()
+    log.info(f"Started {ASYNC_JOB_CONCURRENCY} async job workers")
+
+
+async def shutdown():
+    for task in _worker_tasks:
+        task.cancel()
+    await http.aclose()
+    await mf.http.aclose()
+
+
+# --- ROUTES ---
+
+async def home(request: Request):
+    return PlainTextResponse("LOGOS UCL - Multi-Form Admissions System (v2.0, async)")
+
+
+async def health(request: Request):
+    counts, idem, cache, gemini = await asyncio.gather(
+        asyncio.to_thread(jobs.counts), asyncio.to_thread(idempotency_store.stats),
+        asyncio.to_thread(result_cache.stats) if result_cache else asyncio.sleep(0),
+        asyncio.to_thread(gemini_guard.get_guard().status)
+    )
+    return JSONResponse({
+        "status": "healthy",
+        "salesforce": "connected" if sf.connected else "disconnected",
+        "jobs": counts,
+        "idempotency": idem,
+        "classification_cache": cache,
+        "gemini": gemini
+    })
+
+
+async def ready(request: Request):
+    """Readiness probe: 503 until the background Salesforce login has succeeded"""
+    body = {"ready": sf.connected, "salesforce": "connected" if sf.connected else "disconnected"}
+    return JSONResponse(body, status_code=200 if sf.connected else 503)
+
+
+async def webhook(request: Request):
+    slug = request.path_params['slug']
+    if slug == 'machform':
+        return JSONResponse(DEPRECATED_WEBHOOK_BODY, status_code=400)
+    if slug not in FORM_SLUGS:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    form_type = FORM_SLUGS[slug]
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            raw_data = await request.json()
+        except ValueError:
+            return JSONResponse({"status": "error", "message": "Malformed JSON body"}, status_code=400)
+    else:
+        raw_data = dict(await request.form())
+    if not raw_data:
+        return JSONResponse({"status": "error", "message": "No data received"}, status_code=400)
+
+    def accept():
+        if admission.backlog_full(jobs.pending_count()):
+            return shed_load(request.url.path)
+        job_id = jobs.enqueue("webhook", {"form_type": form_type, "raw_data": raw_data})
+        return {"status": "accepted", "job_id": job_id, "form_detected": form_type,
+                "status_url": f"/jobs/{job_id}"}, 202
+
+    key = idempotency.make_key(form_type, raw_data)
+    body, status_code, replayed = await asyncio.to_thread(idempotency_store.remember, key, accept)
+    headers = {'Idempotent-Replayed': 'true' if replayed else 'false'}
+    if status_code == 503:
+        headers['Retry-After'] = str(body['retry_after'])
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+async def webhook_batch(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        # Same response as an empty body (Flask reads it with silent=True)
+        data = None
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return JSONResponse({"status": "error", "message": "Expected a non-empty array of {form_type, payload}"}, status_code=400)
+    if len(items) > batch_ingest.MAX_BATCH_ITEMS:
+        return JSONResponse({"status": "error", "message": f"At most {batch_ingest.MAX_BATCH_ITEMS} items per batch"}, status_code=413)
+    if admission.backlog_full(await asyncio.to_thread(jobs.pending_count), incoming=len(items)):
+        body, status_code = shed_load(request.url.path)
+        return JSONResponse(body, status_code=status_code, headers={'Retry-After': str(body['retry_after'])})
+
+    def enqueue_classification(student_data, form_type, lead_id, form_count):
+        return jobs.enqueue("classify", {"student_data": student_data, "form_type": form_type,
+                                         "lead_id": lead_id, "form_count": form_count})
+
+    # Bulk path is a handful of collection calls; run the sync implementation off-loop
+    result = await asyncio.to_thread(batch_ingest.ingest_batch, items, sf.sync, FORM_MODULES,
+                                     enqueue_classification)
+    return JSONResponse({"status": "completed", **result})
+
+
+async def job_status(request: Request):
+    job = await asyncio.to_thread(jobs.get, request.path_params['job_id'])
+    if not job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job)
+
+
+async def job_counts(request: Request):
+    return JSONResponse(await asyncio.to_thread(jobs.counts))
+
+
+async def dead_letters(request: Request):
+    limit = int(request.query_params.get('limit', 100))
+    return JSONResponse(await asyncio.to_thread(jobs.dead_letters, limit))
+
+
+async def requeue_dead_letter(request: Request):
+    job_id = request.path_params['job_id']
+    if not await asyncio.to_thread(jobs.requeue, job_id):
+        return JSONResponse({"error": "Dead job not found"}, status_code=404)
+    log.info("🔁 Dead job requeued", job_id=job_id)
+    return JSONResponse({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+
+def collect_queue_depth():
+    for status, count in jobs.counts().items():
+        metrics.QUEUE_JOBS.set(count, status=status)
+    metrics.CLASSIFY_SLOTS_IN_USE.set(classification_gate.in_use())
+
+metrics.register_collector(collect_queue_depth)
+
+
+async def metrics_endpoint(request: Request):
+    body = await asyncio.to_thread(metrics.render)
+    return PlainTextResponse(body, media_type='text/plain; version=0.0.4')
+
+
+async def api_stats(request: Request):
+    try:
+        queries = api_routes.stats_queries()
+        results = await asyncio.gather(*(sf.query(soql) for soql in queries.values()))
+        return JSONResponse(api_routes.build_stats(dict(zip(queries, results))))
+    except Exception as e:
+        log.error(f"Error getting stats: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def api_applicants(request: Request):
+    try:
+        args = request.query_params
+        page = int(args.get('page', 1))
+        limit = int(args.get('limit', 20))
+        count_query, query = api_routes.applicants_queries(args.get('search', ''), page, limit)
+        _, results = await asyncio.gather(sf.query(count_query), sf.query(query))
+
+        lead_ids = [r['Id'] for r in results['records']]
+        class_records = []
+        if lead_ids:
+            class_records = (await sf.query(api_routes.classifications_query(lead_ids)))['records']
+
+        return JSONResponse(api_routes.build_applicants_page(
+            results['records'], class_records, args.get('status', 'all'), args.get('level', 'all'), page, limit
+        ))
+    except Exception as e:
+        log.error(f"Error getting applicants: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def api_applicant_detail(request: Request):
+    try:
+        lead_id = request.path_params['lead_id']
+        submissions_soql, classification_soql = api_routes.applicant_detail_queries(lead_id)
+        lead, submissions, classifications = await asyncio.gather(
+            sf.get('Lead', lead_id), sf.query(submissions_soql), sf.query(classification_soql)
+        )
+        return JSONResponse(api_routes.build_applicant_detail(lead, submissions['records'], classifications['records']))
+    except Exception as e:
+        log.error(f"Error getting applicant detail: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def api_classification_stream(request: Request):
+    """Server-Sent Events of a Lead's classification progress (see classification_events)"""
+    lead_id = request.path_params['lead_id']
+    after = classification_events.last_event_id(request.headers.get('last-event-id'))
+    return StreamingResponse(classification_events.stream_async(lead_id, after), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+routes = [
+    Route('/', home),
+    Route('/health', health),
+    Route('/ready', ready),
+    Route('/webhook/batch', webhook_batch, methods=['POST']),
+    Route('/webhook/{slug:str}', webhook, methods=['POST']),
+    Route('/metrics', metrics_endpoint),
+    Route('/jobs', job_counts),
+    Route('/jobs/dead-letters', dead_letters),
+    Route('/jobs/dead-letters/{job_id:str}/requeue', requeue_dead_letter, methods=['POST']),
+    Route('/jobs/{job_id:str}', job_status),
+    Route('/api/stats', api_stats),
+    Route('/api/applicants', api_applicants),
+    Route('/api/applicants/{lead_id:str}', api_applicant_detail),
+    Route('/api/applicants/{lead_id:str}/classification/stream', api_classification_stream),
+]
+
+
+class MetricsMiddleware:
+    """In-flight gauge plus latency/status per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        endpoint = next((route.path for route in routes if route.matches(scope)[0] == Match.FULL), 'unmatched')
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with metrics.HTTP_IN_FLIGHT.track():
+                await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.HTTP_SECONDS.observe(time.perf_counter() - started, method=scope['method'], endpoint=endpoint)
+            metrics.HTTP_TOTAL.inc(method=scope['method'], endpoint=endpoint, status=status['code'])
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
@@ -0,0 +1,373 @@
+"""
+Async Clients - Non-blocking Salesforce, MachForm and Resend access
+Used by asgi_app so one event loop can hold many in-flight applications.
+Record shapes, SOQL and HTML parsing are shared with the sync clients.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiomysql
+import httpx
+
+import email_sender
+import machform_client
+import metrics
+import structured_log
+from salesforce_client import (
+    SalesforceClient, lead_record, form_submission_record,
+    lead_count_update, classification_record, salesforce_operation
+)
+
+sf_log = structured_log.get_logger('salesforce')
+mf_log = structured_log.get_logger('machform')
+email_log = structured_log.get_logger('email')
+
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+RESEND_URL = "https://api.resend.com/emails"
+
+
+class AsyncSalesforceClient:
+    """
+    Salesforce REST over httpx. Login reuses SalesforceClient (simple_salesforce)
+    once, off the event loop; every call after that is async.
+    """
+
+    def __init__(self):
+        self.sync = None
+        self.http = None
+        self.base_url = None
+        self.session_id = None
+        self._login_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.session_id is not None
+
+    async def connect(self):
+        async with self._login_lock:
+            return await self._login()
+
+    async def _login(self) -> bool:
+        """Log in (caller holds _login_lock). One httpx client for the process: a new
+        session only replaces its Authorization header, so in-flight requests are untouched."""
+        self.sync = await asyncio.to_thread(SalesforceClient)
+        if not self.sync.sf:
+            self.session_id = None
+            return False
+        self.base_url = self.sync.sf.base_url
+        self.session_id = self.sync.sf.session_id
+        if self.http is None:
+            self.http = httpx.AsyncClient(headers={'Content-Type': 'application/json'}, timeout=HTTP_TIMEOUT)
+        self.http.headers['Authorization'] = f"Bearer {self.session_id}"
+        sf_log.info("✓ Connected successfully")
+        return True
+
+    async def _relogin(self, expired_session: str) -> bool:
+        """Replace an expired session - unless a concurrent 401 already did"""
+        async with self._login_lock:
+            if self.session_id is not None and self.session_id != expired_session:
+                return True
+            return await self._login()
+
+    async def _request(self, method, path, **kwargs):
+        with metrics.external_call('salesforce', salesforce_operation(method, f"/{path}")):
+            session_id = self.session_id
+            response = await self.http.request(method, f"{self.base_url}{path}", **kwargs)
+            if response.status_code == 401 and await self._relogin(session_id):
+                # Session expired - retry once with the new one
+                response = await self.http.request(method, f"{self.base_url}{path}", **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else None
+
+    async def query(self, soql: str) -> Dict:
+        return await self._request('GET', 'query/', params={'q': soql})
+
+    async def create(self, sobject: str, record: Dict) -> Dict:
+        return await self._request('POST', f"sobjects/{sobject}/", json=record)
+
+    async def update(self, sobject: str, record_id: str, record: Dict):
+        return await self._request('PATCH', f"sobjects/{sobject}/{record_id}", json=record)
+
+    async def get(self, sobject: str, record_id: str) -> Dict:
+        return await self._request('GET', f"sobjects/{sobject}/{record_id}")
+
+    # --- Pipeline operations (same behaviour as SalesforceClient) ---
+
+    async def find_or_create_lead(self, email, first_name, last_name):
+        if not self.connected:
+            return None
+        clean_email = email.strip().lower() if email else email
+        try:
+            results = await self.query(
+                f"SELECT Id FROM Lead WHERE Email = '{clean_email}' ORDER BY CreatedDate DESC LIMIT 1"
+            )
+            if results['totalSize'] > 0:
+                lead_id = results['records'][0]['Id']
+                sf_log.info(f"Found existing Lead: {lead_id}")
+                return lead_id
+            result = await self.create('Lead', lead_record(clean_email, first_name, last_name))
+            sf_log.info(f"Created new Lead: {result['id']}")
+            return result['id']
+        except Exception as e:
+            sf_log.error(f"Error finding/creating Lead: {e}")
+            return None
+
+    async def check_duplicate_form_type(self, lead_id, form_type):
+        try:
+            result = await self.query(
+                f"SELECT Id FROM Form_Submission__c WHERE Lead__c = '{lead_id}' AND Form_Type__c = '{form_type}' LIMIT 1"
+            )
+            return result['totalSize'] > 0
+        except Exception as e:
+            sf_log.error(f"Error checking for duplicate: {e}")
+            return False
+
+    async def create_form_submission(self, lead_id, form_type, form_data_json):
+        try:
+            result = await self.create('Form_Submission__c', form_submission_record(lead_id, form_type, form_data_json))
+            return result['id']
+        except Exception as e:
+            sf_log.error(f"Error creating Form_Submission: {e}")
+            return None
+
+    async def get_submitted_form_types(self, lead_id) -> Optional[List[str]]:
+        try:
+            results = await self.query(f"SELECT Form_Type__c FROM Form_Submission__c WHERE Lead__c = '{lead_id}'")
+            return [r['Form_Type__c'] for r in results['records']]
+        except Exception as e:
+            sf_log.error(f"Error fetching submitted form types: {e}")
+            return None
+
+    async def update_lead_form_count(self, lead_id):
+        try:
+            result = await self.query(f"SELECT COUNT() FROM Form_Submission__c WHERE Lead__c = '{lead_id}'")
+            count = result['totalSize']
+            await self.update('Lead', lead_id, lead_count_update(count))
+            return count >= 3
+        except Exception as e:
+            sf_log.error(f"Error updating Lead: {e}")
+            return None
+
+    async def create_classification(self, lead_id, classification_data, status='Preliminary'):
+        try:
+            result = await self.create('Classification__c', classification_record(lead_id, classification_data, status))
+            sf_log.info(f"Created Classification ({status}): {result['id']}")
+            return result['id']
+        except Exception as e:
+            sf_log.error(f"Error creating Classification: {e}")
+            return None
+
+    async def get_all_form_submissions(self, lead_id):
+        try:
+            results = await self.query(f"""
+                SELECT Form_Type__c, Form_Data_JSON__c, Submission_Date__c
+                FROM Form_Submission__c
+                WHERE Lead__c = '{lead_id}'
+                ORDER BY Submission_Date__c ASC
+            """)
+            return results['records']
+        except Exception as e:
+            sf_log.error(f"Error fetching submissions: {e}")
+            return []
+
+
+class TimedAsyncCursor(aiomysql.DictCursor):
+    """DictCursor that records every statement's latency"""
+
+    async def execute(self, query, args=None):
+        with metrics.external_call('machform_db', 'query'):
+            return await super().execute(query, args)
+
+
+class AsyncMachFormClient:
+    """MachForm SQL over aiomysql and the admin site over httpx"""
+
+    def __init__(self):
+        self.pool = None
+        self.http = httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True)
+        self.authenticated = False
+        self._session = 0   # bumped by every successful login
+        self._pool_lock = asyncio.Lock()
+        self._login_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    host=os.getenv('MACHFORM_DB_HOST'),
+                    db=os.getenv('MACHFORM_DB_NAME'),
+                    user=os.getenv('MACHFORM_DB_USER'),
+                    password=os.getenv('MACHFORM_DB_PASSWORD'),
+                    cursorclass=TimedAsyncCursor,
+                    minsize=1,
+                    maxsize=int(os.getenv('MACHFORM_DB_POOL_SIZE', '5'))
+                )
+            return self.pool
+
+    async def _http(self, method, url, **kwargs):
+        with metrics.external_call('machform_http', machform_client.machform_operation(method, url)):
+            response = await self.http.request(method, url, **kwargs)
+            if response.status_code >= 400:
+                raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+            return response
+
+    async def get_files_by_email(self, email) -> List[Dict]:
+        """Find all uploaded files for an applicant by email across all active forms"""
+        all_files = []
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute("SELECT form_id, form_name FROM ap_forms WHERE form_active=1")
+                    forms = await cursor.fetchall()
+
+                    for form in forms:
+                        form_id = form['form_id']
+                        await cursor.execute(
+                            "SELECT element_id FROM ap_form_elements WHERE form_id = %s AND element_type = 'email' ORDER BY element_id ASC LIMIT 1",
+                            (form_id,)
+                        )
+                        email_field = await cursor.fetchone()
+                        if not email_field:
+                            continue
+
+                        email_col = f"element_{email_field['element_id']}"
+                        try:
+                            await cursor.execute(f"SELECT * FROM ap_form_{form_id} WHERE {email_col} = %s", (email,))
+                            for entry in await cursor.fetchall():
+                                all_files.extend(machform_client.extract_files_from_entry(entry, form_id))
+                        except Exception as table_err:
+                            mf_log.warning(f"Skipping form {form_id}: {table_err}")
+            return all_files
+        except Exception as e:
+            mf_log.error(f"Error searching by email: {e}")
+            return []
+
+    async def login(self) -> bool:
+        async with self._login_lock:
+            if self.authenticated:
+                return True
+            username = os.getenv('MACHFORM_ADMIN_USER')
+            password = os.getenv('MACHFORM_ADMIN_PASSWORD')
+            if not username or not password:
+                mf_log.warning("Admin credentials not found")
+                return False
+            try:
+                login_url = f"{machform_client.MACHFORM_BASE_URL}/index.php"
+                response = await self._http('GET', login_url)
+                csrf_token = machform_client.parse_csrf_token(response.text)
+                if not csrf_token:
+                    mf_log.warning("Could not find CSRF token")
+                    return False
+                response = await self._http('POST', login_url, data={
+                    'admin_username': username,
+                    'admin_password': password,
+                    'submit': '1',
+                    'csrf_token': csrf_token
+                })
+                self.authenticated = 'main_panel' in str(response.url) or 'manage_forms' in str(response.url)
+                if self.authenticated:
+                    self._session += 1
+                    mf_log.info("✓ Successfully authenticated!")
+                else:
+                    mf_log.error("Login failed - stayed on login page")
+                return self.authenticated
+            except Exception as e:
+                mf_log.error(f"Login error: {e}")
+                return False
+
+    async def _expire(self, session: int):
+        """Forget a session MachForm no longer accepts - unless another request already replaced it"""
+        async with self._login_lock:
+            if self._session == session:
+                self.authenticated = False
+
+    async def _admin_get(self, url, **kwargs) -> Optional[httpx.Response]:
+        """
+        GET an admin page (None if we can't log in). The client is shared by every
+        request, so an expired PHP session shows up as a redirect to the login page:
+        log in again and retry once.
+        """
+        for _ in range(2):
+            if not await self.login():
+                return None
+            session = self._session
+            response = await self._http('GET', url, **kwargs)
+            if not machform_client.is_login_page(response):
+                return response
+            mf_log.warning("MachForm session expired - logging in again")
+            await self._expire(session)
+        raise RuntimeError("MachForm still returns the login page after logging in again")
+
+    async def get_download_links_from_entry(self, form_id, entry_id) -> List[Dict]:
+        try:
+            response = await self._admin_get(
+                f"{machform_client.MACHFORM_BASE_URL}/view_entry.php",
+                params={'form_id': form_id, 'entry_id': entry_id}
+            )
+            if response is None:
+                return []
+            return machform_client.parse_download_links(response.text, form_id, entry_id)
+        except Exception as e:
+            mf_log.error(f"Error parsing entry: {e}")
+            return []
+
+    async def download_file_from_link(self, download_url, filename, save_dir='/tmp/machform_files') -> Optional[str]:
+        try:
+            response = await self._admin_get(download_url)
+            if response is None:
+                return None
+            Path(save_dir).mkdir(parents=True, exist_ok=True)
+            local_path = f"{save_dir}/{machform_client.safe_filename(filename)}"
+            await asyncio.to_thread(Path(local_path).write_bytes, response.content)
+            return local_path
+        except Exception as e:
+            mf_log.error(f"Download error: {e}")
+            return None
+
+    async def fetch_uploaded_documents(self, email) -> Dict:
+        """Async counterpart of gemini_classifier.fetch_uploaded_documents; downloads run concurrently"""
+        import document_prefetch
+        import document_prep
+        import gemini_classifier
+
+        documents = {}
+        if not email:
+            return documents
+
+        files, file_parts = await document_prefetch.collect_async(self, email)
+        if not files:
+            return documents
+
+        # token_budget trims these to fit
+        file_parts = file_parts[:gemini_classifier.MAX_DOCUMENTS]
+        if file_parts:
+            documents['uploaded_documents'] = await asyncio.to_thread(document_prep.prepare_all, file_parts)
+        documents['uploaded_files'] = files
+        return documents
+
+
+async def send_email_async(http: httpx.AsyncClient, **kwargs) -> bool:
+    """Async counterpart of email_sender.send_email_with_attachment (Resend REST API)"""
+    api_key = os.getenv('RESEND_API_KEY')
+    if not api_key:
+        email_log.warning("Missing Resend API key (RESEND_API_KEY) - skipping email")
+        return False
+
+    async def post(params):
+        with metrics.external_call('resend', 'send'):
+            return await http.post(RESEND_URL, json=params, headers={'Authorization': f"Bearer {api_key}"})
+
+    messages = email_sender.build_email_messages(**kwargs)
+    responses = await asyncio.gather(*(post(params) for params in messages), return_exceptions=True)
+
+    results = []
+    for params, response in zip(messages, responses):
+        ok = not isinstance(response, Exception) and response.status_code < 300
+        if not ok:
+            email_log.error(f"✗ Error sending to {params['to'][0]}: {response}")
+        results.append(ok)
+    return any(results)
@@ -0,0 +1,173 @@
+"""
+Backfill / Replay CLI - Re-run historical MachForm entries through the pipeline
+Reads entries straight from the MachForm ap_form_{id} tables and replays each
+one through app.process_webhook (same code path as a live webhook), with a
+bounded worker pool, per-service rate limits and a resumable checkpoint file.
+
+Usage:
+    python backfill.py --form 12=estados-unidos --form 14=experiencia \\
+        --workers 4 --rate salesforce=5 --rate gemini=0.5 --dry-run
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+# Importing app must not start the webhook job workers in this process
+os.environ.setdefault('JOB_WORKERS_AUTOSTART', '0')
+
+import rate_limit
+
+
+class Checkpoint:
+    """
+    Resumable progress per MachForm form id.
+    Stores a watermark (every id <= watermark is done) plus finished ids above
+    it, since the worker pool completes entries out of order. Failed ids stay
+    out of both, so a resumed run replays them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.forms: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.forms = json.load(f).get('forms', {})
+            failed = sum(len(state.get('failed', [])) for state in self.forms.values())
+            print(f"[BACKFILL] Resuming from checkpoint {path}"
+                  f"{f' ({failed} failed entries will be retried)' if failed else ''}")
+
+    def _state(self, form_id) -> Dict:
+        return self.forms.setdefault(str(form_id), {'watermark': 0, 'done': [], 'failed': []})
+
+    def watermark(self, form_id) -> int:
+        return self._state(form_id)['watermark']
+
+    def is_done(self, form_id, entry_id) -> bool:
+        state = self._state(form_id)
+        return entry_id <= state['watermark'] or entry_id in state['done']
+
+    def mark(self, form_id, entry_id, pending_ids: List[int], ok: bool = True):
+        """Record a finished entry and advance the watermark past contiguous successes"""
+        with self.lock:
+            state = self._state(form_id)
+            done = set(state['done'])
+            if ok:
+                done.add(entry_id)
+                if entry_id in state['failed']:
+                    state['failed'].remove(entry_id)
+            elif entry_id not in state['failed']:
+                # Holds the watermark back until a later run replays it successfully
+                state['failed'].append(entry_id)
+            for pending_id in sorted(pending_ids):
+                if pending_id in done:
+                    state['watermark'] = max(state['watermark'], pending_id)
+                    done.discard(pending_id)
+                elif pending_id > state['watermark']:
+                    break
+            state['done'] = sorted(done)
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'forms': self.forms}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def entry_to_payload(entry: Dict) -> Dict:
+    """Shape a raw ap_form row like the JSON MachForm posts to the webhook"""
+    payload = {}
+    for key, value in entry.items():
+        if value is None:
+            continue
+        payload[key] = value if isinstance(value, (str, int, float)) else str(value)
+    payload['entry_no'] = entry.get('id')
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical MachForm entries through the admissions pipeline")
+    parser.add_argument('--form', action='append', required=True, metavar='FORM_ID=SLUG',
+                        help="MachForm form id and route slug (estados-unidos, latinoamerica, experiencia, recomendacion)")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent replays (default 4)")
+    parser.add_argument('--rate', action='append', default=[], metavar='SERVICE=PER_SECOND',
+                        help="Rate limit for salesforce, machform_db, machform_http, gemini or resend")
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json', help="Checkpoint file for resume")
+    parser.add_argument('--limit', type=int, default=0, help="Stop after this many entries per form")
+    parser.add_argument('--dry-run', action='store_true', help="Run the pipeline but skip all emails")
+    args = parser.parse_args()
+
+    for spec in args.rate:
+        rate_limit.configure_from_string(spec)
+
+    import app
+    from machform_client import MachFormClient
+
+    forms = []
+    for spec in args.form:
+        form_id, slug = spec.split('=', 1)
+        if slug not in app.FORM_SLUGS:
+            parser.error(f"Unknown form slug '{slug}' (expected one of {', '.join(app.FORM_SLUGS)})")
+        forms.append((int(form_id), app.FORM_SLUGS[slug]))
+
+    checkpoint = Checkpoint(args.checkpoint)
+    mf = MachFormClient()
+
+    # Read everything up front, oldest first across forms, so an applicant's
+    # earlier forms are replayed before the one that completes the application
+    work = []
+    for form_id, form_type in forms:
+        count = 0
+        for entry in mf.iter_entries(form_id, after_id=checkpoint.watermark(form_id)):
+            if checkpoint.is_done(form_id, entry['id']):
+                continue
+            work.append((str(entry.get('date_created') or ''), form_id, form_type, entry))
+            count += 1
+            if args.limit and count >= args.limit:
+                break
+        print(f"[BACKFILL] Form {form_id}: {count} entries to replay")
+    work.sort(key=lambda w: (w[0], w[1], w[3]['id']))
+
+    pending_ids: Dict[int, List[int]] = {}
+    for _, form_id, _, entry in work:
+        pending_ids.setdefault(form_id, []).append(entry['id'])
+
+    def replay(form_id, form_type, entry):
+        body, status_code = app.process_webhook(
+            raw_data=entry_to_payload(entry),
+            form_type=form_type,
+            form_config_module=app.FORM_MODULES[form_type],
+            send_emails=not args.dry_run
+        )
+        return body, status_code
+
+    started = time.time()
+    results = {'ok': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill") as pool:
+        futures = {pool.submit(replay, form_id, form_type, entry): (form_id, entry['id'])
+                   for _, form_id, form_type, entry in work}
+        for future in as_completed(futures):
+            form_id, entry_id = futures[future]
+            try:
+                body, status_code = future.result()
+                ok = status_code < 400
+                print(f"[BACKFILL] form {form_id} entry {entry_id}: {status_code} {body.get('status')}")
+            except Exception as e:
+                ok = False
+                print(f"[BACKFILL] ❌ form {form_id} entry {entry_id}: {e}")
+            results['ok' if ok else 'failed'] += 1
+            checkpoint.mark(form_id, entry_id, pending_ids[form_id], ok=ok)
+
+    elapsed = time.time() - started
+    print(f"\n[BACKFILL] Done: {results['ok']} ok, {results['failed']} failed in {elapsed:.1f}s"
+          f"{' (dry run - no emails sent)' if args.dry_run else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Batch Ingestion - Bulk import / MachForm replay of many form submissions
+Extracts every item with the existing form modules, then does the Salesforce
+work per applicant with a handful of collection calls (Lead lookup, Lead
+creation, form-type check, Form_Submission insert, count update) instead of
+six round-trips per item.
+"""
+
+import json
+from contextlib import ExitStack
+from typing import Dict, List
+
+import applicant_lock
+import structured_log
+
+log = structured_log.get_logger('batch')
+
+MAX_BATCH_ITEMS = 500
+
+
+def ingest_batch(items: List[Dict], sf_client, form_modules: Dict, on_complete=None) -> Dict:
+    """
+    Ingest [{'form_type': ..., 'payload': {...}}, ...].
+
+    Args:
+        items: Batch items in submission order
+        sf_client: SalesforceClient
+        form_modules: form_type -> extraction module (app.FORM_MODULES)
+        on_complete: Optional callback(student_data, form_type, lead_id, form_count)
+                     for applicants whose application became complete; returns a job id
+
+    Returns:
+        {'items': [per-item outcome], 'summary': {outcome: count}}
+    """
+    outcomes = [{'index': i, 'form_type': item.get('form_type') if isinstance(item, dict) else None}
+                for i, item in enumerate(items)]
+
+    # STEP 1: Extract every item through its form module
+    extracted = []
+    for i, item in enumerate(items):
+        outcome = outcomes[i]
+        if not isinstance(item, dict) or not isinstance(item.get('payload'), dict):
+            outcome.update(outcome='error', error="Item must be {form_type, payload}")
+            continue
+        module = form_modules.get(item.get('form_type'))
+        if not module:
+            outcome.update(outcome='error', error=f"Unknown form_type: {item.get('form_type')}")
+            continue
+        try:
+            student_data = module.extract_student_data(item['payload'])
+            student_data['form_name'] = item['form_type']
+        except Exception as e:
+            outcome.update(outcome='error', error=f"Extraction failed: {e}")
+            continue
+
+        email = applicant_lock.normalize_email(student_data.get('email'))
+        # Form modules fill in a "No email" placeholder when the field is missing
+        if '@' not in email:
+            outcome.update(outcome='error', error="No email in payload")
+            continue
+        outcome['email'] = email
+        extracted.append((i, email, item, student_data))
+
+    # Group per applicant, keeping submission order inside each group
+    applicants: Dict[str, List] = {}
+    for entry in extracted:
+        applicants.setdefault(entry[1], []).append(entry)
+
+    if applicants and sf_client and sf_client.sf:
+        # Hold every applicant's lock (sorted, so batches never deadlock each other)
+        with ExitStack() as stack:
+            for email in sorted(applicants):
+                stack.enter_context(applicant_lock.applicant_lock(email))
+            _store_in_salesforce(applicants, outcomes, sf_client, on_complete)
+    else:
+        for i, _, _, _ in extracted:
+            outcomes[i].update(outcome='error', error="Salesforce not connected")
+
+    summary: Dict[str, int] = {}
+    for outcome in outcomes:
+        summary[outcome.get('outcome', 'error')] = summary.get(outcome.get('outcome', 'error'), 0) + 1
+    log.info(f"Ingested {len(items)} items for {len(applicants)} applicants: {summary}")
+    return {'items': outcomes, 'summary': summary}
+
+
+def _lookup_failed(applicants: Dict, outcomes: List[Dict], error: str):
+    """A failed lookup is not "nothing found": creating records now would duplicate them"""
+    for entries in applicants.values():
+        for i, _, _, _ in entries:
+            outcomes[i].update(outcome='error', error=error, retryable=True)
+
+
+def _store_in_salesforce(applicants: Dict, outcomes: List[Dict], sf_client, on_complete):
+    # STEP 2: Find existing Leads, create the missing ones
+    lead_ids = sf_client.find_leads_by_emails(list(applicants))
+    if lead_ids is None:
+        _lookup_failed(applicants, outcomes, "Lead lookup failed")
+        return
+    missing = []
+    for email, entries in applicants.items():
+        if email not in lead_ids:
+            first = entries[0][3]
+            missing.append({
+                'email': email,
+                'first_name': first.get('applicant_first_name', 'Unknown'),
+                'last_name': first.get('applicant_last_name', 'Unknown')
+            })
+    if missing:
+        lead_ids.update(sf_client.create_leads(missing))
+
+    # STEP 3: Duplicate check against what Salesforce already has
+    submitted = sf_client.get_submitted_form_types_bulk([lead_ids[e] for e in applicants if e in lead_ids])
+    if submitted is None:
+        _lookup_failed(applicants, outcomes, "Form_Submission lookup failed")
+        return
+
+    pending_inserts = []
+    for email, entries in applicants.items():
+        lead_id = lead_ids.get(email)
+        if not lead_id:
+            for i, _, _, _ in entries:
+                outcomes[i].update(outcome='error', error="Could not create/find Lead")
+            continue
+
+        seen_types = set(submitted.get(lead_id, []))
+        for i, _, item, student_data in entries:
+            outcomes[i]['lead_id'] = lead_id
+            if item['form_type'] in seen_types:
+                outcomes[i]['outcome'] = 'duplicate'
+                continue
+            seen_types.add(item['form_type'])
+            pending_inserts.append((i, email, lead_id, item, student_data))
+
+    # STEP 4: Insert all new Form_Submission records
+    submission_ids = sf_client.create_form_submissions([{
+        'lead_id': lead_id,
+        'form_type': item['form_type'],
+        'form_data_json': json.dumps(item['payload'], ensure_ascii=False)
+    } for _, _, lead_id, item, _ in pending_inserts])
+
+    inserted_per_lead: Dict[str, List] = {}
+    for (i, email, lead_id, item, student_data), submission_id in zip(pending_inserts, submission_ids):
+        if submission_id:
+            outcomes[i].update(outcome='created', submission_id=submission_id)
+            inserted_per_lead.setdefault(lead_id, []).append((item['form_type'], student_data))
+        else:
+            outcomes[i].update(outcome='error', error="Form_Submission insert failed")
+
+    # STEP 5: Update form counts in one call and hand completed applications on
+    counts = {
+        lead_id: len(submitted.get(lead_id, [])) + len(inserted)
+        for lead_id, inserted in inserted_per_lead.items()
+    }
+    sf_client.update_lead_form_counts(counts)
+
+    for lead_id, inserted in inserted_per_lead.items():
+        previous_types = set(submitted.get(lead_id, []))
+        new_types = previous_types | {form_type for form_type, _ in inserted}
+        if len(previous_types) < 3 <= len(new_types) and on_complete:
+            form_type, student_data = inserted[-1]
+            job_id = on_complete(student_data, form_type, lead_id, len(new_types))
+            for outcome in outcomes:
+                if outcome.get('lead_id') == lead_id and outcome.get('outcome') == 'created':
+                    outcome['classification_job_id'] = job_id
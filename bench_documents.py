@@ -0,0 +1,129 @@
+"""
+Document Benchmark - Peak memory of preparing uploaded documents for Gemini
+Writes five synthetic 10 MB PDFs and, in a fresh interpreter per mode, runs
+them through everything a Stage 2 request does with documents - load, token
+budget, cache key, request parts - reporting the peak RSS above the
+interpreter's baseline:
+
+    base64     the previous path: files read and base64-encoded up front,
+               then decoded again for the budget, the cache key and the Parts
+    handles    file handles (document_handles), every file inlined once
+    uri        file handles with files over GEMINI_INLINE_MAX_BYTES uploaded
+               and sent by URI (the local stand-in uploader, so no GCS needed)
+
+Parts are built with document_handles.payload(), i.e. everything up to the
+Vertex AI Part wrapper, so the benchmark runs without the SDK.
+
+Usage:
+    python bench_documents.py
+    python bench_documents.py --files 5 --size-mb 10 --json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = ('base64', 'handles', 'uri')
+PAGES_PER_FILE = 20
+
+# Runs in the child interpreter; prints one JSON line with peak RSS in KiB
+CHILD = """
+import base64, hashlib, json, os, resource, sys
+import classification_cache, document_handles, token_budget
+from gemini_classifier import process_file_for_gemini
+
+def peak():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+paths = json.loads(sys.argv[1])
+baseline = peak()
+prompt = 'x' * 20000
+if '{mode}' == 'base64':
+    documents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            documents.append({{'mime_type': 'application/pdf', 'filename': os.path.basename(path),
+                              'data': base64.b64encode(f.read()).decode('utf-8')}})
+    decoded = [base64.b64decode(doc['data']) for doc in documents]
+    tokens = sum(len(token_budget.PDF_PAGE.findall(data)) for data in decoded)
+    del decoded
+    digests = [hashlib.sha256(base64.b64decode(doc['data'])).hexdigest() for doc in documents]
+    parts = [base64.b64decode(doc['data']) for doc in documents]
+else:
+    documents = [process_file_for_gemini(path) for path in paths]
+    documents, decision = token_budget.fit([prompt], documents)
+    tokens = decision['document_tokens']
+    classification_cache.make_key('multi', prompt, documents, 'bench', '0')
+    parts = [document_handles.payload(doc) for doc in documents]
+inline = sum(len(value) for kind, value in parts if kind != 'uri') if '{mode}' != 'base64' else sum(map(len, parts))
+print(json.dumps({{'baseline_kib': baseline, 'peak_kib': peak(), 'documents': len(parts), 'inline_bytes': inline}}))
+"""
+
+
+def write_pdfs(directory: str, count: int, size_mb: float) -> List[str]:
+    """Synthetic PDFs: PAGES_PER_FILE page objects padded with incompressible bytes"""
+    paths = []
+    size = int(size_mb * 1024 * 1024)
+    page = b"obj\n<< /Type /Page /Parent 1 0 R >>\nstream\n"
+    for number in range(count):
+        path = os.path.join(directory, f"transcript_{number}.pdf")
+        filler = (size - 9 - len(page) * PAGES_PER_FILE) // PAGES_PER_FILE
+        with open(path, 'wb') as f:
+            f.write(b"%PDF-1.4\n")
+            for _ in range(PAGES_PER_FILE):
+                f.write(page)
+                f.write(os.urandom(filler))
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode: str, paths: List[str], scratch: str) -> Dict:
+    env = dict(os.environ)
+    env.update({
+        'LOG_LEVEL': 'WARNING',
+        # Room for all five files, so every mode sends the same documents
+        'GEMINI_DOCUMENT_BYTES_BUDGET': str(1 << 30),
+        'DOCUMENT_DERIVED_DIR': os.path.join(scratch, 'derived'),
+        'GEMINI_UPLOAD_BUCKET': '',
+        'GEMINI_UPLOAD_DIR': os.path.join(scratch, 'uploads') if mode == 'uri' else '',
+        'GEMINI_INLINE_MAX_BYTES': str(1024 * 1024) if mode == 'uri' else str(1 << 30),
+    })
+    proc = subprocess.run([sys.executable, '-c', CHILD.format(mode=mode), json.dumps(paths)],
+                          cwd=HERE, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        raise SystemExit(f"[BENCH] {mode} run failed")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['peak_mb'] = round((result['peak_kib'] - result['baseline_kib']) / 1024, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of preparing uploaded documents for Gemini")
+    parser.add_argument('--files', type=int, default=5, help="Number of PDFs (default 5)")
+    parser.add_argument('--size-mb', type=float, default=10, help="Size of each PDF in MB (default 10)")
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_documents_') as scratch:
+        paths = write_pdfs(scratch, args.files, args.size_mb)
+        results = {mode: run_mode(mode, paths, scratch) for mode in MODES}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    total_mb = args.files * args.size_mb
+    print(f"[BENCH] {args.files} PDFs x {args.size_mb:g} MB ({total_mb:g} MB): peak RSS above baseline")
+    for mode, result in results.items():
+        inline_mb = result['inline_bytes'] / 1024 / 1024
+        print(f"[BENCH]   {mode:8s} {result['peak_mb']:7.1f} MB  ({result['peak_mb'] / total_mb:.2f}x the files,"
+              f" {result['documents']} documents, {inline_mb:.1f} MB inline)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Prompt Benchmark - What the Stage 2 system instruction saves per classification
+Compares the old layout (rules + examples rebuilt into every prompt) with the
+current one (rules + examples as the model's system instruction, only the
+applicant section built per call) for a synthetic three-form applicant.
+
+Offline it reports prompt sizes, estimated tokens and build time. With --live
+(needs Vertex AI credentials) it also asks Gemini for exact token counts and
+runs a few classifications per layout, reporting latency and how many prompt
+tokens were served from Gemini's prefix cache.
+
+Usage:
+    python bench_prompt.py
+    python bench_prompt.py --live --calls 3
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+import gemini_classifier
+from gemini_classifier import MULTI_FORM_SYSTEM_INSTRUCTION
+
+# Rough size of a token for Spanish/English prose when no tokenizer is at hand
+CHARS_PER_TOKEN = 4
+
+SAMPLE_STUDENT = {
+    'applicant_name': 'María Pérez',
+    'email': 'maria.perez@example.com',
+    'program_interest': 'Maestría en Divinidad',
+    'education_level': 'Licenciatura en Teología',
+    'study_level_selected': 'Postgrado',
+    'ministerial_experience': 'Pastora asociada 6 años',
+}
+
+SAMPLE_SUBMISSIONS = [
+    {'Form_Type__c': form_type, 'Submission_Date__c': '2026-01-15T10:00:00Z',
+     'Form_Data_JSON__c': json.dumps(data, ensure_ascii=False)}
+    for form_type, data in (
+        ('Solicitud Oficial de Admisión Latinoamérica',
+         {'element_3': 'Maestría en Divinidad', 'element_4': 'Licenciatura en Teología (2020)'}),
+        ('Formulario de Experiencia Ministerial',
+         {'element_1': 'Pastora asociada', 'element_2': '6 años', 'element_5': 'Discipulado, predicación, consejería'}),
+        ('Formulario de Recomendación Pastoral',
+         {'element_1': 'Pastor principal', 'element_2': 'La conozco hace 8 años; lidera el ministerio de jóvenes.'}),
+    )
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def build_prompts(classifier) -> Dict[str, str]:
+    app = classifier._get_application_context(SAMPLE_STUDENT['email'], SAMPLE_SUBMISSIONS)
+    applicant = classifier._build_multi_form_prompt(app, SAMPLE_STUDENT)
+    return {'applicant': applicant, 'old': MULTI_FORM_SYSTEM_INSTRUCTION + '\n---\n' + applicant}
+
+
+def time_builds(classifier, rounds: int) -> Dict[str, float]:
+    """Microseconds to build the per-call prompt, old layout vs current"""
+    app = classifier._get_application_context(SAMPLE_STUDENT['email'], SAMPLE_SUBMISSIONS)
+    timings = {}
+    for layout in ('old', 'current'):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            prompt = classifier._build_multi_form_prompt(app, SAMPLE_STUDENT)
+            if layout == 'old':
+                prompt = f"{MULTI_FORM_SYSTEM_INSTRUCTION}\n---\n{prompt}"
+        timings[layout] = (time.perf_counter() - started) / rounds * 1e6
+    return timings
+
+
+def live_calls(classifier, prompts: Dict[str, str], calls: int) -> Dict[str, Dict]:
+    """Exact token counts and latency per layout from real Gemini calls"""
+    pool = classifier.pool
+    layouts = {
+        'old': (pool.model(), prompts['old']),
+        'current': (pool.model(MULTI_FORM_SYSTEM_INSTRUCTION), prompts['applicant']),
+    }
+    results = {}
+    for layout, (model, prompt) in layouts.items():
+        latencies: List[float] = []
+        prompt_tokens: List[int] = []
+        cached_tokens: List[int] = []
+        counted = model.count_tokens(prompt).total_tokens
+        for _ in range(calls):
+            started = time.perf_counter()
+            response = model.generate_content(prompt)
+            latencies.append(time.perf_counter() - started)
+            usage = response.usage_metadata
+            prompt_tokens.append(usage.prompt_token_count)
+            cached_tokens.append(getattr(usage, 'cached_content_token_count', 0) or 0)
+        results[layout] = {
+            'counted_tokens': counted,
+            'prompt_tokens': statistics.median(prompt_tokens),
+            'cached_tokens': statistics.median(cached_tokens),
+            'latency_median_s': round(statistics.median(latencies), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the Stage 2 prompt split")
+    parser.add_argument('--rounds', type=int, default=2000, help="Prompt builds to time (default 2000)")
+    parser.add_argument('--live', action='store_true', help="Also call Gemini (needs credentials)")
+    parser.add_argument('--calls', type=int, default=3, help="Live classifications per layout (default 3)")
+    args = parser.parse_args()
+
+    classifier = gemini_classifier.get_classifier()
+    prompts = build_prompts(classifier)
+    builds = time_builds(classifier, args.rounds)
+
+    static_chars = len(MULTI_FORM_SYSTEM_INSTRUCTION)
+    print("[BENCH] Stage 2 prompt per classification")
+    print(f"[BENCH]   old layout      {len(prompts['old']):6d} chars  ~{estimate_tokens(prompts['old']):5d} tokens"
+          f"  built in {builds['old']:.1f} µs")
+    print(f"[BENCH]   applicant only  {len(prompts['applicant']):6d} chars  ~{estimate_tokens(prompts['applicant']):5d} tokens"
+          f"  built in {builds['current']:.1f} µs")
+    print(f"[BENCH]   system prefix   {static_chars:6d} chars  ~{estimate_tokens(MULTI_FORM_SYSTEM_INSTRUCTION):5d} tokens"
+          f"  built once per process")
+
+    if args.live:
+        results = live_calls(classifier, prompts, args.calls)
+        for layout, result in results.items():
+            print(f"[BENCH]   live {layout:8s} prompt {result['prompt_tokens']} tokens"
+                  f" ({result['cached_tokens']} from prefix cache), latency {result['latency_median_s']}s")
+        saved = results['old']['latency_median_s'] - results['current']['latency_median_s']
+        billed_old = results['old']['prompt_tokens'] - results['old']['cached_tokens']
+        billed_new = results['current']['prompt_tokens'] - results['current']['cached_tokens']
+        print(f"[BENCH]   saved per classification: {billed_old - billed_new} full-price input tokens,"
+              f" {saved:.3f}s latency")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Startup Benchmark - Import and boot time of the webhook service
+Starts fresh interpreters and measures how long `import app` takes and how long
+until the first /health response, then lists the slowest imports (from
+python -X importtime) so a heavy dependency creeping back onto the boot path
+shows up. Job workers, the Salesforce login and metric snapshots stay off, and
+the job queue points at a scratch file, so nothing touches the real services.
+
+Usage:
+    python bench_startup.py --runs 5 --top 15
+    python bench_startup.py --max-import 1.5      # exit 1 if the median import is slower
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the child interpreter; prints one JSON line of timings
+CHILD = """
+import json, time
+started = time.perf_counter()
+import {module} as service
+imported = time.perf_counter()
+first_response = None
+if hasattr(service.app, 'test_client'):
+    service.app.test_client().get('/health')
+    first_response = time.perf_counter() - started
+print(json.dumps({{'import': imported - started, 'first_response': first_response}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def child_env(scratch: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'JOB_WORKERS_AUTOSTART': '0',
+        'JOB_QUEUE_PATH': os.path.join(scratch, 'jobs.db'),
+        'IDEMPOTENCY_PATH': os.path.join(scratch, 'idempotency.db'),
+        'METRICS_DIR': os.path.join(scratch, 'metrics'),
+        'ADMISSION_DIR': os.path.join(scratch, 'gate'),
+        'APPLICANT_LOCK_DIR': os.path.join(scratch, 'locks'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    return env
+
+
+def run_child(module: str, env: Dict[str, str], importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', CHILD.format(module=module)]
+    return subprocess.run(cmd, cwd=HERE, env=env, capture_output=True, text=True)
+
+
+def interpreter_baseline(env: Dict[str, str]) -> float:
+    """Seconds for a bare interpreter to start and exit"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], env=env, capture_output=True)
+    return time.perf_counter() - started
+
+
+def slowest_imports(stderr: str, top: int) -> List[Dict]:
+    """Top-level imports of the service modules with the largest cumulative time"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({'module': name, 'depth': len(indent) // 2,
+                         'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+    # Depth 0/1 are the service's own imports and what they pull in directly
+    rows = [row for row in rows if row['depth'] <= 1]
+    return sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and boot time of the admissions service")
+    parser.add_argument('--module', default='app', help="Module to import (app or asgi_app, default app)")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to time (default 5)")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to list (default 15)")
+    parser.add_argument('--max-import', type=float, default=0,
+                        help="Fail (exit 1) if the median import time exceeds this many seconds")
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as scratch:
+        env = child_env(scratch)
+        baseline = interpreter_baseline(env)
+        imports, first_responses = [], []
+        for _ in range(args.runs):
+            proc = run_child(args.module, env)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                sys.exit(f"[BENCH] import {args.module} failed")
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+            imports.append(timings['import'])
+            if timings['first_response'] is not None:
+                first_responses.append(timings['first_response'])
+        slowest = slowest_imports(run_child(args.module, env, importtime=True).stderr, args.top)
+
+    result = {
+        'module': args.module,
+        'runs': args.runs,
+        'interpreter_s': round(baseline, 3),
+        'import_median_s': round(statistics.median(imports), 3),
+        'import_max_s': round(max(imports), 3),
+        'first_response_median_s': round(statistics.median(first_responses), 3) if first_responses else None,
+        'slowest_imports': slowest,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"[BENCH] {args.module}: {args.runs} runs (interpreter start {result['interpreter_s']}s)")
+        print(f"[BENCH]   import         median {result['import_median_s']}s  max {result['import_max_s']}s")
+        if first_responses:
+            print(f"[BENCH]   first response median {result['first_response_median_s']}s")
+        print("[BENCH] Slowest imports (cumulative):")
+        for row in slowest:
+            print(f"[BENCH]   {row['cumulative_ms']:9.1f} ms  {'  ' * row['depth']}{row['module']}")
+
+    if args.max_import and result['import_median_s'] > args.max_import:
+        sys.exit(f"[BENCH] ❌ median import {result['import_median_s']}s exceeds --max-import {args.max_import}s")
+
+
+if __name__ == '__main__':
+    main()
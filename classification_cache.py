@@ -0,0 +1,197 @@
+"""
+Classification Cache - Content-addressed Gemini results
+A classification is keyed on a hash of everything that determines the model's
+answer: the normalized prompt, the SHA-256 of each attached document, the
+model name and the prompt version. Redeliveries, replays and retried jobs
+therefore reuse the first answer instead of paying for the same Gemini call.
+Entries live in a per-process LRU backed by a TTL'd SQLite table shared by
+all gunicorn workers. Fallback classifications are never stored.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import document_handles
+import metrics
+import structured_log
+
+log = structured_log.get_logger('classifier')
+
+DB_PATH = os.getenv('CLASSIFICATION_CACHE_PATH', '/tmp/admissions_classifications.db')
+TTL_SECONDS = int(os.getenv('CLASSIFICATION_CACHE_TTL', str(30 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv('CLASSIFICATION_CACHE_MAX_ENTRIES', '20000'))
+MEMORY_ENTRIES = int(os.getenv('CLASSIFICATION_CACHE_MEMORY_ENTRIES', '256'))
+ENABLED = os.getenv('CLASSIFICATION_CACHE', '1') == '1'
+
+# Prompt lines that change between otherwise identical requests (tracker timestamps)
+VOLATILE_LINES = re.compile(r'^- (Created|Updated): .*$', re.MULTILINE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Drop volatile lines and whitespace differences that don't change the answer"""
+    prompt = VOLATILE_LINES.sub('', prompt)
+    lines = [line.rstrip() for line in prompt.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+
+def document_digest(document: Dict) -> str:
+    """SHA-256 of a document's bytes (hashed once, when its handle is made)"""
+    return document_handles.digest(document)
+
+
+def make_key(kind: str, prompt: str, documents: Optional[List[Dict]], model: str, prompt_version: str,
+             system_instruction: str = '') -> str:
+    """Content address of one classification request"""
+    material = {
+        'kind': kind,
+        'model': model,
+        'prompt_version': prompt_version,
+        'system_instruction': hashlib.sha256(system_instruction.encode('utf-8')).hexdigest(),
+        'prompt': normalize_prompt(prompt),
+        'documents': sorted(f"{doc.get('mime_type')}:{document_digest(doc)}" for doc in documents or []),
+    }
+    canonical = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ClassificationCache:
+    """LRU in front of a bounded TTL store of classification results"""
+
+    def __init__(self, db_path: str = DB_PATH, ttl: int = TTL_SECONDS, max_entries: int = MAX_ENTRIES,
+                 memory_entries: int = MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS classifications (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_classifications_created ON classifications (created_at)")
+        finally:
+            conn.close()
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+        metrics.CLASSIFICATION_CACHE_TOTAL.inc(outcome=outcome)
+
+    def _remember(self, key: str, body: str, created_at: float):
+        with self._lock:
+            self._memory[key] = (body, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """A fresh copy of the cached classification, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now - self.ttl:
+                self._memory.move_to_end(key)
+            elif entry:
+                del self._memory[key]
+                entry = None
+        if entry:
+            self._count('memory_hits')
+            return json.loads(entry[0])
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT body, created_at FROM classifications WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            self._count('misses')
+            return None
+        self._remember(key, row[0], row[1])
+        self._count('disk_hits')
+        return json.loads(row[0])
+
+    def put(self, key: str, classification: Dict):
+        """Store a classification from the model; fallback results are refused"""
+        if classification.get('classification_type') == 'fallback':
+            return
+        now = time.time()
+        body = json.dumps(classification, ensure_ascii=False)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO classifications (key, body, created_at) VALUES (?, ?, ?)",
+                (key, body, now)
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._remember(key, body, now)
+        self._count('stores')
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM classifications WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute("""
+            DELETE FROM classifications WHERE key IN (
+                SELECT key FROM classifications ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process and the current store sizes"""
+        conn = self._connect()
+        try:
+            size = conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            counts = dict(self.counts)
+            memory_size = len(self._memory)
+        hits = counts['memory_hits'] + counts['disk_hits']
+        lookups = hits + counts['misses']
+        return {
+            **counts,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'memory_entries': memory_size,
+            'entries': size
+        }
+
+
+# Global cache instance
+_cache = None
+
+def get_cache() -> Optional[ClassificationCache]:
+    """Get the global classification cache (singleton); None when CLASSIFICATION_CACHE=0"""
+    global _cache
+    if _cache is None and ENABLED:
+        _cache = ClassificationCache()
+    return _cache
@@ -0,0 +1,169 @@
+"""
+Classification Events - Live classification progress per Lead
+Classifications run in job workers (any gunicorn process), so progress is
+written to a small SQLite event log and the dashboard's Server-Sent Events
+endpoint tails it by Lead id:
+
+    GET /api/applicants/<lead_id>/classification/stream
+
+Events: started (stage), field (one classification field as soon as Gemini
+has streamed it), complete (the final classification) and failed. Each SSE
+message carries the event id, so a reconnecting EventSource resumes from
+Last-Event-ID. Streams close after a final event or after
+CLASSIFICATION_STREAM_MAX_SECONDS (the browser reconnects on its own).
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import structured_log
+
+log = structured_log.get_logger('events')
+
+DB_PATH = os.getenv('CLASSIFICATION_EVENTS_PATH', '/tmp/admissions_events.db')
+# Events older than this are pruned when a new classification starts
+RETENTION_SECONDS = int(os.getenv('CLASSIFICATION_EVENTS_RETENTION', str(24 * 3600)))
+POLL_INTERVAL = float(os.getenv('CLASSIFICATION_STREAM_POLL', '0.5'))
+# Keeps a sync (gunicorn) worker thread from being held by one dashboard tab
+STREAM_MAX_SECONDS = float(os.getenv('CLASSIFICATION_STREAM_MAX_SECONDS', '90'))
+HEARTBEAT_SECONDS = 15
+FINAL_EVENTS = ('complete', 'failed')
+
+
+class EventLog:
+    """Append-only classification events, readable by Lead id from any process"""
+
+    def __init__(self, db_path: str = DB_PATH, retention: int = RETENTION_SECONDS):
+        self.db_path = db_path
+        self.retention = retention
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS classification_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    lead_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_lead ON classification_events (lead_id, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON classification_events (created_at)")
+        finally:
+            conn.close()
+
+    def publish(self, lead_id: str, event: str, data: Dict) -> int:
+        now = time.time()
+        conn = self._connect()
+        try:
+            if event == 'started':
+                conn.execute("DELETE FROM classification_events WHERE created_at < ?", (now - self.retention,))
+            cursor = conn.execute(
+                "INSERT INTO classification_events (lead_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (lead_id, event, json.dumps(data, ensure_ascii=False, default=str), now)
+            )
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def since(self, lead_id: str, after_id: int = 0, limit: int = 200) -> List[Dict]:
+        """Events for a Lead with id > after_id, oldest first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, event, data, created_at FROM classification_events"
+                " WHERE lead_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (lead_id, after_id, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'id': row[0], 'event': row[1], 'data': json.loads(row[2]), 'created_at': row[3]} for row in rows]
+
+
+def format_sse(event: Dict) -> str:
+    data = json.dumps(event['data'], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+def stream(lead_id: str, last_event_id: int = 0, max_seconds: float = STREAM_MAX_SECONDS) -> Iterator[str]:
+    """SSE messages for a Lead, polling the event log (for Flask's streamed responses)"""
+    events = get_event_log()
+    deadline = time.monotonic() + max_seconds
+    heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+    yield "retry: 2000\n\n"
+    while time.monotonic() < deadline:
+        for event in events.since(lead_id, last_event_id):
+            last_event_id = event['id']
+            yield format_sse(event)
+            if event['event'] in FINAL_EVENTS:
+                return
+        if time.monotonic() >= heartbeat:
+            heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+            yield ": keep-alive\n\n"
+        time.sleep(POLL_INTERVAL)
+
+
+async def stream_async(lead_id: str, last_event_id: int = 0, max_seconds: float = STREAM_MAX_SECONDS):
+    """Async counterpart of stream() for asgi_app"""
+    events = get_event_log()
+    deadline = time.monotonic() + max_seconds
+    heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+    yield "retry: 2000\n\n"
+    while time.monotonic() < deadline:
+        for event in await asyncio.to_thread(events.since, lead_id, last_event_id):
+            last_event_id = event['id']
+            yield format_sse(event)
+            if event['event'] in FINAL_EVENTS:
+                return
+        if time.monotonic() >= heartbeat:
+            heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def last_event_id(header: Optional[str]) -> int:
+    """Parse a Last-Event-ID header (0 when missing or malformed)"""
+    try:
+        return int(header or 0)
+    except ValueError:
+        return 0
+
+
+def publisher(lead_id: Optional[str]) -> Optional[Callable[[str, Dict], None]]:
+    """
+    progress(event, data) callback that records events for a Lead, or None
+    without a Lead id. Publishing never fails the classification.
+    """
+    if not lead_id:
+        return None
+
+    def progress(event: str, data: Dict):
+        try:
+            get_event_log().publish(lead_id, event, data)
+        except Exception as e:
+            log.warning(f"Could not publish classification event: {e}", lead_id=lead_id, event=event)
+
+    return progress
+
+
+# Global event log instance
+_event_log = None
+
+def get_event_log() -> EventLog:
+    """Get the global classification event log (singleton)"""
+    global _event_log
+    if _event_log is None:
+        _event_log = EventLog()
+    return _event_log
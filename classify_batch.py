@@ -0,0 +1,256 @@
+"""
+Batch Classification CLI - Re-classify applicants offline (JSONL in, JSONL out)
+Runs MultiFormClassifier over applicant bundles without replaying webhooks or
+touching Salesforce records, e.g. to see how a rules change reclassifies an
+intake. Bundles come from a JSONL file or from Leads with all forms in
+Salesforce; a bounded worker pool classifies them under the shared Gemini rate
+limit, and every result is appended to the output file as soon as it is done.
+Re-running with the same --output skips bundles already classified.
+
+Input bundle (one JSON object per line):
+    {"id": "00Q...", "email": "...", "student_data": {...},
+     "submissions": [{"Form_Type__c": ..., "Form_Data_JSON__c": "...", "Submission_Date__c": ...}],
+     "documents": [{"path": "/data/transcript.pdf"}]}
+student_data is optional when the submissions include an application form.
+Documents are read from disk when sent; inline {"filename", "mime_type",
+"data": "<base64>"} entries are also accepted.
+
+Usage:
+    python classify_batch.py --input intake.jsonl --output results.jsonl --workers 8 --rate gemini=2
+    python classify_batch.py --from-salesforce --since 2026-01-01 --output results.jsonl
+    python classify_batch.py --input intake.jsonl --output /tmp/out.jsonl --fake-model --fake-latency 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+
+import document_handles
+import document_prep
+import rate_limit
+
+# Application forms carry the applicant's own data (student_data is extracted from them)
+APPLICATION_FORMS = ('Solicitud Oficial de Admisión Estados Unidos y el Mundo',
+                     'Solicitud Oficial de Admisión Latinoamérica')
+
+
+class ResultWriter:
+    """
+    Appends one JSON line per classified bundle and doubles as the checkpoint:
+    ids with an 'ok' line in an existing output file are skipped on resume.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    if result.get('status') == 'ok':
+                        self.done.add(str(result.get('id')))
+            print(f"[BATCH] Resuming {path}: {len(self.done)} bundles already classified")
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, result: Dict):
+        line = json.dumps(result, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def read_bundles(path: str) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            bundle = json.loads(line)
+            bundle.setdefault('id', bundle.get('lead_id') or bundle.get('email') or f"line-{number}")
+            yield bundle
+
+
+def salesforce_bundles(sf_client, since: Optional[str], limit: int) -> Iterator[Dict]:
+    """Leads with all forms submitted; their submissions are fetched by the workers"""
+    soql = "SELECT Id, Email FROM Lead WHERE Forms_Complete__c = true"
+    if since:
+        soql += f" AND CreatedDate >= {since}T00:00:00Z"
+    soql += " ORDER BY CreatedDate ASC"
+    if limit:
+        soql += f" LIMIT {limit}"
+    result = sf_client.sf.query_all(soql)
+    print(f"[BATCH] Salesforce: {result['totalSize']} Leads with all forms")
+    for record in result['records']:
+        yield {'id': record['Id'], 'lead_id': record['Id'], 'email': record['Email']}
+
+
+def student_data_from_submissions(bundle: Dict) -> Dict:
+    """Extract student_data from the bundle's application form, as the webhook would"""
+    import estados_unidos
+    import latinoamerica
+    modules = dict(zip(APPLICATION_FORMS, (estados_unidos, latinoamerica)))
+    for submission in bundle.get('submissions') or []:
+        module = modules.get(submission.get('Form_Type__c'))
+        if module:
+            student_data = module.extract_student_data(json.loads(submission.get('Form_Data_JSON__c') or '{}'))
+            student_data['form_name'] = submission['Form_Type__c']
+            break
+    else:
+        student_data = {'applicant_name': 'Unknown'}
+    student_data.setdefault('email', bundle.get('email'))
+    return student_data
+
+
+def classify_bundle(classifier, bundle: Dict, sf_client=None, fetch_documents: bool = False) -> Dict:
+    """Classify one bundle; returns its output line (never raises)"""
+    import gemini_classifier
+    started = time.perf_counter()
+    result = {'id': bundle['id'], 'email': bundle.get('email')}
+    with gemini_classifier.track_usage() as usage:
+        try:
+            if sf_client and 'submissions' not in bundle:
+                bundle['submissions'] = sf_client.get_all_form_submissions(bundle['lead_id'])
+            student_data = dict(bundle.get('student_data') or student_data_from_submissions(bundle))
+            if bundle.get('documents'):
+                documents = [doc if 'data' in doc else document_handles.from_path(doc['path'])
+                             for doc in bundle['documents']]
+                student_data['uploaded_documents'] = document_prep.prepare_all([doc for doc in documents if doc])
+            elif fetch_documents:
+                student_data.update(gemini_classifier.fetch_uploaded_documents(bundle.get('email')))
+
+            submissions = bundle.get('submissions') or []
+            if len(submissions) >= 3:
+                classification = classifier.classify_multi_form(bundle.get('email'), student_data, submissions)
+            else:
+                classification = classifier.classify_single_form(student_data)
+            result['status'] = 'fallback' if classification.get('classification_type') == 'fallback' else 'ok'
+            result['classification'] = classification
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+    result['latency_s'] = round(time.perf_counter() - started, 3)
+    result['tokens'] = usage
+    result['classified_at'] = datetime.utcnow().isoformat()
+    return result
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    latencies = sorted(r['latency_s'] for r in results)
+    tokens = {kind: sum(r['tokens'][kind] for r in results) for kind in ('calls', 'prompt', 'cached', 'output')}
+    statuses = {}
+    for r in results:
+        statuses[r['status']] = statuses.get(r['status'], 0) + 1
+    return {
+        'bundles': len(results),
+        'statuses': statuses,
+        'elapsed_s': round(elapsed, 1),
+        'per_minute': round(len(results) / elapsed * 60, 1) if elapsed else 0.0,
+        'latency_p50_s': round(statistics.median(latencies), 3) if latencies else None,
+        'latency_p95_s': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        'latency_max_s': latencies[-1] if latencies else None,
+        'tokens': tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-classify applicant bundles offline (JSONL in, JSONL out)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="JSONL file of applicant bundles")
+    source.add_argument('--from-salesforce', action='store_true', help="Classify Leads with all forms submitted")
+    parser.add_argument('--since', help="With --from-salesforce: Leads created on/after YYYY-MM-DD")
+    parser.add_argument('--limit', type=int, default=0, help="Stop after this many bundles")
+    parser.add_argument('--output', required=True, help="JSONL results file (appended; also the resume checkpoint)")
+    parser.add_argument('--summary', help="Also write the summary as JSON to this file")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent classifications (default 4)")
+    parser.add_argument('--rate', action='append', default=[], metavar='SERVICE=PER_SECOND',
+                        help="Rate limit, e.g. gemini=2 (shared by all workers)")
+    parser.add_argument('--fetch-documents', action='store_true',
+                        help="Download each applicant's MachForm uploads when the bundle has none")
+    parser.add_argument('--no-cache', action='store_true', help="Ignore the classification cache")
+    parser.add_argument('--fake-model', action='store_true',
+                        help="Answer with placeholder classifications instead of calling Vertex AI")
+    parser.add_argument('--fake-latency', type=float, default=0.0, help="Seconds per fake model call")
+    args = parser.parse_args()
+
+    # Fake results must never land in (or be served from) the shared cache
+    if args.no_cache or args.fake_model:
+        os.environ['CLASSIFICATION_CACHE'] = '0'
+    for spec in args.rate:
+        rate_limit.configure_from_string(spec)
+
+    import gemini_classifier
+    import gemini_model
+    classifier = gemini_classifier.get_classifier()
+    if args.fake_model:
+        classifier.pool = gemini_model.FakeModelPool(args.fake_latency)
+        if args.fetch_documents:
+            parser.error("--fetch-documents needs the real model")
+
+    sf_client = None
+    if args.from_salesforce:
+        import salesforce_client
+        sf_client = salesforce_client.SalesforceClient()
+        if not sf_client.ready:
+            parser.error("Could not log in to Salesforce")
+        bundles = salesforce_bundles(sf_client, args.since, args.limit)
+    else:
+        bundles = read_bundles(args.input)
+
+    writer = ResultWriter(args.output)
+    work = []
+    for bundle in bundles:
+        if str(bundle['id']) in writer.done:
+            continue
+        if args.fake_model:
+            bundle.pop('documents', None)  # sending files needs the Vertex AI SDK
+        work.append(bundle)
+        if args.limit and len(work) >= args.limit:
+            break
+    print(f"[BATCH] {len(work)} bundles to classify with {args.workers} workers"
+          f"{' (fake model)' if args.fake_model else ''}")
+
+    started = time.time()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="classify") as pool:
+            futures = [pool.submit(classify_bundle, classifier, bundle, sf_client, args.fetch_documents)
+                       for bundle in work]
+            for future in as_completed(futures):
+                result = future.result()
+                writer.write(result)
+                results.append(result)
+                level = (result.get('classification') or {}).get('recommended_level', result.get('error'))
+                print(f"[BATCH] {result['id']}: {result['status']} {level} ({result['latency_s']}s,"
+                      f" {result['tokens']['prompt'] + result['tokens']['output']} tokens)")
+    finally:
+        writer.close()
+
+    summary = summarize(results, time.time() - started)
+    print(f"\n[BATCH] Done: {summary['bundles']} bundles {summary['statuses']} in {summary['elapsed_s']}s"
+          f" ({summary['per_minute']}/min)")
+    if results:
+        print(f"[BATCH]   latency p50 {summary['latency_p50_s']}s  p95 {summary['latency_p95_s']}s"
+              f"  max {summary['latency_max_s']}s")
+        tokens = summary['tokens']
+        print(f"[BATCH]   {tokens['calls']} Gemini calls, {tokens['prompt']} prompt tokens"
+              f" ({tokens['cached']} cached), {tokens['output']} output tokens")
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
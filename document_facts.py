@@ -0,0 +1,120 @@
+"""
+Document Facts - Phase one of Stage 2: what each uploaded document shows
+Instead of attaching every diploma and transcript to every Stage 2 call, each
+document is first sent on its own, once, with a short extraction instruction.
+The model answers with compact facts (document type, degree level and title,
+institution, ministerial vs secular, year), which are stored by the
+document's SHA-256. The classification prompt then carries those facts as
+text. A document already analyzed - for this applicant or anyone else - is
+never sent to the model again; only documents whose extraction failed are
+still attached as files.
+
+Facts are kept in a SQLite table shared by all workers, with no expiry: a
+file's contents don't change. Bump FACTS_VERSION when the extraction
+instruction or schema changes.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+ENABLED = os.getenv('GEMINI_DOCUMENT_FACTS', '1') == '1'
+DB_PATH = os.getenv('DOCUMENT_FACTS_PATH', '/tmp/admissions_document_facts.db')
+# Concurrent extraction calls per classification (all still go through gemini_guard)
+WORKERS = int(os.getenv('DOCUMENT_FACTS_WORKERS', '3'))
+FACTS_VERSION = '1'
+
+FACTS_SYSTEM_INSTRUCTION = """You read ONE document uploaded by an applicant to Universidad Cristiana de Logos (UCL), a Christian university, and report only what the document itself shows.
+
+- document_type: diploma, transcript, degree_certificate, ministry_certificate (ordination, license, ministry course), recommendation_letter, identification, payment_receipt, photo or other
+- degree_level: the highest level the document certifies - none, high_school, technical, bachelor, master or doctorate
+- degree_title: the degree or certificate name as written (null if none)
+- institution: the issuing school or church (null if not shown)
+- orientation: ministerial (theology, ministry, Bible, pastoral, Christian education, seminary) or secular (any other field); unknown if the document doesn't say
+- year: the year the degree was awarded or the document was issued (null if not shown)
+- notes: one short sentence on anything an admissions officer should know (illegible, incomplete, name differs from the applicant, not a translation, etc.)
+
+Do not guess: a field the document doesn't show is null or unknown."""
+
+
+def extraction_prompt(document: Dict) -> str:
+    return f"Uploaded file name: {document.get('filename') or 'unknown'}\nReport the facts of the attached document."
+
+
+def format_facts(facts: List[Dict]) -> str:
+    """Prompt section for the classification call ('' when there are no facts)"""
+    if not facts:
+        return ''
+    rows = [{'file': fact.get('filename'), **{k: v for k, v in fact.items() if k != 'filename' and v is not None}}
+            for fact in facts]
+    return ("DOCUMENT FACTS (extracted from the uploaded files - these are the documents; they are not re-attached):\n"
+            + '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\n\n')
+
+
+class FactStore:
+    """Document facts by (SHA-256, FACTS_VERSION), shared by all workers"""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS document_facts (
+                    sha256 TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    mime_type TEXT,
+                    model TEXT,
+                    facts TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, version)
+                )
+            """)
+        finally:
+            conn.close()
+
+    def get_many(self, digests: List[str]) -> Dict[str, Dict]:
+        """Stored facts for the digests that have them"""
+        if not digests:
+            return {}
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT sha256, facts FROM document_facts WHERE version = ?"
+                f" AND sha256 IN ({','.join('?' * len(digests))})",
+                (FACTS_VERSION, *digests)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {sha256: json.loads(facts) for sha256, facts in rows}
+
+    def put(self, digest: str, facts: Dict, mime_type: Optional[str] = None, model: Optional[str] = None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO document_facts (sha256, version, mime_type, model, facts, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, FACTS_VERSION, mime_type, model, json.dumps(facts, ensure_ascii=False), time.time())
+            )
+        finally:
+            conn.close()
+
+
+# Global store instance
+_store = None
+
+def get_fact_store() -> FactStore:
+    """Get the shared document fact store (singleton)"""
+    global _store
+    if _store is None:
+        _store = FactStore()
+    return _store
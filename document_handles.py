@@ -0,0 +1,218 @@
+"""
+Document Handles - Uploaded files carried by path from disk to the model call
+An uploaded_documents entry describes a file on disk instead of holding it:
+
+    {'path': '/tmp/machform_files/x.pdf', 'filename': 'x.pdf',
+     'mime_type': 'application/pdf', 'size': 10485760, 'sha256': '...'}
+
+Hashing, page counts and token estimates read the file through an mmap, and
+its bytes are copied exactly once, when the request Part is built. Files over
+GEMINI_INLINE_MAX_BYTES are not inlined at all: they are uploaded (streamed
+from disk, once per content hash) and referenced by URI - to GCS when
+GEMINI_UPLOAD_BUCKET is set, or into GEMINI_UPLOAD_DIR as a local stand-in
+for tests and offline runs. Without either, every file is inlined.
+
+Entries carrying base64 'data' (older job payloads, JSONL bundles) still work.
+"""
+
+import base64
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import structured_log
+
+log = structured_log.get_logger('classifier')
+
+# Gemini-supported MIME types only
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+EXTENSIONS = {'application/pdf': '.pdf', 'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif',
+              'image/webp': '.webp'}
+
+INLINE_MAX_BYTES = int(os.getenv('GEMINI_INLINE_MAX_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_BUCKET = os.getenv('GEMINI_UPLOAD_BUCKET', '')
+UPLOAD_PREFIX = os.getenv('GEMINI_UPLOAD_PREFIX', 'admissions-documents/')
+UPLOAD_DIR = os.getenv('GEMINI_UPLOAD_DIR', '')
+# Downsampled images / trimmed PDFs written by token_budget
+DERIVED_DIR = os.getenv('DOCUMENT_DERIVED_DIR', '/tmp/machform_files/derived')
+
+HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def from_path(path: str) -> Optional[Dict]:
+    """Handle for a downloaded file; None if Gemini can't read its type"""
+    mime_type = MIME_TYPES.get(Path(path).suffix.lower())
+    if not mime_type:
+        log.warning(f"Skipping unsupported file type for Gemini: {os.path.basename(path)}")
+        return None
+    return {
+        'path': path,
+        'filename': os.path.basename(path),
+        'mime_type': mime_type,
+        'size': os.path.getsize(path),
+        'sha256': file_digest(path),
+    }
+
+
+@contextmanager
+def view(document: Dict):
+    """
+    The document's bytes as a read-only buffer (an mmap for files on disk).
+    Only valid inside the block - don't keep slices or memoryviews of it.
+    """
+    if 'path' not in document:
+        yield base64.b64decode(document['data'])
+        return
+    with open(document['path'], 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def size(document: Dict) -> int:
+    if 'size' in document:
+        return document['size']
+    if 'path' in document:
+        return os.path.getsize(document['path'])
+    return len(base64.b64decode(document['data']))
+
+
+def digest(document: Dict) -> str:
+    """SHA-256 of the document's bytes"""
+    if document.get('sha256'):
+        return document['sha256']
+    if 'path' in document:
+        return file_digest(document['path'])
+    return hashlib.sha256(base64.b64decode(document['data'])).hexdigest()
+
+
+def write_derived(document: Dict, data: bytes, mime_type: Optional[str] = None) -> Dict:
+    """Store a shrunken copy of a document and return its handle"""
+    mime_type = mime_type or document['mime_type']
+    sha256 = hashlib.sha256(data).hexdigest()
+    Path(DERIVED_DIR).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(DERIVED_DIR, sha256 + EXTENSIONS.get(mime_type, ''))
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return {'path': path, 'filename': document.get('filename'), 'mime_type': mime_type, 'size': len(data),
+            'sha256': sha256}
+
+
+class LocalUploader:
+    """Stand-in for GCS: files are linked into a directory and referenced as file:// URIs"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def upload(self, document: Dict) -> str:
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        target = os.path.join(self.directory, digest(document) + EXTENSIONS.get(document['mime_type'], ''))
+        if not os.path.exists(target):
+            if 'path' in document:
+                try:
+                    os.link(document['path'], target)
+                except OSError:
+                    shutil.copyfile(document['path'], target)
+            else:
+                with open(target, 'wb') as f:
+                    f.write(base64.b64decode(document['data']))
+        return Path(target).as_uri()
+
+
+class GcsUploader:
+    """Uploads to gs://GEMINI_UPLOAD_BUCKET, named by content hash so each file goes up once"""
+
+    def __init__(self, bucket: str, prefix: str = UPLOAD_PREFIX):
+        self.bucket_name = bucket
+        self.prefix = prefix
+        self._bucket = None
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+            credentials_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+            if credentials_json:
+                from google.oauth2 import service_account
+                credentials = service_account.Credentials.from_service_account_info(json.loads(credentials_json))
+                client = storage.Client(project=credentials.project_id, credentials=credentials)
+            else:
+                client = storage.Client()
+            self._bucket = client.bucket(self.bucket_name)
+        return self._bucket
+
+    def upload(self, document: Dict) -> str:
+        name = self.prefix + digest(document) + EXTENSIONS.get(document['mime_type'], '')
+        blob = self._get_bucket().blob(name)
+        if not blob.exists():
+            if 'path' in document:
+                # Streams from disk in chunks
+                blob.upload_from_filename(document['path'], content_type=document['mime_type'])
+            else:
+                blob.upload_from_string(base64.b64decode(document['data']), content_type=document['mime_type'])
+            log.info("Uploaded document for Gemini", filename=document.get('filename'), bytes=size(document))
+        return f"gs://{self.bucket_name}/{name}"
+
+
+def get_uploader():
+    """The configured uploader (GCS, then the local stand-in), or None to inline everything"""
+    global _uploader
+    if _uploader is None:
+        if UPLOAD_BUCKET:
+            _uploader = GcsUploader(UPLOAD_BUCKET)
+        elif UPLOAD_DIR:
+            _uploader = LocalUploader(UPLOAD_DIR)
+    return _uploader
+
+
+def is_inline(document: Dict) -> bool:
+    """True if the document will travel inside the request rather than by URI"""
+    return size(document) <= INLINE_MAX_BYTES or get_uploader() is None
+
+
+def payload(document: Dict) -> Tuple[str, object]:
+    """('uri', uri) for uploaded documents, ('data', bytes) for inline ones (the single copy)"""
+    if not is_inline(document):
+        return 'uri', get_uploader().upload(document)
+    with view(document) as data:
+        return 'data', bytes(data)
+
+
+def to_part(document: Dict):
+    """Vertex AI Part for a document"""
+    from vertexai.generative_models import Part
+    kind, value = payload(document)
+    if kind == 'uri':
+        return Part.from_uri(value, mime_type=document['mime_type'])
+    return Part.from_data(data=value, mime_type=document['mime_type'])
+
+
+# Global uploader instance
+_uploader = None
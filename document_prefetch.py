@@ -0,0 +1,287 @@
+"""
+Document Prefetch - Download an applicant's MachForm uploads before they're needed
+Finding and downloading uploads (a MachForm DB query, an admin login, one
+entry page and one download per file) used to start only once the third form
+had arrived, serially, in front of the classification. Now every
+acknowledgment-path webhook (forms 1 and 2) queues a 'prefetch' job that
+downloads them in the background into a content-addressed cache:
+
+    DOCUMENT_CACHE_DIR/<sha256><ext>            the files, one copy per content
+    DOCUMENT_CACHE_DIR/manifests/<email>.json   per applicant: MachForm entry ->
+                                                the upload values it had and the
+                                                handles of its downloaded files
+
+The final classification runs the same collect(): the DB query is repeated
+(so uploads made since are seen), entries whose upload values are unchanged
+are served from disk, and only new or changed entries are downloaded. If a
+prefetch for the applicant is still running, collect() waits for it (up to
+DOCUMENT_PREFETCH_WAIT seconds) rather than downloading the same files twice.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import applicant_lock
+import document_handles
+import metrics
+import structured_log
+
+log = structured_log.get_logger('machform')
+
+ENABLED = os.getenv('DOCUMENT_PREFETCH', '1') == '1'
+CACHE_DIR = os.getenv('DOCUMENT_CACHE_DIR', '/tmp/machform_files/cache')
+MANIFEST_DIR = os.path.join(CACHE_DIR, 'manifests')
+# Seconds the final classification waits for a running prefetch of the same applicant
+PREFETCH_WAIT = float(os.getenv('DOCUMENT_PREFETCH_WAIT', '30'))
+# Uploads considered per applicant (as before)
+MAX_FILES = 10
+LOCK_SCOPE = 'documents'
+
+
+def entries_of(files: List[Dict]) -> Dict[str, Dict]:
+    """MachForm entries holding an applicant's uploads: 'form:entry' -> {form_id, entry_id, uploads}"""
+    entries = {}
+    for file_info in files[:MAX_FILES]:
+        if not file_info.get('entry_id'):
+            log.warning("Skipping file - no entry_id")
+            continue
+        key = f"{file_info.get('form_id')}:{file_info['entry_id']}"
+        entry = entries.setdefault(key, {'form_id': file_info.get('form_id'), 'entry_id': file_info['entry_id'],
+                                         'uploads': []})
+        entry['uploads'].append(str(file_info.get('hashed_filename')))
+    for entry in entries.values():
+        entry['uploads'].sort()
+    return entries
+
+
+# --- CACHE ---
+
+def _manifest_path(email: str) -> str:
+    key = hashlib.sha256(applicant_lock.normalize_email(email).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(MANIFEST_DIR, f"{key}.json")
+
+
+def load_manifest(email: str) -> Dict:
+    try:
+        with open(_manifest_path(email), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'entries': {}}
+
+
+def _save_manifest(email: str, manifest: Dict):
+    Path(MANIFEST_DIR).mkdir(parents=True, exist_ok=True)
+    path = _manifest_path(email)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def record(email: str, key: str, entry: Dict, documents: List[Dict]):
+    """Remember an entry's downloaded files (re-read first: another worker may have added entries)"""
+    manifest = load_manifest(email)
+    manifest['entries'][key] = {'uploads': entry['uploads'], 'documents': documents, 'fetched_at': time.time()}
+    try:
+        _save_manifest(email, manifest)
+    except OSError as e:
+        log.warning(f"Could not save document manifest: {e}")
+
+
+def split(email: str, entries: Dict[str, Dict]) -> Tuple[Dict[str, List[Dict]], List[str]]:
+    """({key: documents} for entries already on disk, [keys of entries to download])"""
+    cached, stale = {}, []
+    known = load_manifest(email)['entries']
+    for key, entry in entries.items():
+        previous = known.get(key)
+        if (previous and previous['uploads'] == entry['uploads']
+                and all(os.path.exists(doc['path']) for doc in previous['documents'])):
+            cached[key] = previous['documents']
+        else:
+            stale.append(key)
+    return cached, stale
+
+
+def store(path: str, filename: str) -> Optional[Dict]:
+    """Move a downloaded file into the cache under its content hash; its handle, or None if Gemini can't read it"""
+    suffix = Path(filename).suffix.lower()
+    sha256 = document_handles.file_digest(path)
+    target = os.path.join(CACHE_DIR, sha256 + suffix)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.replace(path, target)
+    if suffix not in document_handles.MIME_TYPES:
+        log.debug(f"Not sendable to Gemini: {filename[:40]}")
+        return None
+    return {'path': target, 'filename': filename, 'mime_type': document_handles.MIME_TYPES[suffix],
+            'size': os.path.getsize(target), 'sha256': sha256}
+
+
+def _incoming_dir() -> str:
+    """Private download directory (same filesystem as the cache, so store() is a rename)"""
+    incoming = os.path.join(CACHE_DIR, 'incoming')
+    Path(incoming).mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(dir=incoming)
+
+
+def _finish(email: str, key: str, entry: Dict, links: List[Dict], paths: List[Optional[str]]) -> List[Dict]:
+    """Store an entry's downloads; it is only remembered when every file arrived"""
+    documents = []
+    for link, path in zip(links, paths):
+        if path:
+            document = store(path, link['filename'])
+            if document:
+                documents.append(document)
+    missing = sum(1 for path in paths if not path)
+    if links and not missing:
+        record(email, key, entry, documents)
+        metrics.DOCUMENT_FETCH_TOTAL.inc(len(paths), outcome='downloaded')
+    else:
+        # Not remembered, so the next collect() tries the entry again
+        metrics.DOCUMENT_FETCH_TOTAL.inc(missing or 1, outcome='failed')
+    return documents
+
+
+def _ordered(entries: Dict[str, Dict], found: Dict[str, List[Dict]]) -> List[Dict]:
+    return [document for key in sorted(entries) for document in found.get(key, [])]
+
+
+def _report(email: str, phase: str, entries: Dict, cached: Dict, documents: List[Dict], started: float):
+    reused = sum(len(found) for found in cached.values())
+    metrics.DOCUMENT_FETCH_TOTAL.inc(reused, outcome='cached')
+    log.info(f"Documents for {email}: {len(documents)} ({reused} from cache)", phase=phase, entries=len(entries),
+             downloaded_entries=len(entries) - len(cached), seconds=round(time.perf_counter() - started, 3))
+
+
+# --- COLLECT ---
+
+def collect(mf, email: str, phase: str = 'final') -> Tuple[List[Dict], List[Dict]]:
+    """
+    (uploaded files, document handles) for an applicant, with machform_client's
+    MachFormClient: cached entries from disk, the rest downloaded.
+    """
+    started = time.perf_counter()
+    files = mf.get_files_by_email(email)
+    if not files:
+        return [], []
+    entries = entries_of(files)
+    with _documents_lock(email):
+        cached, stale = split(email, entries)
+        found = dict(cached)
+        for key in stale:
+            entry = entries[key]
+            links = mf.get_download_links_from_entry(entry['form_id'], entry['entry_id'])
+            incoming = _incoming_dir()
+            try:
+                # A directory per file: two uploads may share a name
+                paths = [mf.download_file_from_link(link['url'], link['filename'],
+                                                    save_dir=os.path.join(incoming, str(index)))
+                         for index, link in enumerate(links)]
+                found[key] = _finish(email, key, entry, links, paths)
+            finally:
+                shutil.rmtree(incoming, ignore_errors=True)
+    documents = _ordered(entries, found)
+    _report(email, phase, entries, cached, documents, started)
+    return files, documents
+
+
+async def collect_async(mf, email: str, phase: str = 'final') -> Tuple[List[Dict], List[Dict]]:
+    """collect() with async_clients' AsyncMachFormClient; entries and their files download concurrently"""
+    started = time.perf_counter()
+    files = await mf.get_files_by_email(email)
+    if not files:
+        return [], []
+    entries = entries_of(files)
+
+    async def fetch(key):
+        entry = entries[key]
+        links = await mf.get_download_links_from_entry(entry['form_id'], entry['entry_id'])
+        incoming = await asyncio.to_thread(_incoming_dir)
+        try:
+            paths = await asyncio.gather(*(mf.download_file_from_link(link['url'], link['filename'],
+                                                                      save_dir=os.path.join(incoming, str(index)))
+                                           for index, link in enumerate(links)))
+            return key, await asyncio.to_thread(_finish, email, key, entry, links, list(paths))
+        finally:
+            await asyncio.to_thread(shutil.rmtree, incoming, True)
+
+    async with _documents_lock_async(email):
+        cached, stale = await asyncio.to_thread(split, email, entries)
+        found = dict(cached)
+        found.update(await asyncio.gather(*(fetch(key) for key in stale)))
+    documents = _ordered(entries, found)
+    _report(email, phase, entries, cached, documents, started)
+    return files, documents
+
+
+@contextmanager
+def _documents_lock(email: str):
+    """The applicant's document lock - or none once PREFETCH_WAIT has passed (the cache tolerates races)"""
+    lock = applicant_lock.applicant_lock(email, timeout=PREFETCH_WAIT, scope=LOCK_SCOPE)
+    try:
+        lock.__enter__()
+    except applicant_lock.LockTimeout:
+        log.warning("Document prefetch still running - fetching without waiting")
+        yield
+        return
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
+
+
+@asynccontextmanager
+async def _documents_lock_async(email: str):
+    lock = applicant_lock.applicant_lock_async(email, timeout=PREFETCH_WAIT, scope=LOCK_SCOPE)
+    try:
+        await lock.__aenter__()
+    except applicant_lock.LockTimeout:
+        log.warning("Document prefetch still running - fetching without waiting")
+        yield
+        return
+    try:
+        yield
+    finally:
+        await lock.__aexit__(None, None, None)
+
+
+# --- PREFETCH JOB ---
+
+def prefetch(email: str) -> Dict:
+    """
+    Job handler body: download (and prepare) an applicant's uploads ahead of the
+    final classification. Best effort - failures are logged, never retried.
+    """
+    try:
+        from machform_client import MachFormClient
+        import document_prep
+        import gemini_classifier
+        _, documents = collect(MachFormClient(), email, phase='prefetch')
+        # Prepared copies are indexed by content hash too, so the final run reuses them
+        document_prep.prepare_all(documents[:gemini_classifier.MAX_DOCUMENTS])
+        return {'status': 'success', 'documents': len(documents)}
+    except Exception as e:
+        log.warning(f"Document prefetch failed: {e}")
+        return {'status': 'error', 'message': str(e)}
+
+
+async def prefetch_async(mf, email: str) -> Dict:
+    """prefetch() for the ASGI service's job workers"""
+    try:
+        import document_prep
+        import gemini_classifier
+        _, documents = await collect_async(mf, email, phase='prefetch')
+        await asyncio.to_thread(document_prep.prepare_all, documents[:gemini_classifier.MAX_DOCUMENTS])
+        return {'status': 'success', 'documents': len(documents)}
+    except Exception as e:
+        log.warning(f"Document prefetch failed: {e}")
+        return {'status': 'error', 'message': str(e)}
@@ -0,0 +1,292 @@
+"""
+Document Prep - Shrink uploaded images and PDFs before they reach Gemini
+Phone photos of diplomas and scanned transcripts arrive as multi-megabyte
+files. Right after download, each one is prepared in a process pool (the work
+is CPU-bound and would otherwise hold the GIL in a request worker):
+
+    images  EXIF-rotated, scaled to DOCUMENT_IMAGE_MAX_SIDE (two 768px tiles,
+            small print stays legible) and re-encoded as JPEG
+    PDFs    cut to the DOCUMENT_PDF_MAX_PAGES most relevant pages (pages that
+            mention grades, credits, degrees...; the first pages for scans),
+            content streams compressed and embedded scans re-encoded; a PDF
+            still over DOCUMENT_PDF_MAX_BYTES is rasterized to grayscale pages
+            at DOCUMENT_PDF_DPI when pypdfium2 is installed
+
+Results are written next to token_budget's derived files and indexed by the
+source's content hash and these settings, so a file is prepared once per host.
+A result that isn't smaller than the original is discarded, and any failure
+or timeout sends the original. Pillow and pypdf (and pypdfium2) are optional;
+without them documents pass through unchanged.
+"""
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import document_handles
+import metrics
+import structured_log
+
+log = structured_log.get_logger('documents')
+
+ENABLED = os.getenv('DOCUMENT_PREP', '1') == '1'
+WORKERS = int(os.getenv('DOCUMENT_PREP_WORKERS', '2'))
+# Seconds to wait for one applicant's documents before sending the originals
+TIMEOUT = float(os.getenv('DOCUMENT_PREP_TIMEOUT', '60'))
+IMAGE_MAX_SIDE = int(os.getenv('DOCUMENT_IMAGE_MAX_SIDE', '1536'))
+JPEG_QUALITY = int(os.getenv('DOCUMENT_JPEG_QUALITY', '85'))
+# Smaller images are already cheap to send
+IMAGE_MIN_BYTES = int(os.getenv('DOCUMENT_IMAGE_MIN_BYTES', str(256 * 1024)))
+PDF_MAX_PAGES = int(os.getenv('DOCUMENT_PDF_MAX_PAGES', '12'))
+PDF_MAX_BYTES = int(os.getenv('DOCUMENT_PDF_MAX_BYTES', str(4 * 1024 * 1024)))
+PDF_DPI = int(os.getenv('DOCUMENT_PDF_DPI', '150'))
+INDEX_DIR = os.path.join(document_handles.DERIVED_DIR, 'prep')
+
+# Bump when the output of _prepare changes, so cached results are redone
+PREP_VERSION = '1'
+SETTINGS = {'version': PREP_VERSION, 'image_max_side': IMAGE_MAX_SIDE, 'jpeg_quality': JPEG_QUALITY,
+            'pdf_max_pages': PDF_MAX_PAGES, 'pdf_max_bytes': PDF_MAX_BYTES, 'pdf_dpi': PDF_DPI}
+SETTINGS_KEY = hashlib.sha256(json.dumps(SETTINGS, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+# Words that mark the pages of a transcript or diploma worth keeping
+RELEVANT = re.compile(r'calificaci|nota|promedio|cr[eé]dito|asignatura|materia|semestre|t[ií]tulo|diploma|grado|'
+                      r'licenciatura|maestr|bachiller|certific|grade|gpa|credit|course|transcript|degree', re.I)
+
+
+# --- WORKER SIDE (runs in the process pool; returns results instead of logging) ---
+
+def _prepare_image(document: Dict) -> Optional[Dict]:
+    from PIL import Image, ImageOps
+    if document['size'] < IMAGE_MIN_BYTES:
+        return None
+    with Image.open(document['path']) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    if out.tell() >= document['size']:
+        return None
+    return document_handles.write_derived(document, out.getvalue(), 'image/jpeg')
+
+
+def _relevant_pages(reader) -> List[int]:
+    """Indexes of the pages to keep, in document order"""
+    if len(reader.pages) <= PDF_MAX_PAGES:
+        return list(range(len(reader.pages)))
+    scores = []
+    for index, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ''
+        except Exception:
+            text = ''
+        scores.append((len(RELEVANT.findall(text)), -index))
+    if not any(score for score, _ in scores):
+        # Scanned (no text layer): the first pages usually hold the summary
+        return list(range(PDF_MAX_PAGES))
+    return sorted(-negative_index for _, negative_index in sorted(scores, reverse=True)[:PDF_MAX_PAGES])
+
+
+def _rasterize(path: str, pages: List[int]) -> Optional[bytes]:
+    """Grayscale JPEG pages at PDF_DPI packed into a PDF; None without pypdfium2"""
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        images = [pdf[index].render(scale=PDF_DPI / 72).to_pil().convert('L') for index in pages]
+    finally:
+        pdf.close()
+    out = io.BytesIO()
+    images[0].save(out, format='PDF', save_all=True, append_images=images[1:], resolution=PDF_DPI,
+                   quality=JPEG_QUALITY)
+    return out.getvalue()
+
+
+def _prepare_pdf(document: Dict) -> Optional[Dict]:
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(document['path'])
+    pages = _relevant_pages(reader)
+    if len(pages) == len(reader.pages) and document['size'] <= PDF_MAX_BYTES:
+        return None
+
+    writer = PdfWriter()
+    for index in pages:
+        writer.add_page(reader.pages[index])
+    for page in writer.pages:
+        page.compress_content_streams()
+        for image in page.images:
+            try:
+                if max(image.image.size) > IMAGE_MAX_SIDE or len(image.data) > IMAGE_MIN_BYTES:
+                    scaled = image.image.convert('RGB') if image.image.mode not in ('RGB', 'L') else image.image
+                    scaled.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+                    image.replace(scaled, quality=JPEG_QUALITY)
+            except Exception:
+                continue  # unusual image encodings stay as they are
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    out = io.BytesIO()
+    writer.write(out)
+    data = out.getvalue()
+
+    if len(data) > PDF_MAX_BYTES:
+        rasterized = _rasterize(document['path'], pages)
+        if rasterized and len(rasterized) < len(data):
+            data = rasterized
+    if len(data) >= document['size'] and len(pages) == len(reader.pages):
+        return None
+    return document_handles.write_derived(document, data)
+
+
+def _prepare(document: Dict) -> Dict:
+    """Prepare one document; returns {'document': handle or None, 'seconds', 'error'}"""
+    started = time.perf_counter()
+    result = {'document': None, 'error': None}
+    try:
+        if document['mime_type'] == 'application/pdf':
+            result['document'] = _prepare_pdf(document)
+        elif document['mime_type'].startswith('image/'):
+            result['document'] = _prepare_image(document)
+    except ImportError as e:
+        result['skipped'] = f"{e.name} is not installed"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+# --- CALLER SIDE ---
+
+def _index_path(document: Dict) -> str:
+    return os.path.join(INDEX_DIR, f"{document_handles.digest(document)}-{SETTINGS_KEY}.json")
+
+
+def _cached(document: Dict) -> Optional[Dict]:
+    """
+    {'document': handle or None} from an earlier run, or None if the source
+    hasn't been prepared with these settings (or its output has been cleaned up)
+    """
+    try:
+        with open(_index_path(document), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    prepared = entry.get('document')
+    if prepared and not os.path.exists(prepared['path']):
+        return None
+    if prepared:
+        prepared = {**prepared, 'filename': document.get('filename')}
+    return {'document': prepared}
+
+
+def _store(document: Dict, prepared: Optional[Dict]):
+    Path(INDEX_DIR).mkdir(parents=True, exist_ok=True)
+    path = _index_path(document)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'document': prepared, 'source_bytes': document['size']}, f)
+    os.replace(tmp_path, path)
+
+
+def _record(document: Dict, prepared: Optional[Dict], outcome: str):
+    metrics.DOCUMENT_PREP_TOTAL.inc(mime_type=document['mime_type'], outcome=outcome)
+    metrics.DOCUMENT_PREP_BYTES.inc(document['size'], direction='in')
+    metrics.DOCUMENT_PREP_BYTES.inc((prepared or document)['size'], direction='out')
+
+
+def prepare_all(documents: Optional[List[Dict]]) -> Optional[List[Dict]]:
+    """
+    Prepared handles for a list of uploaded_documents entries, in the same order.
+    Entries without a file on disk (inline base64) are passed through.
+    """
+    if not ENABLED or not documents:
+        return documents
+
+    results: List[Optional[Dict]] = [None] * len(documents)
+    pending = {}
+    for index, document in enumerate(documents):
+        if 'path' not in document:
+            results[index] = document
+            continue
+        cached = _cached(document)
+        if cached is not None:
+            results[index] = cached['document'] or document
+            _record(document, cached['document'], 'cached')
+        else:
+            pending[index] = document
+
+    if pending:
+        deadline = time.perf_counter() + TIMEOUT
+        try:
+            futures = {index: get_pool().submit(_prepare, document) for index, document in pending.items()}
+        except (BrokenProcessPool, RuntimeError) as e:
+            _reset_pool()
+            log.warning(f"Document prep pool unavailable - sending originals: {e}")
+            futures = {}
+        for index, document in pending.items():
+            outcome, prepared = 'failed', None
+            result = _wait(futures[index], deadline) if index in futures else {'error': 'pool unavailable'}
+            if result.get('skipped'):
+                # Not indexed, so installing the dependency takes effect right away
+                outcome = 'skipped'
+                log.debug(f"Document prep skipped: {result['skipped']}", filename=document.get('filename'))
+            elif result.get('error'):
+                log.warning(f"Could not prepare {document.get('filename')}: {result['error']}",
+                            bytes=document['size'])
+            else:
+                prepared = result['document']
+                outcome = 'shrunk' if prepared else 'unchanged'
+                metrics.DOCUMENT_PREP_SECONDS.observe(result['seconds'], mime_type=document['mime_type'])
+                try:
+                    _store(document, prepared)
+                except OSError as e:
+                    log.warning(f"Could not index prepared document: {e}")
+            results[index] = prepared or document
+            _record(document, prepared, outcome)
+
+    bytes_in = sum(document_handles.size(doc) for doc in documents)
+    bytes_out = sum(document_handles.size(doc) for doc in results)
+    log.info(f"Prepared {len(documents)} documents: {bytes_in // 1024} KB -> {bytes_out // 1024} KB",
+             prepared=len(pending), cached=len(documents) - len(pending))
+    return results
+
+
+def _wait(future, deadline: float) -> Dict:
+    try:
+        return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+    except FutureTimeout:
+        future.cancel()
+        return {'error': 'timed out'}
+    except BrokenProcessPool:
+        _reset_pool()
+        return {'error': 'worker crashed'}
+
+
+# Global pool instance
+_pool = None
+
+def get_pool() -> ProcessPoolExecutor:
+    """Get this process's document prep pool (started on first use)"""
+    global _pool
+    if _pool is None:
+        # Fresh interpreters, not forks of a threaded worker. They re-import the main module, which for
+        # `python app.py` would start job workers in every prep process - keep those off.
+        os.environ['JOB_WORKERS_AUTOSTART'] = '0'
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,25 +1,16 @@
 import resend
 import os
+import rate_limit
+import metrics
+import structured_log
 
-def send_email_with_attachment(recipient, student_data, classification=None, docx_path=None, email_type="final", missing_forms=None, form_count=0):
-    # Debug: print all environment variables that start with RESEND or GEMINI
-    print("[DEBUG] Environment variables:")
-    for key in os.environ:
-        if 'RESEND' in key or 'GEMINI' in key or 'GMAIL' in key or 'RECIPIENT' in key:
-            value = os.environ[key]
-            print(f"  {key} = {value[:15]}..." if len(value) > 15 else f"  {key} = {value}")
-    
-    api_key = os.getenv('RESEND_API_KEY')
-    
-    if not api_key:
-        print("[EMAIL] Missing Resend API key - skipping email")
-        print(f"[EMAIL] Checked for: RESEND_API_KEY")
-        return False
-    
-    print(f"[EMAIL] API key found: {api_key[:10]}...")
-    
-    resend.api_key = api_key
-    
+log = structured_log.get_logger('email')
+
+def build_email_messages(recipient, student_data, classification=None, docx_path=None, email_type="final", missing_forms=None, form_count=0):
+    """
+    Build the Resend request bodies for an email (one per testing recipient).
+    Shared by the sync sender below and the async service (asgi_app).
+    """
     # Use Resend's test domain
     sender_email = "onboarding@resend.dev"
     
@@ -59,7 +50,7 @@ def send_email_with_attachment(recipient, student_data, classification=None, doc
         </html>
         """
         attachments = []
-        print(f"[EMAIL] Prepared ACKNOWLEDGMENT email for {recipient}")
+        log.debug(f"Prepared ACKNOWLEDGMENT email for {recipient}")
         
     elif email_type == "duplicate_warning":
         # EMAIL TYPE 3: Duplicate Warning
@@ -86,7 +77,7 @@ def send_email_with_attachment(recipient, student_data, classification=None, doc
         </html>
         """
         attachments = []
-        print(f"[EMAIL] Prepared DUPLICATE WARNING email for {recipient}")
+        log.debug(f"Prepared DUPLICATE WARNING email for {recipient}")
 
     else:
         # EMAIL TYPE 2: Final Classification (Form 3)
@@ -132,36 +123,52 @@ def send_email_with_attachment(recipient, student_data, classification=None, doc
                     "content": list(file_content),
                 }]
             except Exception as e:
-                print(f"[EMAIL] Error loading attachment: {e}")
+                log.error(f"Error loading attachment: {e}")
         
-        print(f"[EMAIL] Prepared FINAL email for {recipient}")
+        log.debug(f"Prepared FINAL email for {recipient}")
 
     # TESTING MODE: Override recipient
     original_recipient = recipient
     # NOTE: Resend's onboading domain only allows sending to the account owner (web@logos.edu)
     testing_recipients = ['web@logos.edu']
     
-    print(f"[EMAIL] Original recipient: {original_recipient}")
-    print(f"[EMAIL] Overriding to testing recipients: {testing_recipients}")
+    log.debug(f"Overriding recipient {original_recipient} with testing recipients: {testing_recipients}")
     
-    results = []
+    messages = []
     for test_email in testing_recipients:
+        messages.append({
+            "from": f"UCL Admissions <{sender_email}>",
+            "to": [test_email],
+            "subject": f"[TEST - Original: {original_recipient}] {subject}",
+            "html": html_body,
+            "attachments": attachments
+        })
+    return messages
+
+
+def send_email_with_attachment(recipient, student_data, classification=None, docx_path=None, email_type="final", missing_forms=None, form_count=0):
+    api_key = os.getenv('RESEND_API_KEY')
+    
+    if not api_key:
+        log.warning("Missing Resend API key (RESEND_API_KEY) - skipping email")
+        return False
+    
+    resend.api_key = api_key
+    
+    messages = build_email_messages(recipient, student_data, classification, docx_path, email_type, missing_forms, form_count)
+    
+    results = []
+    for params in messages:
+        test_email = params["to"][0]
         try:
-            print(f"[EMAIL] Sending via Resend to {test_email}...")
-            
-            params = {
-                "from": f"UCL Admissions <{sender_email}>",
-                "to": [test_email],
-                "subject": f"[TEST - Original: {original_recipient}] {subject}",
-                "html": html_body,
-                "attachments": attachments
-            }
-            
-            response = resend.Emails.send(params)
-            print(f"[EMAIL] ✓ Successfully sent to {test_email}! ID: {response['id']}")
+            
+            rate_limit.acquire('resend')
+            with metrics.external_call('resend', 'send'):
+                response = resend.Emails.send(params)
+            log.info(f"✓ Sent {email_type} email", recipient=test_email, resend_id=response['id'])
             results.append(True)
         except Exception as e:
-            print(f"[EMAIL] ✗ Error sending to {test_email}: {str(e)}")
+            log.error(f"✗ Error sending to {test_email}: {str(e)}")
             results.append(False)
             
     return any(results)
\ No newline at end of file
@@ -8,6 +8,9 @@ import estados_unidos
 import latinoamerica
 import experiencia_ministerial
 import recomendacion_pastoral
+import structured_log
+
+log = structured_log.get_logger('detector')
 
 # Registry of all forms - ORDER MATTERS!
 # Put most specific forms first
@@ -40,7 +43,7 @@ def detect_form(raw_data: dict) -> dict:
         
         # If most detection fields match, this is likely the form
         if matches >= len(detection_fields) * 0.6:  # 60% match threshold
-            print(f"[DETECTOR] Detected: {config['form_name']} (Method 1: detection_fields)")
+            log.info(f"Detected: {config['form_name']} (Method 1: detection_fields)")
             return form_module
     
     # Method 2: Check field mappings overlap
@@ -61,11 +64,11 @@ def detect_form(raw_data: dict) -> dict:
             best_match = form_module
     
     if best_score >= 0.3:  # 30% of fields match
-        print(f"[DETECTOR] Detected: {best_match.FORM_CONFIG['form_name']} (Method 2: field overlap, score: {best_score:.2f})")
+        log.info(f"Detected: {best_match.FORM_CONFIG['form_name']} (Method 2: field overlap, score: {best_score:.2f})")
         return best_match
     
     # Could not detect
-    print(f"[DETECTOR] ⚠️ Could not identify form type (best score: {best_score:.2f})")
+    log.warning(f"⚠️ Could not identify form type (best score: {best_score:.2f})")
     return None
 
 
@@ -89,7 +92,7 @@ def extract_student_data(raw_data: dict, forced_module=None) -> dict:
         return form_module.extract_student_data(raw_data)
     else:
         # Fallback: return raw data with basic structure
-        print("[DETECTOR] Using fallback extraction")
+        log.info("Using fallback extraction")
         return {
             "form_id": "unknown",
             "form_name": "Unknown Form",
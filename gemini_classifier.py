@@ -3,286 +3,42 @@ Enhanced Multi-Form Classifier
 Combines data from multiple forms for comprehensive classification
 """
 
-import vertexai
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
+import asyncio
+import contextvars
 import os
 import json
-from google.oauth2 import service_account
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 from application_tracker import get_tracker, ApplicationStatus
-import base64
-from pathlib import Path
-
-def process_file_for_gemini(file_path):
-    """Convert file to format Gemini can process"""
-    try:
-        ext = Path(file_path).suffix.lower()
-        # Gemini-supported MIME types only
-        mime_types = {
-            '.pdf': 'application/pdf',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        
-        mime_type = mime_types.get(ext)
-        
-        if not mime_type:
-            print(f"[CLASSIFIER] Skipping unsupported file type for Gemini: {os.path.basename(file_path)}")
-            return None
-        
-        # Read file
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        # Convert to base64
-        file_b64 = base64.b64encode(file_data).decode('utf-8')
-        
-        return {
-            'mime_type': mime_type,
-            'data': file_b64,
-            'filename': os.path.basename(file_path)
-        }
-        
-    except Exception as e:
-        print(f"[CLASSIFIER] Error reading file {file_path}: {e}")
-        return None
-
-
-class MultiFormClassifier:
-    """
-    Enhanced classifier that can work with:
-    1. Single form (initial classification)
-    2. Multiple forms (final comprehensive classification)
-    """
-    
-    def __init__(self):
-        # Initialize Vertex AI with project credentials
-        project_id = os.getenv('GOOGLE_CLOUD_PROJECT', 'gen-lang-client-0586026725')
-        location = os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1')
-        
-        print(f"[CLASSIFIER] Initializing Vertex AI: {project_id} / {location}")
-        
-        # Load credentials from environment variable
-        credentials_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-        
-        if credentials_json:
-            # Parse JSON and create credentials object
-            try:
-                credentials_info = json.loads(credentials_json)
-                credentials = service_account.Credentials.from_service_account_info(credentials_info)
-                vertexai.init(project=project_id, location=location, credentials=credentials)
-                print("[CLASSIFIER] Using service account credentials")
-            except Exception as e:
-                print(f"[CLASSIFIER] Error loading service account credentials: {e}")
-                vertexai.init(project=project_id, location=location)
-        else:
-            # Fallback to default credentials (for local development)
-            vertexai.init(project=project_id, location=location)
-            print("[CLASSIFIER] Using default credentials")
-        
-        # Use Gemini 1.5 Flash via Vertex AI
-        self.model = GenerativeModel('gemini-2.5-flash')
-        self.tracker = get_tracker()
-    
-    def classify_single_form(self, student_data: Dict) -> Dict:
-        """
-        Initial classification based on a single form (Solicitud Oficial).
-        This is the STAGE 1 classification - preliminary assessment.
-        """
-        prompt = self._build_single_form_prompt(student_data)
-        
-        try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            classification = json.loads(response_text)
-            classification['classification_type'] = 'preliminary'
-            classification['stage'] = 1
-            
-            print(f"[CLASSIFIER] Stage 1 - Preliminary: {classification['recommended_level']}")
-            return classification
-            
-        except Exception as e:
-            print(f"[CLASSIFIER] Stage 1 failed: {str(e)}")
-            return self._get_fallback_classification()
-    
-    def classify_multi_form(self, email: str, student_data: Dict, all_submissions: List = None) -> Dict:
-        """
-        Final classification based on ALL submitted forms.
-        This is the STAGE 2 classification - comprehensive assessment.
-        
-        Args:
-            email: Applicant email
-            student_data: Basic student data
-            all_submissions: Optional list of Salesforce Form_Submission objects
-        """
-        # Option A: Use Salesforce data (Preferred)
-        if all_submissions and len(all_submissions) >= 3:
-            print(f"[CLASSIFIER] Using Stage 2 (comprehensive - {len(all_submissions)} forms from Salesforce)")
-            
-            # Create a temporary app context structure from Salesforce data
-            # This avoids rewriting the prompt builder
-            parsed_submissions = []
-            for sub in all_submissions:
-                try:
-                    # Parse the JSON string back to dict
-                    form_data = json.loads(sub.get('Form_Data_JSON__c', '{}'))
-                    
-                    parsed_submissions.append({
-                        'form_type': sub.get('Form_Type__c'),
-                        'form_name': sub.get('Form_Type__c'),
-                        'submitted_at': sub.get('Submission_Date__c'),
-                        'data_snapshot': {
-                            'program_interest': form_data.get('element_3', 'N/A'), # Example mappings
-                            'education_level': form_data.get('element_4', 'N/A'),
-                            'raw_data': form_data
-                        }
-                    })
-                except Exception as e:
-                    print(f"[CLASSIFIER] Error parsing submission: {e}")
-
-            # Mock an app object structure for the prompt builder
-            class MockApp:
-                def __init__(self):
-                    self.forms_submitted = []
-                    self.created_at = "N/A"
-                    self.updated_at = "N/A"
-                    self.status = "Complete"
-                    self.required_forms = ["Solicitud Oficial", "Experiencia Ministerial", "Recomendación Pastoral"]
-
-            app = MockApp()
-            # Add simple objects that behave like FormSubmission
-            for ps in parsed_submissions:
-                class MockSubmission:
-                    def __init__(self, data):
-                        self.form_type = data['form_type']
-                        self.form_name = data['form_name']
-                        self.submitted_at = data['submitted_at']
-                        self.data_snapshot = data['data_snapshot']['raw_data'] # Use full data
-                
-                app.forms_submitted.append(MockSubmission(ps))
-                
-        # Option B: Fallback to local tracker
-        else:
-            print("[CLASSIFIER] Salesforce data missing/incomplete - falling back to local tracker")
-            app = self.tracker.get_application(email)
-            
-            if not app or not self.tracker.is_application_complete(email):
-                print("[CLASSIFIER] Cannot do Stage 2 - application incomplete")
-                return self.classify_single_form(student_data)
-        
-        # Build enriched prompt with ALL form data
-        prompt = self._build_multi_form_prompt(app, student_data)
-        
-        try:
-            # Build message content with files
-            # NOTE: When documents are included, everything in the list must be a Part object
-            message_content = [Part.from_text(prompt)]
-
-            # Add uploaded documents if available
-            if student_data.get('uploaded_documents'):
-                for doc in student_data['uploaded_documents']:
-                    # Use Part object for multimodal input
-                    message_content.append(
-                        Part.from_data(
-                            data=base64.b64decode(doc['data']),
-                            mime_type=doc['mime_type']
-                        )
-                    )
-                print(f"[CLASSIFIER] Including {len(student_data['uploaded_documents'])} documents in analysis")
-
-            # Then call Gemini with message_content instead of just prompt_text
-            response = self.model.generate_content(message_content)
-            response_text = response.text
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            classification = json.loads(response_text)
-            classification['classification_type'] = 'comprehensive'
-            classification['stage'] = 2
-            classification['forms_analyzed'] = len(app.forms_submitted)
-            
-            print(f"[CLASSIFIER] Stage 2 - Comprehensive: {classification['recommended_level']}")
-            return classification
-            
-        except Exception as e:
-            print(f"[CLASSIFIER] Stage 2 failed: {str(e)}")
-            # Fall back to Stage 1
-            return self.classify_single_form(student_data)
-    
-    def _build_single_form_prompt(self, student_data: Dict) -> str:
-        """Build prompt for single-form classification (Stage 1)"""
-        return f"""You are an academic advisor for Universidad Cristiana de Logos (UCL). Evaluate and recommend the appropriate academic level and program.
-
-ACADEMIC LEVELS:
-- Certificación Básica - Minimal formal education or new to theological studies
-- Pregrado - Bachelor's level (requires secondary education)
-- Postgrado - Master's level (requires undergraduate degree)
-- Doctorado - Doctoral programs (requires master's degree)
-
-AVAILABLE PROGRAMS:
-CERTIFICACIÓN BÁSICA:
-- Certificado en Estudios Bíblicos
-- Certificado en Ministerio Cristiano
-
-PREGRADO:
-- Licenciatura en Teología
-- Licenciatura en Ministerio Pastoral
-- Licenciatura en Consejería Cristiana
-- Licenciatura en Educación Cristiana
-- Licenciatura en Liderazgo y Administración Ministerial
-
-POSTGRADO:
-- Maestría en Divinidad
-- Maestría en Teología
-- Maestría en Liderazgo Ministerial
-- Maestría en Consejería Pastoral
-
-DOCTORADO:
-- Doctorado en Ministerio (D.Min)
-- Doctorado en Teología (Th.D)
-
-STUDENT DATA (PRELIMINARY - from initial form only):
-Name: {student_data['applicant_name']}
-Form: {student_data.get('form_name', 'N/A')}
-Program Interest: {student_data['program_interest']}
-Education Level: {student_data['education_level']}
-Study Level Selected: {student_data.get('study_level_selected', 'N/A')}
-Ministerial Experience: {student_data['ministerial_experience']}
-Background: {student_data['background']}
-
-NOTE: This is a PRELIMINARY assessment based on ONE form only. 
-The applicant needs to submit additional forms (Experiencia Ministerial, Recomendación Pastoral) 
-for a comprehensive evaluation.
-
-Return ONLY valid JSON without any markdown formatting:
-{{
-  "recommended_level": "level here",
-  "recommended_programs": ["program 1", "program 2"],
-  "justification": "explanation here",
-  "admissions_notes": "This is a PRELIMINARY recommendation. Applicant must submit: Formulario de Experiencia Ministerial and Formulario de Recomendación Pastoral for final evaluation.",
-  "confidence_score": 6,
-  "pending_documents": ["Experiencia Ministerial", "Recomendación Pastoral"]
-}}"""
-    
-    def _build_multi_form_prompt(self, app, student_data: Dict) -> str:
-        """Build prompt for multi-form classification (Stage 2)"""
-        
-        # Extract info from each form
-        forms_data = {}
-        for form_sub in app.forms_submitted:
-            forms_data[form_sub.form_type] = {
-                'form_name': form_sub.form_name,
-                'submitted_at': form_sub.submitted_at,
-                'data': form_sub.data_snapshot
-            }
-        
-        # Build comprehensive prompt
-        prompt = f"""You are an academic advisor for Universidad Cristiana de Logos (UCL). Perform a COMPREHENSIVE evaluation based on ALL submitted forms and documents.
+import rate_limit
+import gemini_guard
+import metrics
+import gemini_model
+import classification_cache
+import token_budget
+import structured_output
+import admission_rules
+import document_facts
+import document_handles
+import document_prefetch
+import document_prep
+import structured_log
+
+log = structured_log.get_logger('classifier')
+
+# Part of every classification cache key - bump when the prompt templates or
+# response parsing change so results from the old prompts are not reused
+PROMPT_VERSION = '4'
+
+# Downloaded files offered to token_budget per classification
+MAX_DOCUMENTS = int(os.getenv('GEMINI_MAX_DOCUMENTS', '5'))
+
+# Stage 2 admission rules, output format and worked examples. Identical for
+# every applicant, so it is sent as the model's system instruction: built once
+# per process, and first in every request so Gemini's prefix caching applies.
+MULTI_FORM_SYSTEM_INSTRUCTION = """You are an academic advisor for Universidad Cristiana de Logos (UCL). Perform a COMPREHENSIVE evaluation based on ALL submitted forms and documents.
 
 ## Official UCL Admission Requirements
 
@@ -395,6 +151,10 @@ BEFORE classifying, CHECK:
 2. Are required documents for target level provided?
 3. Are TRANSCRIPTS provided or just claims?
 
+Uploaded documents usually arrive as DOCUMENT FACTS: one line per file, read
+from the file itself. They count as provided documents (a transcript fact is a
+transcript); compare them with what the forms claim.
+
 CLASSIFICATION RULES:
 - All documents verified → High confidence (85-100%)
 - Some documents, verbal claims → Medium confidence (60-84%)
@@ -421,44 +181,24 @@ Many of our successful students followed this path and are now thriving in advan
 IMPORTANT: Provide 2-3 program options when qualified, not just one.
 
 Return ONLY valid JSON without any markdown formatting:
-{{
+{
   "recommended_level": "level here",
   "recommended_programs": ["program 1", "program 2"],
-  "program_explanations": {{
-    "program 1": "explanation here",
-    "program 2": "explanation here"
-  }},
+  "program_explanations": [
+    {"program": "program 1", "explanation": "explanation here"},
+    {"program": "program 2", "explanation": "explanation here"}
+  ],
   "confidence_score": 90,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "assessment of academic credentials",
     "ministry_experience_assessment": "assessment of ministry background",
     "pastoral_recommendation_assessment": "assessment of recommendation quality",
     "documents_missing": ["doc1", "doc2"],
     "pathway_explanation": "explanation for over-aspiring applicants (if applicable)"
-  }},
+  },
   "next_steps": ["step 1", "step 2"],
   "admissions_notes": "Internal notes for committee"
-}}
-
----
-## COMPREHENSIVE STUDENT DATA (from ALL forms):
-
-FROM SOLICITUD OFICIAL:
-Name: {student_data.get('applicant_name', 'Unknown')}
-Email: {student_data.get('email', 'Unknown')}
-Program Interest: {student_data.get('program_interest', 'N/A')}
-Self-Reported Education: {student_data.get('education_level', 'N/A')}
-Study Level Selected: {student_data.get('study_level_selected', 'N/A')}
-Basic Ministry Info: {student_data.get('ministerial_experience', 'N/A')}
-
-FORMS SUBMITTED:
-{json.dumps(forms_data, indent=2, ensure_ascii=False)}
-
-APPLICATION STATUS:
-- Created: {app.created_at}
-- Updated: {app.updated_at}
-- Forms Submitted: {len(app.forms_submitted)}/{len(app.required_forms)}
-- Status: {app.status}
+}
 
 ---
 ## Learn From These Classification Examples
@@ -471,25 +211,25 @@ Input:
 - Documents: All required documents attached
 
 Output:
-{{
+{
   "recommended_level": "Postgrado - Maestría",
   "recommended_programs": [
     "Maestría en Divinidad (M.Div)",
     "Maestría en Liderazgo Ministerial"
   ],
-  "program_explanations": {{
-    "Maestría en Divinidad (M.Div)": "Programa integral para el ministerio pastoral a tiempo completo.",
-    "Maestría en Liderazgo Ministerial": "Enfoque en desarrollo organizacional y liderazgo de equipos."
-  }},
+  "program_explanations": [
+    {"program": "Maestría en Divinidad (M.Div)", "explanation": "Programa integral para el ministerio pastoral a tiempo completo."},
+    {"program": "Maestría en Liderazgo Ministerial", "explanation": "Enfoque en desarrollo organizacional y liderazgo de equipos."}
+  ],
   "confidence_score": 92,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "Verified ministerial bachelor's with official transcript.",
     "ministry_experience_assessment": "6 years as associate pastor, substantial leadership.",
     "pastoral_recommendation_assessment": "Strong verified recommendation from senior pastor.",
     "documents_missing": []
-  }},
+  },
   "next_steps": ["Enrollment fee payment", "Course selection"]
-}}
+}
 
 ---
 
@@ -501,30 +241,30 @@ Input:
 - Documents: Engineering degree only
 
 Output:
-{{
+{
   "recommended_level": "Pregrado - Licenciatura en Teología",
   "recommended_programs": [
     "Licenciatura en Teología",
     "Licenciatura en Ministerio Pastoral"
   ],
-  "program_explanations": {{
-    "Licenciatura en Teología": "Enfoque académico, ideal para futuros profesores.",
-    "Licenciatura en Ministerio Pastoral": "Enfoque práctico, preparación pastoral."
-  }},
+  "program_explanations": [
+    {"program": "Licenciatura en Teología", "explanation": "Enfoque académico, ideal para futuros profesores."},
+    {"program": "Licenciatura en Ministerio Pastoral", "explanation": "Enfoque práctico, preparación pastoral."}
+  ],
   "confidence_score": 78,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "Secular bachelor's degree (Engineering) does not meet ministerial education requirement for Maestría. Must complete ministerial bachelor's first.",
     "ministry_experience_assessment": "Exceptional 15 years as senior pastor - excellent preparation.",
     "pastoral_recommendation_assessment": "Standard pastoral recommendation.",
     "pathway_explanation": "Your ministry experience is outstanding. Complete Licenciatura en Teología (4 years, may accelerate with prior learning credit) → Advance to Maestría. This pathway ensures strong theological foundation for graduate studies.",
     "documents_missing": []
-  }},
+  },
   "next_steps": [
     "Enroll in Licenciatura en Teología",
     "Request evaluation of ministry experience for possible credit",
     "Plan to advance to Maestría upon completion"
   ]
-}}
+}
 
 ---
 
@@ -535,11 +275,11 @@ Input:
 - Documents: Forms only, NO transcripts
 
 Output:
-{{
+{
   "recommended_level": "PENDING DOCUMENT VERIFICATION",
   "recommended_programs": [],
   "confidence_score": 30,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "Applicant claims master's degree but NO official documents provided. Cannot verify education level.",
     "ministry_experience_assessment": "8 years of pastoral experience claimed.",
     "pastoral_recommendation_assessment": "Pending review.",
@@ -549,14 +289,14 @@ Output:
       "PDF de título de licenciatura",
       "Transcripción oficial de licenciatura"
     ]
-  }},
+  },
   "admissions_notes": "CRITICAL: Cannot proceed without document verification.",
   "next_steps": [
     "URGENT: Submit official transcript from master's program",
     "Submit official transcript from bachelor's program",
     "Once received, final classification will be provided"
   ]
-}}
+}
 
 ---
 
@@ -567,27 +307,27 @@ Input:
 - Goal: "Aprender la Biblia"
 
 Output:
-{{
+{
   "recommended_level": "Certificación Básica",
   "recommended_programs": [
     "Certificado en Estudios Bíblicos"
   ],
-  "program_explanations": {{
-    "Certificado en Estudios Bíblicos": "Proporciona una base sistemática para el estudio de la Biblia."
-  }},
+  "program_explanations": [
+    {"program": "Certificado en Estudios Bíblicos", "explanation": "Proporciona una base sistemática para el estudio de la Biblia."}
+  ],
   "confidence_score": 90,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "No formal secondary education. Certificación programs are open access - no prerequisites required.",
     "ministry_experience_assessment": "New believer seeking foundation - perfect for certificación.",
     "pastoral_recommendation_assessment": "Simple membership confirmation.",
     "documents_missing": []
-  }},
+  },
   "next_steps": [
     "Register for Certificado en Estudios Bíblicos",
     "Complete pastoral recommendation form",
     "Submit activation payment"
   ]
-}}
+}
 
 ---
 
@@ -599,141 +339,737 @@ Input:
 - Documents: High school diploma + ministry portfolio
 
 Output:
-{{
+{
   "recommended_level": "Pregrado - Licenciatura",
   "recommended_programs": [
     "Licenciatura en Ministerio Pastoral",
     "Licenciatura en Educación Cristiana"
   ],
-  "program_explanations": {{
-    "Licenciatura en Ministerio Pastoral": "Preparación práctica para el liderazgo de iglesia.",
-    "Licenciatura en Educación Cristiana": "Enfoque en enseñanza y formación espiritual."
-  }},
+  "program_explanations": [
+    {"program": "Licenciatura en Ministerio Pastoral", "explanation": "Preparación práctica para el liderazgo de iglesia."},
+    {"program": "Licenciatura en Educación Cristiana", "explanation": "Enfoque en enseñanza y formación espiritual."}
+  ],
   "confidence_score": 85,
-  "reasoning": {{
+  "reasoning": {
     "educational_assessment": "Has high school diploma. No bachelor's degree, but ministry experience qualifies for Pregrado.",
     "ministry_experience_assessment": "6 years as youth pastor with clear responsibilities (40+ students, organized retreats, led discipleship). Meets ministry experience threshold for Pregrado consideration.",
     "pastoral_recommendation_assessment": "Exceptional recommendation with specific examples of teaching gifts and leadership.",
     "documents_missing": []
-  }},
+  },
   "next_steps": [
     "Enroll in Licenciatura en Ministerio Pastoral",
     "Request evaluation of ministry experience for possible course credit",
     "Submit all required documents and admission payment"
   ]
-}}
+}
 
 THESE EXAMPLES SHOW THE EXPECTED DEPTH AND FORMAT OF YOUR CLASSIFICATIONS.
 """
-        
-        return prompt
-    
 
-    
-    def _get_fallback_classification(self) -> Dict:
-        """Fallback classification when AI fails"""
-        return {
-            "recommended_level": "Certificación Básica",
-            "recommended_programs": ["Certificado en Estudios Bíblicos"],
-            "justification": "Error en procesamiento automático. Requiere revisión manual.",
-            "admissions_notes": "⚠️ ATENCIÓN: Clasificación automática falló. Revisar manualmente.",
-            "confidence_score": 1,
-            "classification_type": "fallback",
-            "stage": 0
-        }
-
-
-def classify_student(student_data: Dict) -> Dict:
+
+# Token totals of the classification running in this context (see track_usage)
+_usage = contextvars.ContextVar('gemini_usage', default=None)
+
+
+@contextmanager
+def track_usage():
+    """Collect the Gemini calls and tokens spent inside the block (per thread/task)"""
+    totals = {'calls': 0, 'prompt': 0, 'cached': 0, 'output': 0}
+    token = _usage.set(totals)
+    try:
+        yield totals
+    finally:
+        _usage.reset(token)
+
+
+def record_usage(stage: str, response):
+    """Count the tokens Gemini reports for a call ('cached' = prompt tokens served from its prefix cache)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return
+    tokens = {
+        'prompt': getattr(usage, 'prompt_token_count', 0) or 0,
+        'cached': getattr(usage, 'cached_content_token_count', 0) or 0,
+        'output': getattr(usage, 'candidates_token_count', 0) or 0,
+    }
+    for kind, count in tokens.items():
+        metrics.GEMINI_TOKENS.inc(count, stage=stage, kind=kind)
+    totals = _usage.get()
+    if totals is not None:
+        totals['calls'] += 1
+        for kind, count in tokens.items():
+            totals[kind] += count
+    log.info("Gemini usage", stage=stage, prompt_tokens=tokens['prompt'],
+             cached_tokens=tokens['cached'], output_tokens=tokens['output'])
+
+
+def chunk_text(chunk) -> str:
+    """Text of one streamed response chunk ('' for chunks that only carry metadata)"""
+    try:
+        return chunk.text
+    except (ValueError, AttributeError):
+        return ''
+
+
+class StreamProgress:
     """
-    Main classification function (maintains backward compatibility).
-    Automatically determines if this is Stage 1 or Stage 2 classification.
+    Collects a streamed Stage 2 reply and reports each field to a progress
+    callback as soon as it is complete (see structured_output.FieldStream).
     """
-    classifier = MultiFormClassifier()
-    email = student_data.get('email')
 
-    # NEW: Fetch files from MachForm if we have email
-    if email:
+    def __init__(self, stage: str, progress: Optional[Callable[[str, Dict], None]]):
+        self.stage = stage
+        self.progress = progress
+        self.fields = structured_output.FieldStream()
+        self.parts: List[str] = []
+        self.last_chunk = None
+        self.started = time.perf_counter()
+        self.first_field = None
+
+    def _report(self, fields):
+        if not fields or not self.progress:
+            return
+        if self.first_field is None:
+            self.first_field = time.perf_counter() - self.started
+            metrics.GEMINI_FIRST_FIELD_SECONDS.observe(self.first_field, stage=self.stage)
+        for field, value in fields:
+            self.progress('field', {'field': field, 'value': value})
+
+    def add(self, chunk):
+        self.last_chunk = chunk
+        text = chunk_text(chunk)
+        self.parts.append(text)
+        if self.progress:
+            self._report(self.fields.feed(text))
+
+    def finish(self) -> str:
+        """The whole reply text; usage is recorded from the final chunk"""
+        if self.progress:
+            self._report(self.fields.finish())
+        record_usage(self.stage, self.last_chunk)
+        log.info("Streamed Gemini reply", stage=self.stage, chunks=len(self.parts),
+                 first_field_seconds=round(self.first_field, 3) if self.first_field is not None else None,
+                 total_seconds=round(time.perf_counter() - self.started, 3))
+        return ''.join(self.parts)
+
+
+def process_file_for_gemini(file_path):
+    """
+    Handle for a downloaded file (see document_handles): the file stays on disk
+    and is only read when the request is built.
+    """
+    try:
+        return document_handles.from_path(file_path)
+    except Exception as e:
+        log.error(f"Error reading file {file_path}: {e}")
+        return None
+
+
+class MultiFormClassifier:
+    """
+    Enhanced classifier that can work with:
+    1. Single form (initial classification)
+    2. Multiple forms (final comprehensive classification)
+    """
+    
+    def __init__(self):
+        # vertexai.init, credentials and the model live in the process-wide pool
+        self.pool = gemini_model.get_pool()
+        self.tracker = get_tracker()
+
+    @property
+    def model(self):
+        """Shared GenerativeModel for the current settings (see gemini_model)"""
+        return self.pool.model()
+
+    def _cache_key(self, kind: str, prompt: str, documents: List[Dict], system_instruction: str = '') -> str:
+        return classification_cache.make_key(kind, prompt, documents, self.pool.model_name, PROMPT_VERSION,
+                                             system_instruction)
+
+    def _cached(self, key: str) -> Optional[Dict]:
+        cache = classification_cache.get_cache()
+        try:
+            classification = cache.get(key) if cache else None
+        except Exception as e:
+            log.warning(f"Classification cache unavailable: {e}")
+            return None
+        if classification:
+            log.info("Reusing cached classification", recommended_level=classification.get('recommended_level'))
+        return classification
+
+    def _store(self, key: str, classification: Dict) -> Dict:
+        cache = classification_cache.get_cache()
+        if cache:
+            try:
+                cache.put(key, classification)
+            except Exception as e:
+                log.warning(f"Could not cache classification: {e}")
+        return classification
+    
+    def classify_single_form(self, student_data: Dict) -> Dict:
+        """
+        Initial classification based on a single form (Solicitud Oficial).
+        This is the STAGE 1 classification - preliminary assessment.
+        """
+        decided = admission_rules.short_circuit(student_data)
+        if decided:
+            return decided
+        prompt = self._build_single_form_prompt(student_data)
+        key = self._cache_key('single', prompt, [])
+        cached = self._cached(key)
+        if cached:
+            return cached
+        
         try:
-            from machform_client import MachFormClient
-            mf = MachFormClient()
+            rate_limit.acquire('gemini')
+            model = self.pool.model(response_schema=structured_output.SINGLE_FORM_SCHEMA)
+            with gemini_guard.get_guard().call(), metrics.external_call('gemini', 'generate_content'):
+                response = model.generate_content(prompt)
+            record_usage('single', response)
+            return self._store(key, self._parse_single_form_response(response.text))
             
-            # Query MachForm for entries by this email
-            files = mf.get_files_by_email(email)
+        except gemini_guard.GeminiUnavailable:
+            # Over quota or down: the caller defers the job rather than storing a fallback
+            raise
+        except Exception as e:
+            log.error(f"Stage 1 failed: {str(e)}")
+            return self._get_fallback_classification(student_data)
+    
+    async def classify_single_form_async(self, student_data: Dict) -> Dict:
+        """Async variant of classify_single_form (used by asgi_app)"""
+        decided = admission_rules.short_circuit(student_data)
+        if decided:
+            return decided
+        prompt = self._build_single_form_prompt(student_data)
+        key = self._cache_key('single', prompt, [])
+        cached = await asyncio.to_thread(self._cached, key)
+        if cached:
+            return cached
+        
+        try:
+            model = self.pool.model(response_schema=structured_output.SINGLE_FORM_SCHEMA)
+            async with gemini_guard.get_guard().call_async():
+                with metrics.external_call('gemini', 'generate_content'):
+                    response = await model.generate_content_async(prompt)
+            record_usage('single', response)
+            return await asyncio.to_thread(self._store, key, self._parse_single_form_response(response.text))
             
-            if files:
-                print(f"[CLASSIFIER] Found {len(files)} uploaded files")
-                print(f"[CLASSIFIER] Attempting to download files...")
-                
-                # Group by entry
-                entries = {}
-                for file_info in files[:10]:
-                    form_id = file_info.get('form_id')
-                    entry_id = file_info.get('entry_id')
-                    
-                    print(f"[CLASSIFIER] File: form={form_id}, entry={entry_id}")
-                    
-                    if not entry_id:
-                        print(f"[CLASSIFIER] Skipping file - no entry_id")
-                        continue
-                        
-                    key = (form_id, entry_id)
-                    if key not in entries:
-                        entries[key] = []
-                    entries[key].append(file_info)
-                
-                print(f"[CLASSIFIER] Grouped into {len(entries)} entries")
-                
-                downloaded_files = []
-                for (form_id, entry_id), file_list in entries.items():
-                    print(f"[CLASSIFIER] Processing entry: form={form_id}, entry={entry_id}")
-                    
-                    links = mf.get_download_links_from_entry(form_id, entry_id)
+        except gemini_guard.GeminiUnavailable:
+            raise
+        except Exception as e:
+            log.error(f"Stage 1 failed: {str(e)}")
+            return self._get_fallback_classification(student_data)
+    
+    def _parse_single_form_response(self, response_text: str) -> Dict:
+        # ParseError goes straight to the fallback - asking again rarely helps
+        classification = structured_output.parse(response_text, structured_output.SINGLE_FORM_SCHEMA, 'single')
+        classification['classification_type'] = 'preliminary'
+        classification['stage'] = 1
+        
+        log.info(f"Stage 1 - Preliminary: {classification['recommended_level']}")
+        return classification
+    
+    def classify_multi_form(self, email: str, student_data: Dict, all_submissions: List = None,
+                            progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+        """
+        Final classification based on ALL submitted forms.
+        This is the STAGE 2 classification - comprehensive assessment.
+        
+        Args:
+            email: Applicant email
+            student_data: Basic student data
+            all_submissions: Optional list of Salesforce Form_Submission objects
+            progress: Optional callback(event, data); the reply is streamed and
+                each field is reported as soon as Gemini has written it
+        """
+        app = self._get_application_context(email, all_submissions)
+        if not app:
+            return self.classify_single_form(student_data)
+        
+        documents, facts = student_data.get('uploaded_documents'), []
+        try:
+            if document_facts.ENABLED and documents:
+                facts, documents = self._document_facts(documents)
+            decided = admission_rules.short_circuit(student_data, app, facts, unread=len(documents or []))
+            if decided:
+                return decided
+            prompt = self._build_multi_form_prompt(app, student_data, facts)
+            documents, _ = token_budget.fit([MULTI_FORM_SYSTEM_INSTRUCTION, prompt], documents)
+            key = self._cache_key('multi', prompt, documents, MULTI_FORM_SYSTEM_INSTRUCTION)
+            cached = self._cached(key)
+            if cached:
+                return cached
+            message_content = self._build_multi_form_message(prompt, documents)
+
+            # Then call Gemini with message_content instead of just prompt_text
+            rate_limit.acquire('gemini')
+            model = self.pool.model(MULTI_FORM_SYSTEM_INSTRUCTION, structured_output.MULTI_FORM_SCHEMA)
+            if progress:
+                progress('started', {'stage': 2})
+            reply = StreamProgress('multi', progress)
+            with gemini_guard.get_guard().call(), metrics.external_call('gemini', 'generate_content'):
+                for chunk in model.generate_content(message_content, stream=True):
+                    reply.add(chunk)
+            return self._store(key, self._parse_multi_form_response(reply.finish(), app))
+            
+        except gemini_guard.GeminiUnavailable:
+            # A Stage 1 call now would only add load to an overloaded model - defer instead
+            raise
+        except structured_output.ParseError:
+            # A formatting problem - a second (Stage 1) call wouldn't fix it
+            return self._get_fallback_classification(student_data, app, facts, documents)
+        except Exception as e:
+            log.error(f"Stage 2 failed: {str(e)}")
+            # Fall back to Stage 1
+            return self.classify_single_form(student_data)
+    
+    async def classify_multi_form_async(self, email: str, student_data: Dict, all_submissions: List = None,
+                                        progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+        """Async variant of classify_multi_form (used by asgi_app)"""
+        app = self._get_application_context(email, all_submissions)
+        if not app:
+            return await self.classify_single_form_async(student_data)
+        
+        documents, facts = student_data.get('uploaded_documents'), []
+        try:
+            if document_facts.ENABLED and documents:
+                facts, documents = await self._document_facts_async(documents)
+            decided = admission_rules.short_circuit(student_data, app, facts, unread=len(documents or []))
+            if decided:
+                return decided
+            prompt = self._build_multi_form_prompt(app, student_data, facts)
+            documents, _ = await asyncio.to_thread(token_budget.fit, [MULTI_FORM_SYSTEM_INSTRUCTION, prompt],
+                                                   documents)
+            key = self._cache_key('multi', prompt, documents, MULTI_FORM_SYSTEM_INSTRUCTION)
+            cached = await asyncio.to_thread(self._cached, key)
+            if cached:
+                return cached
+            # Reads (or uploads) the documents - keep that file I/O off the event loop
+            message_content = await asyncio.to_thread(self._build_multi_form_message, prompt, documents)
+            model = self.pool.model(MULTI_FORM_SYSTEM_INSTRUCTION, structured_output.MULTI_FORM_SCHEMA)
+            if progress:
+                await asyncio.to_thread(progress, 'started', {'stage': 2})
+            # Streaming is the only way to see fields early; progress callbacks write to SQLite, so off the loop
+            reply = StreamProgress('multi', progress)
+            async with gemini_guard.get_guard().call_async():
+                with metrics.external_call('gemini', 'generate_content'):
+                    async for chunk in await model.generate_content_async(message_content, stream=True):
+                        if progress:
+                            await asyncio.to_thread(reply.add, chunk)
+                        else:
+                            reply.add(chunk)
+            text = await asyncio.to_thread(reply.finish)
+            return await asyncio.to_thread(self._store, key, self._parse_multi_form_response(text, app))
+            
+        except gemini_guard.GeminiUnavailable:
+            raise
+        except structured_output.ParseError:
+            return self._get_fallback_classification(student_data, app, facts, documents)
+        except Exception as e:
+            log.error(f"Stage 2 failed: {str(e)}")
+            return await self.classify_single_form_async(student_data)
+    
+    def _get_application_context(self, email: str, all_submissions: List = None):
+        """
+        Build the application object the Stage 2 prompt reads from.
+        Returns None when Stage 2 is not possible (caller falls back to Stage 1).
+        """
+        # Option A: Use Salesforce data (Preferred)
+        if all_submissions and len(all_submissions) >= 3:
+            log.info(f"Using Stage 2 (comprehensive - {len(all_submissions)} forms from Salesforce)")
+            
+            # Create a temporary app context structure from Salesforce data
+            # This avoids rewriting the prompt builder
+            parsed_submissions = []
+            for sub in all_submissions:
+                try:
+                    # Parse the JSON string back to dict
+                    form_data = json.loads(sub.get('Form_Data_JSON__c', '{}'))
                     
-                    for link in links:
-                        local_path = mf.download_file_from_link(link['url'], link['filename'])
-                        if local_path:
-                            downloaded_files.append(local_path)
+                    parsed_submissions.append({
+                        'form_type': sub.get('Form_Type__c'),
+                        'form_name': sub.get('Form_Type__c'),
+                        'submitted_at': sub.get('Submission_Date__c'),
+                        'data_snapshot': {
+                            'program_interest': form_data.get('element_3', 'N/A'), # Example mappings
+                            'education_level': form_data.get('element_4', 'N/A'),
+                            'raw_data': form_data
+                        }
+                    })
+                except Exception as e:
+                    log.error(f"Error parsing submission: {e}")
+
+            # Mock an app object structure for the prompt builder
+            class MockApp:
+                def __init__(self):
+                    self.forms_submitted = []
+                    self.created_at = "N/A"
+                    self.updated_at = "N/A"
+                    self.status = "Complete"
+                    self.required_forms = ["Solicitud Oficial", "Experiencia Ministerial", "Recomendación Pastoral"]
+
+            app = MockApp()
+            # Add simple objects that behave like FormSubmission
+            for ps in parsed_submissions:
+                class MockSubmission:
+                    def __init__(self, data):
+                        self.form_type = data['form_type']
+                        self.form_name = data['form_name']
+                        self.submitted_at = data['submitted_at']
+                        self.data_snapshot = data['data_snapshot']['raw_data'] # Use full data
                 
-                print(f"[CLASSIFIER] Total files downloaded: {len(downloaded_files)}")
+                app.forms_submitted.append(MockSubmission(ps))
                 
-                if downloaded_files:
-                    print(f"[CLASSIFIER] Successfully downloaded {len(downloaded_files)} files")
-                    
-                    # Process files for Gemini
-                    file_parts = []
-                    for file_path in downloaded_files[:5]:  # Limit to 5 files to avoid token limits
-                        try:
-                            file_part = process_file_for_gemini(file_path)
-                            if file_part:
-                                file_parts.append(file_part)
-                                print(f"[CLASSIFIER] Processed file: {os.path.basename(file_path)[:40]}")
-                        except Exception as e:
-                            print(f"[CLASSIFIER] Error processing file {file_path}: {e}")
-                    
-                    if file_parts:
-                        print(f"[CLASSIFIER] Sending {len(file_parts)} files to Gemini")
-                        # Add files to the prompt
-                        student_data['uploaded_documents'] = file_parts
-                    else:
-                        print(f"[CLASSIFIER] No files successfully processed for Gemini")
-                    
-                # Attach to student_data for potential use in prompts or downstream
-                student_data['uploaded_files'] = files
+        # Option B: Fallback to local tracker
+        else:
+            log.info("Salesforce data missing/incomplete - falling back to local tracker")
+            app = self.tracker.get_application(email)
+            
+            if not app or not self.tracker.is_application_complete(email):
+                log.info("Cannot do Stage 2 - application incomplete")
+                return None
+        
+        return app
+    
+    def _known_facts(self, documents: List[Dict]) -> Dict[str, Dict]:
+        try:
+            return document_facts.get_fact_store().get_many([document_handles.digest(doc) for doc in documents])
+        except Exception as e:
+            log.warning(f"Could not read document facts: {e}")
+            return {}
+
+    def _facts_request(self, document: Dict):
+        """(model, contents) for a phase one call, or None when the document can't be sent"""
+        prompt = document_facts.extraction_prompt(document)
+        sendable, _ = token_budget.fit([document_facts.FACTS_SYSTEM_INSTRUCTION, prompt], [document])
+        if not sendable:
+            return None
+        from vertexai.generative_models import Part
+        model = self.pool.model(document_facts.FACTS_SYSTEM_INSTRUCTION, structured_output.DOCUMENT_FACTS_SCHEMA)
+        return model, [Part.from_text(prompt), document_handles.to_part(sendable[0])]
+
+    def _facts_response(self, document: Dict, response) -> Optional[Dict]:
+        """Parse and store a phase one reply (None if it's unusable)"""
+        record_usage('facts', response)
+        try:
+            facts = structured_output.parse(response.text, structured_output.DOCUMENT_FACTS_SCHEMA, 'facts')
+        except structured_output.ParseError:
+            return None
+        try:
+            document_facts.get_fact_store().put(document_handles.digest(document), facts, document.get('mime_type'),
+                                                self.pool.model_name)
         except Exception as e:
-            print(f"[CLASSIFIER] Could not retrieve files: {e}")
+            log.warning(f"Could not store document facts: {e}")
+        return facts
+
+    def _extract_facts(self, document: Dict) -> Optional[Dict]:
+        """Phase one for one document; None sends it as a file instead"""
+        try:
+            request = self._facts_request(document)
+            if not request:
+                return None
+            model, contents = request
+            rate_limit.acquire('gemini')
+            with gemini_guard.get_guard().call(), metrics.external_call('gemini', 'extract_facts'):
+                response = model.generate_content(contents)
+            return self._facts_response(document, response)
+        except gemini_guard.GeminiUnavailable:
+            raise
+        except Exception as e:
+            log.warning(f"Could not extract facts from {document.get('filename')}: {e}")
+            return None
+
+    async def _extract_facts_async(self, document: Dict, slots: asyncio.Semaphore) -> Optional[Dict]:
+        async with slots:
+            try:
+                request = await asyncio.to_thread(self._facts_request, document)
+                if not request:
+                    return None
+                model, contents = request
+                async with gemini_guard.get_guard().call_async():
+                    with metrics.external_call('gemini', 'extract_facts'):
+                        response = await model.generate_content_async(contents)
+                return await asyncio.to_thread(self._facts_response, document, response)
+            except gemini_guard.GeminiUnavailable:
+                raise
+            except Exception as e:
+                log.warning(f"Could not extract facts from {document.get('filename')}: {e}")
+                return None
+
+    def _split_by_facts(self, documents: List[Dict], known: Dict[str, Dict],
+                        extracted: int) -> Tuple[List[Dict], List[Dict]]:
+        facts, unanalyzed = [], []
+        for doc in documents:
+            fact = known.get(document_handles.digest(doc))
+            if fact:
+                facts.append({'filename': doc.get('filename'), **fact})
+            else:
+                unanalyzed.append(doc)
+        log.info(f"Document facts for {len(facts)}/{len(documents)} documents",
+                 stored=len(facts) - extracted, extracted=extracted, attached=len(unanalyzed))
+        return facts, unanalyzed
+
+    def _missing_facts(self, documents: List[Dict], known: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Documents that still need phase one, one per digest"""
+        return {document_handles.digest(doc): doc for doc in documents
+                if document_handles.digest(doc) not in known}
+
+    def _document_facts(self, documents: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Phase one of Stage 2: facts for each document, from the store or from
+        one small model call per new document. Returns (facts, documents to
+        attach as files because their extraction failed).
+        """
+        known = self._known_facts(documents)
+        missing = self._missing_facts(documents, known)
+        extracted = 0
+        if missing:
+            with ThreadPoolExecutor(max_workers=document_facts.WORKERS, thread_name_prefix="facts") as pool:
+                # Each call runs in a copy of this context so track_usage() still sees it
+                futures = {digest: pool.submit(contextvars.copy_context().run, self._extract_facts, doc)
+                           for digest, doc in missing.items()}
+                for digest, future in futures.items():
+                    facts = future.result()
+                    if facts:
+                        known[digest] = facts
+                        extracted += 1
+        return self._split_by_facts(documents, known, extracted)
+
+    async def _document_facts_async(self, documents: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Async variant of _document_facts"""
+        known = await asyncio.to_thread(self._known_facts, documents)
+        missing = self._missing_facts(documents, known)
+        slots = asyncio.Semaphore(document_facts.WORKERS)
+        results = await asyncio.gather(*(self._extract_facts_async(doc, slots) for doc in missing.values()))
+        extracted = 0
+        for digest, facts in zip(missing, results):
+            if facts:
+                known[digest] = facts
+                extracted += 1
+        return self._split_by_facts(documents, known, extracted)
+
+    def _build_multi_form_message(self, prompt: str, documents: List[Dict]):
+        """Prompt (built with ALL form data) plus the budgeted uploaded documents as a list of Parts"""
+        if not documents:
+            return prompt
+        from vertexai.generative_models import Part
+
+        # Build message content with files
+        # NOTE: When documents are included, everything in the list must be a Part object
+        message_content = [Part.from_text(prompt)]
+
+        # Add uploaded documents: large files by URI, the rest read from disk once
+        for doc in documents:
+            message_content.append(document_handles.to_part(doc))
+        log.info(f"Including {len(documents)} documents in analysis")
+        return message_content
+    
+    def _parse_multi_form_response(self, response_text: str, app) -> Dict:
+        # ParseError is caught by classify_multi_form, which falls back without a second (Stage 1) call
+        classification = structured_output.parse(response_text, structured_output.MULTI_FORM_SCHEMA, 'multi')
+        classification['classification_type'] = 'comprehensive'
+        classification['stage'] = 2
+        classification['forms_analyzed'] = len(app.forms_submitted)
+        
+        log.info(f"Stage 2 - Comprehensive: {classification['recommended_level']}")
+        return classification
+    
+    def _build_single_form_prompt(self, student_data: Dict) -> str:
+        """Build prompt for single-form classification (Stage 1)"""
+        return f"""You are an academic advisor for Universidad Cristiana de Logos (UCL). Evaluate and recommend the appropriate academic level and program.
+
+ACADEMIC LEVELS:
+- Certificación Básica - Minimal formal education or new to theological studies
+- Pregrado - Bachelor's level (requires secondary education)
+- Postgrado - Master's level (requires undergraduate degree)
+- Doctorado - Doctoral programs (requires master's degree)
+
+AVAILABLE PROGRAMS:
+CERTIFICACIÓN BÁSICA:
+- Certificado en Estudios Bíblicos
+- Certificado en Ministerio Cristiano
+
+PREGRADO:
+- Licenciatura en Teología
+- Licenciatura en Ministerio Pastoral
+- Licenciatura en Consejería Cristiana
+- Licenciatura en Educación Cristiana
+- Licenciatura en Liderazgo y Administración Ministerial
+
+POSTGRADO:
+- Maestría en Divinidad
+- Maestría en Teología
+- Maestría en Liderazgo Ministerial
+- Maestría en Consejería Pastoral
+
+DOCTORADO:
+- Doctorado en Ministerio (D.Min)
+- Doctorado en Teología (Th.D)
+
+STUDENT DATA (PRELIMINARY - from initial form only):
+Name: {student_data['applicant_name']}
+Form: {student_data.get('form_name', 'N/A')}
+Program Interest: {student_data['program_interest']}
+Education Level: {student_data['education_level']}
+Study Level Selected: {student_data.get('study_level_selected', 'N/A')}
+Ministerial Experience: {student_data['ministerial_experience']}
+Background: {student_data['background']}
+
+NOTE: This is a PRELIMINARY assessment based on ONE form only. 
+The applicant needs to submit additional forms (Experiencia Ministerial, Recomendación Pastoral) 
+for a comprehensive evaluation.
+
+Return ONLY valid JSON without any markdown formatting:
+{{
+  "recommended_level": "level here",
+  "recommended_programs": ["program 1", "program 2"],
+  "justification": "explanation here",
+  "admissions_notes": "This is a PRELIMINARY recommendation. Applicant must submit: Formulario de Experiencia Ministerial and Formulario de Recomendación Pastoral for final evaluation.",
+  "confidence_score": 6,
+  "pending_documents": ["Experiencia Ministerial", "Recomendación Pastoral"]
+}}"""
+    
+    def _build_multi_form_prompt(self, app, student_data: Dict, facts: Optional[List[Dict]] = None) -> str:
+        """Build prompt for multi-form classification (Stage 2), with the documents' facts from phase one"""
+        
+        # Extract info from each form
+        forms_data = {}
+        for form_sub in app.forms_submitted:
+            forms_data[form_sub.form_type] = {
+                'form_name': form_sub.form_name,
+                'submitted_at': form_sub.submitted_at,
+                'data': form_sub.data_snapshot
+            }
+        
+        # Only the per-applicant section is built per call; the rules and examples
+        # are the model's system instruction (MULTI_FORM_SYSTEM_INSTRUCTION)
+        prompt = f"""## COMPREHENSIVE STUDENT DATA (from ALL forms):
+
+FROM SOLICITUD OFICIAL:
+Name: {student_data.get('applicant_name', 'Unknown')}
+Email: {student_data.get('email', 'Unknown')}
+Program Interest: {student_data.get('program_interest', 'N/A')}
+Self-Reported Education: {student_data.get('education_level', 'N/A')}
+Study Level Selected: {student_data.get('study_level_selected', 'N/A')}
+Basic Ministry Info: {student_data.get('ministerial_experience', 'N/A')}
+
+FORMS SUBMITTED:
+{json.dumps(forms_data, indent=2, ensure_ascii=False)}
+
+{document_facts.format_facts(facts)}APPLICATION STATUS:
+- Created: {app.created_at}
+- Updated: {app.updated_at}
+- Forms Submitted: {len(app.forms_submitted)}/{len(app.required_forms)}
+- Status: {app.status}
+
+---
+Classify this applicant following the admission rules and examples in your instructions.
+Return ONLY valid JSON in the Required Output Format, without any markdown formatting.
+"""
+        
+        return prompt
+    
+
+    
+    def _get_fallback_classification(self, student_data: Dict, app=None, facts: Optional[List[Dict]] = None,
+                                     unread: Optional[List[Dict]] = None) -> Dict:
+        """Fallback classification when AI fails: the admission rules' best result"""
+        return admission_rules.fallback(student_data, app, facts, unread=len(unread or []))
+
+
+def fetch_uploaded_documents(email: str) -> Dict:
+    """
+    Discover and download an applicant's MachForm uploads.
+    Returns {'uploaded_files': [...], 'uploaded_documents': [...]} ready to merge
+    into student_data. Independent of Salesforce, so it can run alongside other stages.
+    Files prefetched after forms 1 and 2 come from the local cache; only entries
+    uploaded or changed since are downloaded (see document_prefetch).
+    """
+    documents = {}
+    if not email:
+        return documents
+
+    try:
+        from machform_client import MachFormClient
+        files, file_parts = document_prefetch.collect(MachFormClient(), email)
+        
+        if file_parts:
+            # token_budget trims these to fit
+            file_parts = file_parts[:MAX_DOCUMENTS]
+            log.info(f"Sending {len(file_parts)} files to Gemini")
+            # Add files to the prompt (downscaled/compacted first)
+            documents['uploaded_documents'] = document_prep.prepare_all(file_parts)
+        elif files:
+            log.info("No files successfully processed for Gemini")
+        
+        if files:
+            # Attach to student_data for potential use in prompts or downstream
+            documents['uploaded_files'] = files
+    except Exception as e:
+        log.warning(f"Could not retrieve files: {e}")
+
+    return documents
+
+
+# Global classifier instance
+_classifier = None
+
+def get_classifier() -> MultiFormClassifier:
+    """Get the shared classifier (singleton); its model is created on first use"""
+    global _classifier
+    if _classifier is None:
+        _classifier = MultiFormClassifier()
+    return _classifier
+
+
+def classify_student(student_data: Dict, documents: Optional[Dict] = None,
+                     progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """
+    Main classification function (maintains backward compatibility).
+    Automatically determines if this is Stage 1 or Stage 2 classification.
+    Pass documents (from fetch_uploaded_documents) when they were already fetched,
+    and progress (see classification_events.publisher) to stream Stage 2 fields.
+    """
+    classifier = get_classifier()
+    email = student_data.get('email')
+
+    if documents is None:
+        documents = fetch_uploaded_documents(email)
+    student_data.update(documents)
     
     # Priority 1: Use direct Salesforce data if available
     if 'all_submissions' in student_data:
          # all_submissions field is injected by app.py when it detects completion
-         return classifier.classify_multi_form(email, student_data, student_data['all_submissions'])
+         return classifier.classify_multi_form(email, student_data, student_data['all_submissions'], progress)
     
     # Priority 2: Check local tracker
     if email:
         tracker = get_tracker()
         if tracker.is_application_complete(email):
-            print("[CLASSIFIER] Application complete (local) - using Stage 2")
-            return classifier.classify_multi_form(email, student_data)
+            log.info("Application complete (local) - using Stage 2")
+            return classifier.classify_multi_form(email, student_data, progress=progress)
     
     # Default: Stage 1 (single form)
-    print("[CLASSIFIER] Using Stage 1 (single-form) classification")
-    return classifier.classify_single_form(student_data)
\ No newline at end of file
+    log.info("Using Stage 1 (single-form) classification")
+    return classifier.classify_single_form(student_data)
+
+async def classify_student_async(student_data: Dict, documents: Optional[Dict] = None,
+                                 progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """
+    Async counterpart of classify_student for the ASGI service.
+    Documents are fetched by the caller (async MachForm client) and passed in.
+    """
+    classifier = get_classifier()
+    email = student_data.get('email')
+    student_data.update(documents or {})
+
+    if 'all_submissions' in student_data:
+        return await classifier.classify_multi_form_async(email, student_data, student_data['all_submissions'],
+                                                          progress)
+
+    if email and get_tracker().is_application_complete(email):
+        log.info("Application complete (local) - using Stage 2")
+        return await classifier.classify_multi_form_async(email, student_data, progress=progress)
+
+    log.info("Using Stage 1 (single-form) classification")
+    return await classifier.classify_single_form_async(student_data)
\ No newline at end of file
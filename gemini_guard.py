@@ -0,0 +1,237 @@
+"""
+Gemini Guard - Host-wide rate limit, AIMD and circuit breaker for Vertex AI
+Every Gemini call on the host (all gunicorn workers, the ASGI service and the
+batch CLI) takes a token from one bucket sized to the project quota, kept in
+a small flock()ed state file. A 429 / ResourceExhausted halves the allowed
+rate and each success adds a little back (AIMD), so a burst settles just
+under the quota instead of hammering it.
+
+Repeated overload or unavailability opens a circuit breaker: calls then fail
+fast with GeminiUnavailable (carrying a retry_after) until a cooldown has
+passed and a single probe call succeeds. Callers defer the classification
+job on GeminiUnavailable instead of falling back to another model call.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+
+import metrics
+import structured_log
+
+log = structured_log.get_logger('gemini')
+
+STATE_PATH = os.getenv('GEMINI_GUARD_PATH', '/tmp/admissions_gemini_guard.json')
+# Project quota for generate_content, requests per minute
+QUOTA_RPM = float(os.getenv('GEMINI_QUOTA_RPM', '60'))
+BURST = float(os.getenv('GEMINI_BURST', '5'))
+# AIMD: never throttle below this; multiply by DECREASE on a 429; add INCREASE rpm per success
+MIN_RPM = float(os.getenv('GEMINI_MIN_RPM', str(max(1.0, QUOTA_RPM / 10))))
+AIMD_DECREASE = float(os.getenv('GEMINI_AIMD_DECREASE', '0.5'))
+AIMD_INCREASE = float(os.getenv('GEMINI_AIMD_INCREASE', '1'))
+# Longer waits for a token are deferred rather than spent holding a worker
+MAX_WAIT = float(os.getenv('GEMINI_LIMIT_MAX_WAIT', '20'))
+# Consecutive overload/unavailable errors that open the breaker, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('GEMINI_BREAKER_COOLDOWN', '60'))
+
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+# google.api_core exceptions (matched by name so the SDK stays a lazy import)
+OVERLOAD_ERRORS = ('ResourceExhausted', 'TooManyRequests')
+UNAVAILABLE_ERRORS = ('ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+                      'BadGateway')
+
+
+class GeminiUnavailable(Exception):
+    """Gemini is throttled or unhealthy; retry the work after `retry_after` seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"Gemini unavailable ({reason}) - retry after {self.retry_after}s")
+        self.reason = reason
+
+
+def is_overload(error: Exception) -> bool:
+    return type(error).__name__ in OVERLOAD_ERRORS or getattr(error, 'code', None) == 429
+
+
+def is_unhealthy(error: Exception) -> bool:
+    """Errors that say Gemini itself is in trouble (not a bad request from us)"""
+    return is_overload(error) or type(error).__name__ in UNAVAILABLE_ERRORS
+
+
+class GeminiGuard:
+    """Token bucket + breaker whose state is shared through one locked JSON file"""
+
+    def __init__(self, path: str = STATE_PATH, quota_rpm: float = QUOTA_RPM, burst: float = BURST,
+                 min_rpm: float = MIN_RPM, max_wait: float = MAX_WAIT, threshold: int = BREAKER_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.path = path
+        self.quota_rpm = quota_rpm
+        self.burst = burst
+        self.min_rpm = min(min_rpm, quota_rpm)
+        self.max_wait = max_wait
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+    def _initial(self, now: float) -> Dict:
+        return {'tokens': self.burst, 'updated': now, 'rpm': self.quota_rpm,
+                'breaker': 'closed', 'failures': 0, 'opened_at': 0.0, 'probe_at': 0.0}
+
+    @contextmanager
+    def _state(self):
+        """Read-modify-write the shared state under an exclusive flock"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            raw = os.read(fd, 4096)
+            try:
+                state = {**self._initial(now), **json.loads(raw)} if raw else self._initial(now)
+            except ValueError:
+                state = self._initial(now)
+            before = dict(state)
+            yield state, now
+            if state != before:
+                data = json.dumps(state).encode('utf-8')
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+        finally:
+            os.close(fd)  # also releases the flock
+
+    def _reserve(self) -> float:
+        """Claim the next token; returns how long to wait before using it"""
+        with self._state() as (state, now):
+            if state['breaker'] == 'open':
+                remaining = state['opened_at'] + self.cooldown - now
+                if remaining > 0:
+                    metrics.GEMINI_BREAKER_REJECTED.inc(reason='open')
+                    raise GeminiUnavailable('circuit open', remaining)
+                state['breaker'] = 'half_open'
+                state['probe_at'] = 0.0
+                log.info("Gemini circuit half-open - sending a probe call")
+            if state['breaker'] == 'half_open':
+                # One probe at a time; a probe that never reported back is replaced after a cooldown
+                if state['probe_at'] and now - state['probe_at'] < self.cooldown:
+                    metrics.GEMINI_BREAKER_REJECTED.inc(reason='half_open')
+                    raise GeminiUnavailable('probe in flight', self.cooldown - (now - state['probe_at']))
+                state['probe_at'] = now
+
+            rate = state['rpm'] / 60.0
+            state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * rate)
+            state['updated'] = now
+            wait = 0.0 if state['tokens'] >= 1 else (1 - state['tokens']) / rate
+            if wait > self.max_wait:
+                metrics.GEMINI_BREAKER_REJECTED.inc(reason='wait')
+                raise GeminiUnavailable('rate limited', wait)
+            # Reservations may drive tokens negative: later callers queue behind this one
+            state['tokens'] -= 1
+            return wait
+
+    def acquire(self) -> float:
+        """Wait for a token (raises GeminiUnavailable instead of waiting past max_wait)"""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        metrics.GEMINI_LIMITER_WAIT_SECONDS.observe(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = await asyncio.to_thread(self._reserve)
+        if wait:
+            await asyncio.sleep(wait)
+        metrics.GEMINI_LIMITER_WAIT_SECONDS.observe(wait)
+        return wait
+
+    def record_success(self):
+        with self._state() as (state, now):
+            if state['breaker'] != 'closed':
+                log.info("Gemini circuit closed - probe succeeded")
+            state['breaker'] = 'closed'
+            state['failures'] = 0
+            state['probe_at'] = 0.0
+            state['rpm'] = min(self.quota_rpm, state['rpm'] + AIMD_INCREASE)
+
+    def record_failure(self, error: Exception):
+        """Feed a failed call to AIMD and the breaker; errors that aren't Gemini's fault are ignored"""
+        if not is_unhealthy(error):
+            return
+        with self._state() as (state, now):
+            if is_overload(error):
+                metrics.GEMINI_THROTTLED_TOTAL.inc()
+                state['rpm'] = max(self.min_rpm, state['rpm'] * AIMD_DECREASE)
+                # Drop the burst allowance so the lower rate applies right away
+                state['tokens'] = min(state['tokens'], 0.0)
+                log.warning("Gemini quota exceeded - lowering rate", rpm=round(state['rpm'], 1))
+            state['failures'] += 1
+            if state['breaker'] == 'half_open' or state['failures'] >= self.threshold:
+                if state['breaker'] != 'open':
+                    log.error(f"Gemini circuit open for {self.cooldown:g}s", failures=state['failures'],
+                              error=str(error))
+                state['breaker'] = 'open'
+                state['opened_at'] = now
+                state['probe_at'] = 0.0
+
+    def _failed(self, error: Exception):
+        if not is_unhealthy(error):
+            # Gemini answered (e.g. a 400 for our request) - it is healthy as far as the breaker cares
+            self.record_success()
+            return
+        self.record_failure(error)
+        status = self.status()
+        retry_after = self.cooldown if status['breaker'] == 'open' else 60.0 / status['rpm']
+        raise GeminiUnavailable(type(error).__name__, retry_after) from error
+
+    @contextmanager
+    def call(self):
+        """
+        Guard one Gemini call: take a token, then record the outcome.
+        Overload/unavailable errors leave the block as GeminiUnavailable.
+        """
+        self.acquire()
+        try:
+            yield
+        except Exception as e:
+            self._failed(e)
+            raise
+        self.record_success()
+
+    @asynccontextmanager
+    async def call_async(self):
+        await self.acquire_async()
+        try:
+            yield
+        except Exception as e:
+            await asyncio.to_thread(self._failed, e)
+            raise
+        await asyncio.to_thread(self.record_success)
+
+    def status(self) -> Dict:
+        with self._state() as (state, now):
+            return {'breaker': state['breaker'], 'rpm': round(state['rpm'], 2), 'quota_rpm': self.quota_rpm,
+                    'failures': state['failures']}
+
+
+def collect_metrics():
+    status = get_guard().status()
+    metrics.GEMINI_BREAKER_STATE.set(BREAKER_STATES[status['breaker']])
+    metrics.GEMINI_LIMITER_RPM.set(status['rpm'])
+
+
+metrics.register_collector(collect_metrics)
+
+
+# Global guard instance
+_guard = None
+
+def get_guard() -> GeminiGuard:
+    """Get the host-wide Gemini guard (singleton)"""
+    global _guard
+    if _guard is None:
+        _guard = GeminiGuard()
+    return _guard
@@ -0,0 +1,261 @@
+"""
+Gemini Model Pool - One Vertex AI model per process, shared by every request
+vertexai.init and the GenerativeModel (with its gRPC channel) are created
+lazily on first use and reused by all threads and coroutines. Service account
+credentials are refreshed before they expire, and the model name and
+generation settings can be changed without a redeploy by editing the JSON
+file at GEMINI_SETTINGS_FILE (re-read when it changes):
+
+    {"model": "gemini-2.5-flash",
+     "generation_config": {"temperature": 0.2, "max_output_tokens": 8192}}
+
+Environment defaults: GEMINI_MODEL, GEMINI_TEMPERATURE, GEMINI_TOP_P,
+GEMINI_MAX_OUTPUT_TOKENS.
+
+FakeModelPool is a drop-in for offline runs: its models answer with
+schema-shaped placeholders and never touch Vertex AI.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import structured_log
+
+log = structured_log.get_logger('gemini')
+
+PROJECT_ID = os.getenv('GOOGLE_CLOUD_PROJECT', 'gen-lang-client-0586026725')
+LOCATION = os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1')
+SETTINGS_FILE = os.getenv('GEMINI_SETTINGS_FILE', '')
+# How often the settings file's mtime is checked
+SETTINGS_CHECK_INTERVAL = float(os.getenv('GEMINI_SETTINGS_CHECK', '10'))
+# Refresh service account tokens this long before they expire
+REFRESH_MARGIN = int(os.getenv('GEMINI_CREDENTIALS_REFRESH_MARGIN', '300'))
+
+
+def default_settings() -> Dict:
+    """Model settings from the environment (the settings file overrides them)"""
+    generation_config = {}
+    for key, env, cast in (('temperature', 'GEMINI_TEMPERATURE', float),
+                           ('top_p', 'GEMINI_TOP_P', float),
+                           ('max_output_tokens', 'GEMINI_MAX_OUTPUT_TOKENS', int)):
+        if os.getenv(env):
+            generation_config[key] = cast(os.getenv(env))
+    return {'model': os.getenv('GEMINI_MODEL', 'gemini-2.5-flash'), 'generation_config': generation_config}
+
+
+class ModelPool:
+    """
+    Process-wide cache of GenerativeModel instances keyed by their settings.
+    model() is cheap after the first call: it only re-reads the settings file
+    when its mtime changes and refreshes credentials when they are close to expiry.
+    """
+
+    def __init__(self, settings_file: str = SETTINGS_FILE):
+        self.settings_file = settings_file
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._credentials = None
+        self._models: Dict[Tuple, object] = {}
+        self._settings = default_settings()
+        self._settings_mtime = None
+        self._settings_checked = 0.0
+
+    def _init_vertexai(self):
+        # The Vertex AI SDK takes seconds to import - load it on first classification, not at boot
+        import vertexai
+        from google.oauth2 import service_account
+
+        log.info(f"Initializing Vertex AI: {PROJECT_ID} / {LOCATION}")
+
+        # Load credentials from environment variable
+        credentials_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+        if credentials_json:
+            try:
+                credentials_info = json.loads(credentials_json)
+                self._credentials = service_account.Credentials.from_service_account_info(
+                    credentials_info, scopes=['https://www.googleapis.com/auth/cloud-platform']
+                )
+                vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=self._credentials)
+                log.info("Using service account credentials")
+                return
+            except Exception as e:
+                log.error(f"Error loading service account credentials: {e}")
+                self._credentials = None
+        # Fallback to default credentials (for local development)
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        log.info("Using default credentials")
+
+    def _refresh_credentials(self):
+        """Refresh the service account token ahead of expiry instead of on a failed call"""
+        credentials = self._credentials
+        if credentials is None:
+            return
+        expiry = getattr(credentials, 'expiry', None)
+        if credentials.valid and expiry and (expiry.timestamp() - time.time()) > REFRESH_MARGIN:
+            return
+        from google.auth.transport.requests import Request
+        try:
+            credentials.refresh(Request())
+            log.info("Refreshed Vertex AI credentials", expires=str(credentials.expiry))
+        except Exception as e:
+            # The SDK will still try its own refresh on the next call
+            log.error(f"Credential refresh failed: {e}")
+
+    def _reload_settings(self):
+        """Pick up edits to the settings file (checked every SETTINGS_CHECK_INTERVAL seconds)"""
+        now = time.monotonic()
+        if not self.settings_file or now - self._settings_checked < SETTINGS_CHECK_INTERVAL:
+            return
+        self._settings_checked = now
+        try:
+            mtime = os.path.getmtime(self.settings_file)
+        except OSError:
+            return
+        if mtime == self._settings_mtime:
+            return
+        try:
+            with open(self.settings_file, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"Ignoring unreadable settings file {self.settings_file}: {e}")
+            return
+        settings = default_settings()
+        settings['model'] = overrides.get('model', settings['model'])
+        settings['generation_config'].update(overrides.get('generation_config', {}))
+        self._settings = settings
+        self._settings_mtime = mtime
+        log.info("Loaded Gemini settings", model=settings['model'], generation_config=settings['generation_config'])
+
+    def settings(self) -> Dict:
+        with self._lock:
+            self._reload_settings()
+            return self._settings
+
+    def model(self, system_instruction: Optional[str] = None, response_schema: Optional[Dict] = None):
+        """
+        The shared GenerativeModel for the current settings, one per
+        (system instruction, response schema). With a schema the model answers
+        in JSON constrained to it.
+        """
+        with self._lock:
+            if not self._initialized:
+                self._init_vertexai()
+                self._initialized = True
+            self._reload_settings()
+            self._refresh_credentials()
+
+            settings = self._settings
+            key = (settings['model'], json.dumps(settings['generation_config'], sort_keys=True), system_instruction,
+                   json.dumps(response_schema, sort_keys=True) if response_schema else None)
+            model = self._models.get(key)
+            if model is None:
+                from vertexai.generative_models import GenerationConfig, GenerativeModel
+                generation_config = dict(settings['generation_config'])
+                if response_schema:
+                    generation_config.update(response_mime_type='application/json', response_schema=response_schema)
+                model = GenerativeModel(
+                    settings['model'],
+                    generation_config=GenerationConfig(**generation_config) if generation_config else None,
+                    system_instruction=system_instruction
+                )
+                # Models built for older settings are no longer handed out
+                self._models = {k: v for k, v in self._models.items() if k[:2] == key[:2]}
+                self._models[key] = model
+                log.info("Created Gemini model", model=settings['model'])
+            return model
+
+    @property
+    def model_name(self) -> str:
+        return self.settings()['model']
+
+
+def placeholder(schema: Dict, name: str = 'value'):
+    """A value of the shape a response schema asks for (used by FakeModel)"""
+    kind = schema.get('type')
+    if schema.get('enum'):
+        return schema['enum'][0]
+    if kind == 'OBJECT':
+        return {key: placeholder(child, key) for key, child in schema.get('properties', {}).items()}
+    if kind == 'ARRAY':
+        return [placeholder(schema.get('items', {}), name)]
+    if kind == 'INTEGER':
+        return 50
+    return f"fake {name}"
+
+
+class FakeModel:
+    """
+    Offline stand-in for GenerativeModel (batch dry runs, tests). Every call
+    sleeps `latency` seconds and answers with a placeholder shaped by the
+    response schema, reporting usage metadata like the real SDK.
+    """
+
+    def __init__(self, response_schema: Optional[Dict] = None, latency: float = 0.0):
+        self.response_schema = response_schema or {'type': 'OBJECT', 'properties': {}}
+        self.latency = latency
+
+    def _response(self, contents, text: str, output_tokens: int):
+        from types import SimpleNamespace
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt_tokens = sum(len(part) for part in parts if isinstance(part, str)) // 4
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, cached_content_token_count=0,
+                                candidates_token_count=output_tokens)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def _reply(self, contents, stream: bool):
+        text = json.dumps(placeholder(self.response_schema), ensure_ascii=False)
+        if not stream:
+            return self._response(contents, text, len(text) // 4)
+        # Like the SDK: text arrives in pieces, usage totals on the last chunk
+        pieces = [text[i:i + 64] for i in range(0, len(text), 64)]
+        return [self._response(contents, piece, len(text) // 4 if i == len(pieces) - 1 else 0)
+                for i, piece in enumerate(pieces)]
+
+    def generate_content(self, contents, stream: bool = False):
+        time.sleep(self.latency)
+        reply = self._reply(contents, stream)
+        return iter(reply) if stream else reply
+
+    async def generate_content_async(self, contents, stream: bool = False):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        reply = self._reply(contents, stream)
+        if not stream:
+            return reply
+
+        async def chunks():
+            for chunk in reply:
+                yield chunk
+        return chunks()
+
+
+class FakeModelPool:
+    """ModelPool lookalike handing out FakeModels; needs no credentials or Vertex AI SDK"""
+
+    model_name = 'fake'
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def settings(self) -> Dict:
+        return {'model': self.model_name, 'generation_config': {}}
+
+    def model(self, system_instruction: Optional[str] = None, response_schema: Optional[Dict] = None):
+        return FakeModel(response_schema, self.latency)
+
+
+# Global pool instance
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ModelPool:
+    """Get the process-wide model pool (singleton)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ModelPool()
+    return _pool
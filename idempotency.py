@@ -0,0 +1,143 @@
+"""
+Idempotency Store - Short-circuits redelivered and double-submitted webhooks
+Each webhook is keyed on its form type plus the MachForm entry number (or a
+canonical hash of the payload when there is none). The first response for a
+key is kept in a bounded, TTL'd SQLite table and replayed for repeats.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+DB_PATH = os.getenv('IDEMPOTENCY_PATH', '/tmp/admissions_idempotency.db')
+TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL', str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '50000'))
+
+# Keys MachForm uses for the entry number, depending on "Send Form Data" format
+ENTRY_KEYS = ('entry_no', 'EntryNo', 'entry_id')
+
+
+def make_key(form_type: str, raw_data: Dict) -> str:
+    """Build the dedup key for a webhook payload"""
+    for entry_key in ENTRY_KEYS:
+        if raw_data.get(entry_key):
+            return f"{form_type}|entry:{raw_data[entry_key]}"
+
+    canonical = json.dumps(raw_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return f"{form_type}|sha256:{digest}"
+
+
+class IdempotencyStore:
+    """Bounded TTL store of first responses, shared by all gunicorn workers"""
+
+    def __init__(self, db_path: str = DB_PATH, ttl: int = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses (created_at)")
+        finally:
+            conn.close()
+
+    def remember(self, key: str, produce: Callable[[], Tuple[Dict, int]]) -> Tuple[Dict, int, bool]:
+        """
+        Return the stored response for key, or call produce() and store its result.
+        Returns (body, status, replayed). The check and the store happen in one
+        write transaction, so two simultaneous deliveries cannot both produce.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT body, status FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row:
+                conn.execute("COMMIT")
+                self._count(hit=True)
+                return json.loads(row[0]), row[1], True
+
+            body, status = produce()
+            # Only successful intakes are worth replaying; errors should be retryable
+            if status < 400:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, body, status, created_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(body, ensure_ascii=False), status, now)
+                )
+                self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self._count(hit=False)
+        return body, status, False
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def _count(self, hit: bool):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process and the current store size"""
+        conn = self._connect()
+        try:
+            size = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        finally:
+            conn.close()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': size
+        }
+
+
+# Global store instance
+_store = None
+
+def get_store() -> IdempotencyStore:
+    """Get the global idempotency store (singleton)"""
+    global _store
+    if _store is None:
+        _store = IdempotencyStore()
+    return _store
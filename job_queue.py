@@ -0,0 +1,514 @@
+"""
+Durable Job Queue - SQLite-backed background processing for webhooks
+Webhook routes persist the payload here and return immediately; a pool of
+worker threads in every gunicorn process claims jobs from the shared database
+file and runs the pipeline stages, recording progress as it goes.
+
+Failed jobs are retried with exponential backoff and jitter; side-effecting
+stages are checkpointed (StageLedger) so a retry never repeats one that
+already succeeded. After JOB_MAX_ATTEMPTS a job moves to the dead-letter
+table, where it can be inspected and requeued.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+import structured_log
+
+log = structured_log.get_logger('queue')
+
+DB_PATH = os.getenv('JOB_QUEUE_PATH', '/tmp/admissions_jobs.db')
+WORKER_COUNT = int(os.getenv('JOB_WORKERS', '2'))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+# A job still "running" after this many seconds belongs to a dead worker
+STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '600'))
+# Retry policy: delay doubles from JOB_RETRY_BASE up to JOB_RETRY_CAP seconds
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+RETRY_BASE = float(os.getenv('JOB_RETRY_BASE', '30'))
+RETRY_CAP = float(os.getenv('JOB_RETRY_CAP', '3600'))
+
+
+class JobStatus:
+    """Job lifecycle states"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    DEAD = "dead"
+
+
+class PermanentError(Exception):
+    """Raised by a handler for failures a retry cannot fix (bad payload) - dead-letters at once"""
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with equal jitter: half fixed, half random"""
+    delay = min(RETRY_CAP, RETRY_BASE * (2 ** max(0, attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobQueue:
+    """
+    Persistent FIFO queue stored in SQLite (WAL mode).
+    Safe to share between threads and between gunicorn worker processes.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._wakeup = threading.Event()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    available_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (status, available_at)")
+            # Side-effecting stages per job, so retries resume instead of repeating them
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_stages (
+                    job_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, stage)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    dead_at REAL NOT NULL,
+                    requeued_at REAL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: Dict, delay: float = 0) -> str:
+        """Persist a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, available_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), JobStatus.QUEUED, now, now + delay)
+            )
+        finally:
+            conn.close()
+        self._wakeup.set()
+        log.info(f"Enqueued {kind} job {job_id}")
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Atomically take the oldest available job, or None if the queue is empty"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Recover jobs orphaned by a crashed or restarted worker
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND started_at < ?",
+                (JobStatus.QUEUED, JobStatus.RUNNING, now - STALE_AFTER)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND available_at <= ? ORDER BY available_at ASC LIMIT 1",
+                (JobStatus.QUEUED, now)
+            ).fetchone()
+            if not row:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker = ?, attempts = attempts + 1 WHERE id = ?",
+                (JobStatus.RUNNING, now, worker, row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = self._row_to_dict(row)
+        job['status'] = JobStatus.RUNNING
+        job['attempts'] += 1
+        return job
+
+    def update_stage(self, job_id: str, stage: str):
+        """Record that a job has reached a new pipeline stage"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row:
+                stages = json.loads(row['stages'])
+                stages.append({'stage': stage, 'at': datetime.utcnow().isoformat()})
+                conn.execute(
+                    "UPDATE jobs SET stage = ?, stages = ? WHERE id = ?",
+                    (stage, json.dumps(stages), job_id)
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def complete(self, job_id: str, result: Dict):
+        self._finish(job_id, JobStatus.SUCCEEDED, result=json.dumps(result, ensure_ascii=False, default=str))
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JobStatus.FAILED, error=error)
+
+    def retry_or_bury(self, job: Dict, error: str, permanent: bool = False) -> str:
+        """
+        Reschedule a failed job with backoff, or move it to the dead-letter table
+        once it has used MAX_ATTEMPTS (or the failure is permanent).
+        Returns the job's new status.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if permanent or job['attempts'] >= MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                    (JobStatus.DEAD, error, now, job['id'])
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters (job_id, kind, error, attempts, dead_at) VALUES (?, ?, ?, ?, ?)",
+                    (job['id'], job['kind'], error, job['attempts'], now)
+                )
+                status = JobStatus.DEAD
+            else:
+                delay = retry_delay(job['attempts'])
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, available_at = ?, worker = NULL WHERE id = ?",
+                    (JobStatus.QUEUED, error, now + delay, job['id'])
+                )
+                status = JobStatus.QUEUED
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if status == JobStatus.DEAD:
+            log.error(f"☠️ Job {job['id']} dead-lettered after {job['attempts']} attempts", job_id=job['id'], error=error)
+        else:
+            log.warning(f"🔁 Job {job['id']} retry scheduled in {delay:.0f}s (attempt {job['attempts']}/{MAX_ATTEMPTS})",
+                        job_id=job['id'], error=error)
+        return status
+
+    def dead_letters(self, limit: int = 100, include_requeued: bool = False) -> List[Dict]:
+        """Dead-lettered jobs, newest first, with their stage checkpoints"""
+        conn = self._connect()
+        try:
+            sql = "SELECT * FROM dead_letters"
+            if not include_requeued:
+                sql += " WHERE requeued_at IS NULL"
+            rows = conn.execute(sql + " ORDER BY dead_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        letters = []
+        for row in rows:
+            letter = dict(row)
+            letter['stages'] = self.stage_records(row['job_id'])
+            letters.append(letter)
+        return letters
+
+    def requeue(self, job_id: str) -> bool:
+        """Give a dead job a fresh set of attempts; completed stages stay checkpointed"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, worker = NULL WHERE id = ? AND status = ?",
+                (JobStatus.QUEUED, now, job_id, JobStatus.DEAD)
+            )
+            requeued = cursor.rowcount > 0
+            if requeued:
+                conn.execute("UPDATE dead_letters SET requeued_at = ? WHERE job_id = ?", (now, job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if requeued:
+            self._wakeup.set()
+            log.info(f"Requeued dead job {job_id}")
+        return requeued
+
+    def record_stage(self, job_id: str, stage: str, status: str, result: Any = None, error: str = None):
+        """Checkpoint one side-effecting stage of a job"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO job_stages (job_id, stage, status, result, error, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (job_id, stage) DO UPDATE SET
+                    status = excluded.status, result = excluded.result, error = excluded.error,
+                    attempts = attempts + 1, updated_at = excluded.updated_at
+            """, (job_id, stage, status, json.dumps(result, ensure_ascii=False, default=str), error, time.time()))
+        finally:
+            conn.close()
+
+    def stage_records(self, job_id: str) -> Dict[str, Dict]:
+        """stage -> {status, result, error, attempts, updated_at}"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM job_stages WHERE job_id = ?", (job_id,)).fetchall()
+        finally:
+            conn.close()
+        return {
+            row['stage']: {
+                'status': row['status'],
+                'result': json.loads(row['result']) if row['result'] else None,
+                'error': row['error'],
+                'attempts': row['attempts'],
+                'updated_at': row['updated_at']
+            }
+            for row in rows
+        }
+
+    def _finish(self, job_id: str, status: str, result: str = None, error: str = None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id)
+            )
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job as a dict (payload excluded), or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        job = self._row_to_dict(row)
+        job.pop('payload', None)
+        job['checkpoints'] = {
+            stage: {k: v for k, v in record.items() if k != 'result'}
+            for stage, record in self.stage_records(job_id).items()
+        }
+        return job
+
+    def pending_count(self) -> int:
+        """Jobs waiting to run (uses the pending index - cheap enough per request)"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (JobStatus.QUEUED,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) cnt FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {row['status']: row['cnt'] for row in rows}
+
+    def wait_for_work(self, timeout: float):
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job.get('payload') else None
+        job['stages'] = json.loads(job['stages']) if job.get('stages') else []
+        job['result'] = json.loads(job['result']) if job.get('result') else None
+        return job
+
+
+class StageLedger:
+    """
+    Checkpoints for the side-effecting stages of one job.
+    run(stage, func) calls func() once: a stage that already succeeded on an
+    earlier attempt returns its stored result instead of running again.
+    Without a job (backfill, direct calls) it only remembers within the run.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, job_id: Optional[str] = None):
+        self.queue = queue if job_id else None
+        self.job_id = job_id
+        self._records = self.queue.stage_records(job_id) if self.queue else {}
+        self._lock = threading.Lock()
+        # Nothing retries a run without a job, nor a job on its last attempt
+        job = self.queue.get(job_id) if self.queue else None
+        self.final_attempt = job is None or job['attempts'] >= MAX_ATTEMPTS
+
+    def done(self, stage: str) -> bool:
+        with self._lock:
+            return self._records.get(stage, {}).get('status') == JobStatus.SUCCEEDED
+
+    def result(self, stage: str) -> Any:
+        with self._lock:
+            return self._records.get(stage, {}).get('result')
+
+    def _record(self, stage: str, status: str, result: Any = None, error: str = None):
+        with self._lock:
+            self._records[stage] = {'status': status, 'result': result, 'error': error}
+        if self.queue:
+            self.queue.record_stage(self.job_id, stage, status, result=result, error=error)
+
+    def run(self, stage: str, func: Callable[[], Any]) -> Any:
+        if self.done(stage):
+            log.info(f"↩️ Stage {stage} already done - skipping", job_id=self.job_id)
+            return self.result(stage)
+        try:
+            result = func()
+        except Exception as e:
+            self._record(stage, JobStatus.FAILED, error=str(e))
+            raise
+        self._record(stage, JobStatus.SUCCEEDED, result=result)
+        return result
+
+    async def run_async(self, stage: str, func: Callable) -> Any:
+        """run() for a coroutine function; checkpoint writes happen off the event loop"""
+        if self.done(stage):
+            log.info(f"↩️ Stage {stage} already done - skipping", job_id=self.job_id)
+            return self.result(stage)
+        try:
+            result = await func()
+        except Exception as e:
+            await asyncio.to_thread(self._record, stage, JobStatus.FAILED, None, str(e))
+            raise
+        await asyncio.to_thread(self._record, stage, JobStatus.SUCCEEDED, result)
+        return result
+
+
+class WorkerPool:
+    """Background threads that pull jobs from the queue and dispatch them by kind"""
+
+    def __init__(self, queue: JobQueue, size: int = WORKER_COUNT):
+        self.queue = queue
+        self.size = size
+        self.handlers: Dict[str, Callable] = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    def register(self, kind: str, handler: Callable):
+        """handler(job) -> result dict; raising marks the job failed"""
+        self.handlers[kind] = handler
+
+    @property
+    def busy(self) -> int:
+        return self._busy
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.size):
+            name = f"job-worker-{os.getpid()}-{i}"
+            thread = threading.Thread(target=self._run, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        metrics.WORKERS_TOTAL.inc(self.size)
+        log.info(f"Started {self.size} job workers (pid {os.getpid()})")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        worker = threading.current_thread().name
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker)
+            except Exception as e:
+                log.error(f"Error claiming job: {e}")
+                job = None
+
+            if not job:
+                self.queue.wait_for_work(POLL_INTERVAL)
+                continue
+
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                with metrics.WORKERS_BUSY.track():
+                    self._execute(job)
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+
+    def _execute(self, job: Dict):
+        handler = self.handlers.get(job['kind'])
+        if not handler:
+            self.queue.retry_or_bury(job, f"No handler registered for job kind '{job['kind']}'", permanent=True)
+            return
+
+        log.info(f"Running {job['kind']} job {job['id']} (attempt {job['attempts']})")
+        try:
+            result = handler(job)
+            self.queue.complete(job['id'], result or {})
+            log.info(f"✓ Job {job['id']} succeeded")
+        except Exception as e:
+            log.exception(f"❌ Job {job['id']} failed: {e}", job_id=job['id'], kind=job['kind'])
+            self.queue.retry_or_bury(job, str(e), permanent=isinstance(e, PermanentError))
+
+
+# Global queue / pool instances
+_queue = None
+_pool = None
+
+def get_queue() -> JobQueue:
+    """Get the global job queue instance (singleton)"""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+def get_worker_pool() -> WorkerPool:
+    """Get the global worker pool for this process (singleton)"""
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(get_queue())
+    return _pool
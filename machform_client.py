@@ -2,6 +2,110 @@ import pymysql
 import os
 import requests
 from pathlib import Path
+import rate_limit
+import metrics
+import re
+import structured_log
+
+log = structured_log.get_logger('machform')
+
+MACHFORM_BASE_URL = "https://logoscu.com/forms"
+
+
+def parse_csrf_token(html):
+    """Extract the CSRF token from the MachForm login page"""
+    csrf_match = re.search(r'name="csrf_token" value="([^"]+)"', html)
+    return csrf_match.group(1) if csrf_match else None
+
+
+def is_login_page(response):
+    """True when MachForm answered with its login form instead (the admin session expired)"""
+    if 'index.php' in str(response.url):
+        return True
+    if 'text/html' not in response.headers.get('content-type', ''):
+        return False
+    return 'name="admin_username"' in response.text
+
+
+def parse_download_links(html, form_id, entry_id):
+    """Parse download.php links (url + filename) from an entry view page"""
+    # Robust pattern: handles absolute/relative URLs and captures filename
+    # This covers: href="download.php?q=..." OR href="https://logoscu.com/forms/download.php?q=..."
+    pattern = r'href="([^"]*download\.php\?q=[^"]+)"[^>]*>(.*?)</a>'
+    matches = re.findall(pattern, html)
+    
+    links = []
+    
+    if matches:
+        for url, filename in matches:
+            # Clean filename (strip HTML tags if any, though unlikely)
+            clean_filename = re.sub(r'<[^>]+>', '', filename).strip()
+            
+            # Ensure full URL
+            if not url.startswith('http'):
+                if url.startswith('/'):
+                    url = f"https://logoscu.com{url}"
+                else:
+                    url = f"{MACHFORM_BASE_URL}/{url}"
+            
+            # If filename is empty or too long (regex quirk), generate a generic one
+            # but usually link text contains the actual filename with extension
+            if not clean_filename or len(clean_filename) > 200:
+                clean_filename = f"form_{form_id}_entry_{entry_id}_file_{len(links)+1}"
+            
+            links.append({'url': url, 'filename': clean_filename})
+            log.debug(f"Found download: {clean_filename[:40]}")
+    else:
+        log.info(f"No download links found in entry {entry_id}")
+    
+    return links
+
+
+def safe_filename(filename):
+    """Filename safe to join onto the download directory"""
+    return filename.replace('/', '_').replace('\\', '_')
+
+
+def extract_files_from_entry(entry_data, form_id):
+    """Helper to extract file paths from entry data"""
+    files = []
+    entry_id = entry_data.get('id')  # Get entry ID
+    
+    for key, value in entry_data.items():
+        if key.startswith('element_') and value:
+            value_str = str(value)
+            # Filter for actual files
+            if (len(value_str) > 50 and 
+                '_' in value_str and 
+                not value_str.startswith('http') and
+                '@' not in value_str and
+                ('|' in value_str or '.pdf' in value_str.lower() or '.doc' in value_str.lower())):
+                
+                files.append({
+                    'form_id': form_id,
+                    'entry_id': entry_id,  # Add this
+                    'field': key,
+                    'hashed_filename': value_str
+                })
+    return files
+
+
+def machform_operation(method, url):
+    """Metric label for a MachForm admin request"""
+    if 'view_entry.php' in url:
+        return 'view_entry'
+    if 'index.php' in url:
+        return 'login'
+    return 'download'
+
+
+class TimedCursor(pymysql.cursors.DictCursor):
+    """DictCursor that records every statement's latency"""
+
+    def execute(self, query, args=None):
+        with metrics.external_call('machform_db', 'query'):
+            return super().execute(query, args)
+
 
 class MachFormClient:
     def __init__(self):
@@ -10,17 +114,19 @@ class MachFormClient:
             database=os.getenv('MACHFORM_DB_NAME'),
             user=os.getenv('MACHFORM_DB_USER'),
             password=os.getenv('MACHFORM_DB_PASSWORD'),
-            cursorclass=pymysql.cursors.DictCursor
+            cursorclass=TimedCursor
         )
-        print(f"[MACHFORM] Connected to {os.getenv('MACHFORM_DB_HOST')}")
+        log.info(f"Connected to {os.getenv('MACHFORM_DB_HOST')}")
         
         # Session for authenticated requests
-        self.session = requests.Session()
+        session = metrics.instrument_session(requests.Session(), 'machform_http', machform_operation)
+        self.session = rate_limit.throttle_session(session, 'machform_http')
         self.authenticated = False
     
     def get_uploaded_files(self, form_id, entry_id):
         """Get file hashes for a form entry"""
         try:
+            rate_limit.acquire('machform_db')
             with self.connection.cursor() as cursor:
                 # Query for file upload fields (element_42, etc.)
                 sql = f"SELECT * FROM ap_form_{form_id} WHERE id = %s"
@@ -44,13 +150,14 @@ class MachFormClient:
                 return files
                 
         except Exception as e:
-            print(f"[MACHFORM] Error getting files: {e}")
+            log.error(f"Error getting files: {e}")
             return []
 
     def get_files_by_email(self, email):
         """Find all uploaded files for an applicant by email across all active forms"""
         all_files = []
         try:
+            rate_limit.acquire('machform_db')
             with self.connection.cursor() as cursor:
                 # 1. Get all active forms
                 cursor.execute("SELECT form_id, form_name FROM ap_forms WHERE form_active=1")
@@ -83,66 +190,57 @@ class MachFormClient:
                             all_files.extend(entry_files)
                             
                     except Exception as table_err:
-                        print(f"[MACHFORM] Skipping form {form_id}: {table_err}")
+                        log.warning(f"Skipping form {form_id}: {table_err}")
                         continue
                         
             return all_files
             
         except Exception as e:
-            print(f"[MACHFORM] Error searching by email: {e}")
+            log.error(f"Error searching by email: {e}")
             return []
 
+    def iter_entries(self, form_id, after_id=0, batch_size=200):
+        """Yield raw entries of ap_form_{form_id} with id > after_id, oldest first"""
+        last_id = after_id
+        while True:
+            rate_limit.acquire('machform_db')
+            with self.connection.cursor() as cursor:
+                sql = f"SELECT * FROM ap_form_{int(form_id)} WHERE id > %s ORDER BY id ASC LIMIT %s"
+                cursor.execute(sql, (last_id, batch_size))
+                rows = cursor.fetchall()
+            
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            last_id = rows[-1]['id']
+
     def _extract_files_from_entry(self, entry_data, form_id):
         """Helper to extract file paths from entry data"""
-        files = []
-        entry_id = entry_data.get('id')  # Get entry ID
-        
-        for key, value in entry_data.items():
-            if key.startswith('element_') and value:
-                value_str = str(value)
-                # Filter for actual files
-                if (len(value_str) > 50 and 
-                    '_' in value_str and 
-                    not value_str.startswith('http') and
-                    '@' not in value_str and
-                    ('|' in value_str or '.pdf' in value_str.lower() or '.doc' in value_str.lower())):
-                    
-                    files.append({
-                        'form_id': form_id,
-                        'entry_id': entry_id,  # Add this
-                        'field': key,
-                        'hashed_filename': value_str
-                    })
-        return files
-
-        return files
+        return extract_files_from_entry(entry_data, form_id)
 
     def login(self):
         """Authenticate to MachForm admin"""
         try:
-            login_url = "https://logoscu.com/forms/index.php"
+            login_url = f"{MACHFORM_BASE_URL}/index.php"
             
             username = os.getenv('MACHFORM_ADMIN_USER')
             password = os.getenv('MACHFORM_ADMIN_PASSWORD')
             
             if not username or not password:
-                print("[MACHFORM] Admin credentials not found")
+                log.warning("Admin credentials not found")
                 return False
             
             # GET the login page to extract CSRF token
             response = self.session.get(login_url)
             
             # Parse CSRF token from response
-            import re
-            csrf_match = re.search(r'name="csrf_token" value="([^"]+)"', response.text)
+            csrf_token = parse_csrf_token(response.text)
             
-            if not csrf_match:
-                print("[MACHFORM] Could not find CSRF token")
+            if not csrf_token:
+                log.warning("Could not find CSRF token")
                 return False
             
-            csrf_token = csrf_match.group(1)
-            print(f"[MACHFORM] Got CSRF token: {csrf_token[:20]}...")
-            
             # POST login with correct field names
             login_data = {
                 'admin_username': username,
@@ -153,20 +251,19 @@ class MachFormClient:
             
             response = self.session.post(login_url, data=login_data, allow_redirects=True)
             
-            print(f"[MACHFORM] Login response: {response.status_code}")
-            print(f"[MACHFORM] Final URL: {response.url}")
+            log.debug(f"Login response: {response.status_code} ({response.url})")
             
             # Check if logged in
             if 'main_panel' in response.url or 'manage_forms' in response.url:
-                print("[MACHFORM] ✓ Successfully authenticated!")
+                log.info("✓ Successfully authenticated!")
                 self.authenticated = True
                 return True
             else:
-                print(f"[MACHFORM] Login failed - stayed on login page")
+                log.error("Login failed - stayed on login page")
                 return False
                 
         except Exception as e:
-            print(f"[MACHFORM] Login error: {e}")
+            log.error(f"Login error: {e}")
             return False
 
     def get_download_links_from_entry(self, form_id, entry_id):
@@ -176,48 +273,17 @@ class MachFormClient:
                 if not self.login():
                     return []
             
-            entry_url = f"https://logoscu.com/forms/view_entry.php?form_id={form_id}&entry_id={entry_id}"
+            entry_url = f"{MACHFORM_BASE_URL}/view_entry.php?form_id={form_id}&entry_id={entry_id}"
             response = self.session.get(entry_url)
             
             if response.status_code != 200:
-                print(f"[MACHFORM] Failed to load entry page: {response.status_code}")
+                log.error(f"Failed to load entry page: {response.status_code}")
                 return []
             
-            import re
-            
-            # Robust pattern: handles absolute/relative URLs and captures filename
-            # This covers: href="download.php?q=..." OR href="https://logoscu.com/forms/download.php?q=..."
-            pattern = r'href="([^"]*download\.php\?q=[^"]+)"[^>]*>(.*?)</a>'
-            matches = re.findall(pattern, response.text)
-            
-            links = []
-            
-            if matches:
-                for url, filename in matches:
-                    # Clean filename (strip HTML tags if any, though unlikely)
-                    clean_filename = re.sub(r'<[^>]+>', '', filename).strip()
-                    
-                    # Ensure full URL
-                    if not url.startswith('http'):
-                        if url.startswith('/'):
-                            url = f"https://logoscu.com{url}"
-                        else:
-                            url = f"https://logoscu.com/forms/{url}"
-                    
-                    # If filename is empty or too long (regex quirk), generate a generic one
-                    # but usually link text contains the actual filename with extension
-                    if not clean_filename or len(clean_filename) > 200:
-                        clean_filename = f"form_{form_id}_entry_{entry_id}_file_{len(links)+1}"
-                    
-                    links.append({'url': url, 'filename': clean_filename})
-                    print(f"[MACHFORM] Found download: {clean_filename[:40]}")
-            else:
-                print(f"[MACHFORM] No download links found in entry {entry_id}")
-            
-            return links
+            return parse_download_links(response.text, form_id, entry_id)
             
         except Exception as e:
-            print(f"[MACHFORM] Error parsing entry: {e}")
+            log.error(f"Error parsing entry: {e}")
             return []
 
     def download_file_from_link(self, download_url, filename, save_dir='/tmp/machform_files'):
@@ -233,18 +299,18 @@ class MachFormClient:
             
             if response.status_code == 200:
                 # Clean filename
-                safe_filename = filename.replace('/', '_').replace('\\', '_')
-                local_path = f"{save_dir}/{safe_filename}"
+                local_name = safe_filename(filename)
+                local_path = f"{save_dir}/{local_name}"
                 
                 with open(local_path, 'wb') as f:
                     f.write(response.content)
                 
-                print(f"[MACHFORM] ✓ Downloaded: {safe_filename[:50]}")
+                log.info(f"✓ Downloaded: {local_name[:50]}")
                 return local_path
             else:
-                print(f"[MACHFORM] Download failed {filename[:30]}: {response.status_code}")
+                log.error(f"Download failed {filename[:30]}: {response.status_code}")
                 return None
                 
         except Exception as e:
-            print(f"[MACHFORM] Download error: {e}")
+            log.error(f"Download error: {e}")
             return None
@@ -0,0 +1,411 @@
+"""
+Metrics - Latency histograms, counters and gauges for /metrics
+Pipeline STEPs and every external call (Salesforce, MachForm SQL/HTTP, Gemini,
+Resend) are recorded here and rendered in Prometheus text format.
+
+Each gunicorn worker keeps its own values and periodically writes a snapshot
+to METRICS_DIR; /metrics merges the snapshots of every worker so a scrape
+sees the whole service no matter which process answers it.
+"""
+
+import contextvars
+import dataclasses
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import structured_log
+
+log = structured_log.get_logger('metrics')
+
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/admissions_metrics')
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Seconds - external calls range from ~20ms SOQL queries to multi-minute Gemini runs
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Form type / stage of the work currently running (read by external_call)
+_context = contextvars.ContextVar('metrics_context', default={})
+
+_registry: Dict[str, 'Metric'] = {}
+_collectors: List[Callable] = []
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), per_process: bool = True):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        # per_process=False: value is already global (e.g. queue depth) - don't sum across workers
+        self.per_process = per_process
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self) -> List:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in flight"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [count per bucket..., sum, count]
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+
+# --- METRICS ---
+
+STAGE_SECONDS = Histogram('admissions_stage_duration_seconds',
+                          "Duration of each pipeline stage", ('form_type', 'stage'))
+STAGE_TOTAL = Counter('admissions_stage_total',
+                      "Pipeline stages run, by outcome", ('form_type', 'stage', 'outcome'))
+PIPELINE_SECONDS = Histogram('admissions_pipeline_duration_seconds',
+                             "End-to-end pipeline duration per submission", ('form_type', 'outcome'))
+PIPELINES_IN_FLIGHT = Gauge('admissions_pipelines_in_flight', "Pipelines currently running")
+
+EXTERNAL_SECONDS = Histogram('admissions_external_call_duration_seconds',
+                             "Latency of calls to Salesforce, MachForm, Gemini and Resend",
+                             ('service', 'operation', 'form_type', 'stage'))
+EXTERNAL_TOTAL = Counter('admissions_external_calls_total',
+                         "External calls, by outcome", ('service', 'operation', 'form_type', 'stage', 'outcome'))
+
+HTTP_SECONDS = Histogram('admissions_http_request_duration_seconds',
+                         "HTTP request latency", ('method', 'endpoint'))
+HTTP_TOTAL = Counter('admissions_http_requests_total',
+                     "HTTP requests, by status code", ('method', 'endpoint', 'status'))
+HTTP_IN_FLIGHT = Gauge('admissions_http_requests_in_flight', "HTTP requests currently being served")
+
+WORKERS_TOTAL = Gauge('admissions_job_workers', "Job worker threads/tasks started")
+WORKERS_BUSY = Gauge('admissions_job_workers_busy', "Job workers currently running a job")
+QUEUE_JOBS = Gauge('admissions_jobs', "Jobs in the queue, by status", ('status',), per_process=False)
+
+CLASSIFY_SLOTS_IN_USE = Gauge('admissions_classify_slots_in_use', "Classification gate slots held on this host",
+                              per_process=False)
+DEFERRED_TOTAL = Counter('admissions_deferred_total', "Classifications deferred (gate full or Gemini unavailable)",
+                         ('form_type',))
+REJECTED_TOTAL = Counter('admissions_rejected_total', "Requests rejected with 503 by admission control",
+                         ('endpoint',))
+
+CLASSIFICATION_CACHE_TOTAL = Counter('admissions_classification_cache_total',
+                                     "Classification cache lookups and stores", ('outcome',))
+GEMINI_TOKENS = Counter('admissions_gemini_tokens_total',
+                        "Gemini tokens by kind (prompt, cached part of the prompt, output)", ('stage', 'kind'))
+GEMINI_PARSE_TOTAL = Counter('admissions_gemini_parse_total',
+                             "Gemini replies by parse outcome (clean, repaired, failed)", ('stage', 'outcome'))
+GEMINI_FIRST_FIELD_SECONDS = Histogram('admissions_gemini_first_field_seconds',
+                                       "Seconds from a streamed Gemini call to its first complete field", ('stage',))
+GEMINI_LIMITER_WAIT_SECONDS = Histogram('admissions_gemini_limiter_wait_seconds',
+                                        "Time spent waiting for a Gemini rate limit token",
+                                        buckets=(0, 0.1, 0.5, 1, 2, 5, 10, 20, 30))
+GEMINI_LIMITER_RPM = Gauge('admissions_gemini_limiter_rpm', "Gemini requests per minute currently allowed (AIMD)",
+                           per_process=False)
+GEMINI_BREAKER_STATE = Gauge('admissions_gemini_breaker_state', "Gemini circuit breaker: 0 closed, 1 half-open, 2 open",
+                             per_process=False)
+GEMINI_BREAKER_REJECTED = Counter('admissions_gemini_breaker_rejected_total',
+                                  "Gemini calls refused without being sent (open, half_open, wait)", ('reason',))
+GEMINI_THROTTLED_TOTAL = Counter('admissions_gemini_throttled_total', "429 / ResourceExhausted replies from Gemini")
+ADMISSION_RULES_TOTAL = Counter('admissions_rules_total',
+                                "Admission rules evaluations (decided without Gemini, left to the model, fallback)",
+                                ('stage', 'outcome'))
+
+DOCUMENT_PREP_TOTAL = Counter('admissions_document_prep_total',
+                              "Uploaded documents prepared for Gemini (shrunk, unchanged, cached, skipped, failed)",
+                              ('mime_type', 'outcome'))
+DOCUMENT_PREP_BYTES = Counter('admissions_document_prep_bytes_total',
+                              "Bytes of uploaded documents before (in) and after (out) preparation", ('direction',))
+DOCUMENT_FETCH_TOTAL = Counter('admissions_document_fetch_total',
+                               "Uploaded documents served from the prefetch cache, downloaded, or failed",
+                               ('outcome',))
+DOCUMENT_PREP_SECONDS = Histogram('admissions_document_prep_seconds', "CPU time to prepare one document",
+                                  ('mime_type',), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+
+
+# --- INSTRUMENTATION HELPERS ---
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Time a call to a downstream service; exceptions count as errors"""
+    context = _context.get()
+    labels = {'service': service, 'operation': operation,
+              'form_type': context.get('form_type', ''), 'stage': context.get('stage', '')}
+    outcome = 'ok'
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        EXTERNAL_SECONDS.observe(time.perf_counter() - started, **labels)
+        EXTERNAL_TOTAL.inc(outcome=outcome, **labels)
+
+
+def instrument_session(session, service: str, operation_for: Callable[[str, str], str]):
+    """
+    Time every request sent through a requests.Session.
+    operation_for(method, url) names the operation; HTTP >= 400 counts as an error.
+    """
+    original_request = session.request
+
+    def request(method, url, *args, **kwargs):
+        context = _context.get()
+        labels = {'service': service, 'operation': operation_for(method, url),
+                  'form_type': context.get('form_type', ''), 'stage': context.get('stage', '')}
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            response = original_request(method, url, *args, **kwargs)
+            if response.status_code < 400:
+                outcome = 'ok'
+            return response
+        finally:
+            EXTERNAL_SECONDS.observe(time.perf_counter() - started, **labels)
+            EXTERNAL_TOTAL.inc(outcome=outcome, **labels)
+
+    session.request = request
+    return session
+
+
+class StageTimer:
+    """
+    Times the sequential STEPs of one pipeline run.
+    enter(stage) closes the previous stage (as ok) and starts the next;
+    finish(outcome) closes whatever stage is still open.
+    """
+
+    def __init__(self, form_type: str):
+        self.form_type = form_type
+        self.started = time.perf_counter()
+        self.stage = None
+        self.stage_started = None
+        self._token = None
+
+    def enter(self, stage: str):
+        self._close('ok')
+        self.stage = stage
+        self.stage_started = time.perf_counter()
+        self._token = _context.set({'form_type': self.form_type, 'stage': stage})
+
+    def finish(self, outcome: str = 'ok'):
+        self._close(outcome)
+
+    def _close(self, outcome: str):
+        if self.stage is None:
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - self.stage_started, form_type=self.form_type, stage=self.stage)
+        STAGE_TOTAL.inc(form_type=self.form_type, stage=self.stage, outcome=outcome)
+        _context.reset(self._token)
+        self.stage = None
+
+
+@contextmanager
+def stage(form_type: str, name: str):
+    """Time one stage run as a block (stage graph / async pipeline)"""
+    token = _context.set({'form_type': form_type, 'stage': name})
+    outcome = 'ok'
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, form_type=form_type, stage=name)
+        STAGE_TOTAL.inc(form_type=form_type, stage=name, outcome=outcome)
+        _context.reset(token)
+
+
+def track_stages(form_type: str, stages: List) -> List:
+    """Wrap stage_graph.Stage functions so each run is timed and labeled"""
+    def timed(name, func):
+        def run(results):
+            with stage(form_type, name):
+                return func(results)
+        return run
+    return [dataclasses.replace(s, func=timed(s.name, s.func)) for s in stages]
+
+
+@contextmanager
+def pipeline(form_type: str):
+    """
+    Time one whole pipeline run. The block may set result['outcome'] (e.g. the
+    response status); an exception records 'error'.
+    """
+    result = {'outcome': 'ok'}
+    started = time.perf_counter()
+    PIPELINES_IN_FLIGHT.inc()
+    try:
+        yield result
+    except BaseException:
+        result['outcome'] = 'error'
+        raise
+    finally:
+        PIPELINES_IN_FLIGHT.dec()
+        PIPELINE_SECONDS.observe(time.perf_counter() - started, form_type=form_type, outcome=result['outcome'])
+
+
+def register_collector(func: Callable):
+    """func() is called before every render to refresh sampled gauges"""
+    _collectors.append(func)
+
+
+# --- MULTI-PROCESS SNAPSHOTS ---
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"metrics_{pid}.json")
+
+
+def flush():
+    """Write this process's values where other workers can merge them"""
+    data = {name: metric.snapshot() for name, metric in _registry.items() if metric.per_process}
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning(f"Could not write snapshot: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def _load_snapshots() -> List[Tuple[int, Dict]]:
+    snapshots = []
+    if not os.path.isdir(METRICS_DIR):
+        return snapshots
+    for filename in os.listdir(METRICS_DIR):
+        if not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        try:
+            pid = int(filename[len('metrics_'):-len('.json')])
+            with open(os.path.join(METRICS_DIR, filename), 'r', encoding='utf-8') as f:
+                snapshots.append((pid, json.load(f)))
+        except (ValueError, OSError):
+            continue
+    return snapshots
+
+
+def _merge(metric: Metric, snapshots: List[Tuple[int, Dict]]) -> Dict[Tuple, object]:
+    if not metric.per_process:
+        return {tuple(key): value for key, value in metric.snapshot()}
+    merged = {}
+    for pid, data in snapshots:
+        # Counters/histograms of exited workers still count; their gauges don't
+        if metric.kind == 'gauge' and not _pid_alive(pid):
+            continue
+        for key, value in data.get(metric.name, []):
+            key = tuple(key)
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(n, v) for n, v in zip(names, values) if v != '']
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+def render() -> str:
+    """All metrics, merged across worker processes, in Prometheus text format"""
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            log.error(f"Collector failed: {e}")
+    flush()
+    snapshots = _load_snapshots()
+
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(_merge(metric, snapshots).items()):
+            if metric.kind == 'histogram':
+                for bound, count in zip(metric.buckets, value):
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, ('le', '+Inf'))} {value[-1]}")
+                lines.append(f"{metric.name}_sum{_format_labels(metric.labels, key)} {value[-2]}")
+                lines.append(f"{metric.name}_count{_format_labels(metric.labels, key)} {value[-1]}")
+            else:
+                lines.append(f"{metric.name}{_format_labels(metric.labels, key)} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+
+def start_flusher():
+    """Periodically publish this process's snapshot (call once per worker process)"""
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            flush()
+    threading.Thread(target=run, name=f"metrics-flush-{os.getpid()}", daemon=True).start()
@@ -0,0 +1,83 @@
+"""
+Rate Limiting - Token buckets per downstream service
+Clients call acquire('<service>') before each outbound request. Services with
+no configured limit are not throttled, so the webhook path is unaffected
+unless a limit is set (e.g. by the backfill CLI or RATE_LIMITS env var).
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import structured_log
+
+log = structured_log.get_logger('rate_limit')
+
+# Known services: salesforce, machform_db, machform_http, gemini, resend
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` stored"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until tokens are available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_limiters: Dict[str, TokenBucket] = {}
+
+
+def configure(service: str, rate: float, burst: Optional[float] = None):
+    """Limit a service to `rate` requests per second"""
+    _limiters[service] = TokenBucket(rate, burst)
+    log.info(f"{service}: {rate}/s (burst {_limiters[service].burst:g})")
+
+
+def configure_from_string(spec: str):
+    """Parse 'salesforce=5,gemini=0.5' style limits"""
+    for part in (spec or '').split(','):
+        if '=' in part:
+            service, rate = part.split('=', 1)
+            configure(service.strip(), float(rate))
+
+
+def acquire(service: str) -> float:
+    """Wait for a slot on the service's limiter (no-op if unlimited)"""
+    limiter = _limiters.get(service)
+    if not limiter:
+        return 0.0
+    return limiter.acquire()
+
+
+def throttle_session(session, service: str):
+    """Make every request sent through a requests.Session acquire a slot first"""
+    original_request = session.request
+
+    def request(method, url, *args, **kwargs):
+        acquire(service)
+        return original_request(method, url, *args, **kwargs)
+
+    session.request = request
+    return session
+
+
+configure_from_string(os.getenv('RATE_LIMITS', ''))
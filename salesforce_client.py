@@ -2,12 +2,70 @@
 Salesforce Client - Handles all Salesforce API interactions
 """
 import os
-from simple_salesforce import Salesforce
+import json
+import threading
 from datetime import datetime
+import rate_limit
+import metrics
+import structured_log
+
+log = structured_log.get_logger('salesforce')
+
+
+# --- Record builders (shared by the sync client, bulk methods and async client) ---
+
+def lead_record(email, first_name, last_name):
+    return {
+        'FirstName': first_name,
+        'LastName': last_name,
+        'Email': email,
+        'Company': 'UCL Applicant',
+        'Status': 'Open - Not Contacted'
+    }
+
+
+def form_submission_record(lead_id, form_type, form_data_json):
+    return {
+        'Lead__c': lead_id,
+        'Form_Type__c': form_type,
+        'Form_Data_JSON__c': form_data_json[:131072],  # Respect field length
+        'Submission_Date__c': datetime.utcnow().isoformat(),
+        'Status__c': 'Received'
+    }
+
+
+def lead_count_update(count):
+    return {
+        'Forms_Submitted_Count__c': count,
+        'Forms_Complete__c': count >= 3,
+        'Last_Form_Received__c': datetime.utcnow().isoformat()
+    }
+
+
+def classification_record(lead_id, classification_data, status):
+    return {
+        'Lead__c': lead_id,
+        'Recommended_Level__c': classification_data.get('recommended_level', '')[:100],
+        'Recommended_Programs__c': '\n'.join(classification_data.get('recommended_programs', []))[:32768],
+        'Confidence_Score__c': classification_data.get('confidence_score', 0),
+        'Classification_Date__c': datetime.utcnow().isoformat(),
+        'Gemini_Response_JSON__c': json.dumps(classification_data, ensure_ascii=False)[:131072],
+        'Status__c': status
+    }
+
+
+def salesforce_operation(method, url):
+    """Metric label for a Salesforce REST request"""
+    if '/query' in url:
+        return 'query'
+    if '/composite/' in url:
+        return 'composite'
+    return {'POST': 'create', 'PATCH': 'update', 'DELETE': 'delete'}.get(method.upper(), 'get')
+
 
 class SalesforceClient:
-    def __init__(self):
-        """Initialize Salesforce connection"""
+    def __init__(self, connect: bool = True):
+        """Initialize Salesforce connection (connect=False leaves it to connect_in_background)"""
         self.instance_url = os.getenv('SALESFORCE_INSTANCE_URL')
         self.consumer_key = os.getenv('SALESFORCE_CONSUMER_KEY')
         self.consumer_secret = os.getenv('SALESFORCE_CONSUMER_SECRET')
@@ -16,15 +74,36 @@ class SalesforceClient:
         self.security_token = os.getenv('SALESFORCE_SECURITY_TOKEN')
         
         self.sf = None
-        self._connect()
+        # disconnected -> connecting -> connected | failed
+        self.state = 'disconnected'
+        self._connect_lock = threading.Lock()
+        if connect:
+            self._connect()
+
+    @property
+    def ready(self) -> bool:
+        return self.sf is not None
+
+    def connect_in_background(self):
+        """Log in on a daemon thread so importing the app never waits on Salesforce"""
+        if self.sf or self.state == 'connecting':
+            return
+        self.state = 'connecting'
+        threading.Thread(target=self._connect, name="salesforce-connect", daemon=True).start()
     
     def _connect(self):
         """Establish connection to Salesforce"""
+        with self._connect_lock:
+            if self.sf:
+                return
+            self._login()
+
+    def _login(self):
+        self.state = 'connecting'
         try:
-            print(f"[SALESFORCE DEBUG] Username: {self.username}")
-            print(f"[SALESFORCE DEBUG] Password length: {len(self.password) if self.password else 0}")
-            print(f"[SALESFORCE DEBUG] Security Token: {'Yes' if self.security_token else 'No (External)'}")
-            
+            # simple_salesforce (and its zeep/requests stack) is only needed once we log in
+            from simple_salesforce import Salesforce
+
             # Use explicit token parameter if available (FIX for invalid_grant)
             self.sf = Salesforce(
                 username=self.username,
@@ -34,13 +113,31 @@ class SalesforceClient:
                 consumer_secret=self.consumer_secret,
                 domain='login' 
             )
-            print("[SALESFORCE] ✓ Connected successfully")
+            # Time the call itself, not the wait for a rate-limit slot
+            metrics.instrument_session(self.sf.session, 'salesforce', salesforce_operation)
+            rate_limit.throttle_session(self.sf.session, 'salesforce')
+            self.state = 'connected'
+            log.info("✓ Connected successfully")
         except Exception as e:
-            print(f"[SALESFORCE] ❌ Connection failed: {e}")
+            log.error(f"❌ Connection failed: {e}")
             self.sf = None
+            self.state = 'failed'
     
+    def ensure_connected(self):
+        """
+        Log in if not connected yet: waits for a background login in progress,
+        and retries one that failed (retried jobs call this first)
+        """
+        if not self.sf:
+            self._connect()
+        return self.sf is not None
+
     def find_or_create_lead(self, email, first_name, last_name, max_retries=3):
-        """Find existing Lead by email or create new one with retry logic for race conditions"""
+        """
+        Find existing Lead by email or create new one.
+        Callers serialize per applicant with applicant_lock, so a miss means no Lead
+        exists yet - no need to wait for concurrent creations to commit.
+        """
         if not self.sf:
             return None
         
@@ -48,52 +145,39 @@ class SalesforceClient:
         clean_email = email.strip().lower() if email else email
         
         for attempt in range(max_retries):
-            print(f"[SALESFORCE] Searching for Lead with email: '{clean_email}' (attempt {attempt + 1}/{max_retries})")
+            log.debug(f"Searching for Lead with email: '{clean_email}' (attempt {attempt + 1}/{max_retries})")
             
             try:
                 # Search for existing Lead - ORDER BY CreatedDate DESC ensures we get the latest if duplicates exist
                 query = f"SELECT Id, Email, FirstName, LastName FROM Lead WHERE Email = '{clean_email}' ORDER BY CreatedDate DESC LIMIT 1"
                 
                 results = self.sf.query(query)
-                print(f"[SALESFORCE] Query returned {results['totalSize']} records")
+                log.debug(f"Query returned {results['totalSize']} records")
                 
                 if results['totalSize'] > 0:
                     lead_id = results['records'][0]['Id']
-                    print(f"[SALESFORCE] Found existing Lead: {lead_id}")
+                    log.info(f"Found existing Lead: {lead_id}")
                     return lead_id
-                
-                # If no lead found and not last attempt, wait briefly for Salesforce to commit concurrent creations
-                if attempt < max_retries - 1:
-                    print(f"[SALESFORCE] No lead found, waiting 2s before retry...")
-                    import time
-                    time.sleep(2)
+                break
                     
             except Exception as e:
-                print(f"[SALESFORCE] Error querying Lead: {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2)
-                else:
+                # Only transient query errors are retried
+                log.error(f"Error querying Lead: {e}")
+                if attempt == max_retries - 1:
                     return None
         
-        print(f"[SALESFORCE] No existing Lead found after {max_retries} attempts, creating new one")
+        log.info("No existing Lead found, creating new one")
         try:
             # Create new Lead
-            lead_data = {
-                'FirstName': first_name,
-                'LastName': last_name,
-                'Email': clean_email,
-                'Company': 'UCL Applicant',
-                'Status': 'Open - Not Contacted'
-            }
+            lead_data = lead_record(clean_email, first_name, last_name)
             
             result = self.sf.Lead.create(lead_data)
             lead_id = result['id']
-            print(f"[SALESFORCE] Successfully created new Lead: {lead_id}")
+            log.info(f"Successfully created new Lead: {lead_id}")
             return lead_id
             
         except Exception as e:
-            print(f"[SALESFORCE] Error creating Lead: {e}")
+            log.error(f"Error creating Lead: {e}")
             return None
     
     def create_form_submission(self, lead_id, form_type, form_data_json):
@@ -102,25 +186,19 @@ class SalesforceClient:
             return None
         
         try:
-            submission_data = {
-                'Lead__c': lead_id,
-                'Form_Type__c': form_type,
-                'Form_Data_JSON__c': form_data_json[:131072],  # Respect field length
-                'Submission_Date__c': datetime.utcnow().isoformat(),
-                'Status__c': 'Received'
-            }
+            submission_data = form_submission_record(lead_id, form_type, form_data_json)
             
             result = self.sf.Form_Submission__c.create(submission_data)
             submission_id = result['id']
-            print(f"[SALESFORCE] Created Form_Submission: {submission_id}")
+            log.info(f"Created Form_Submission: {submission_id}")
             return submission_id
             
         except Exception as e:
-            print(f"[SALESFORCE] Error creating Form_Submission: {e}")
+            log.error(f"Error creating Form_Submission: {e}")
             return None
     
     def update_lead_form_count(self, lead_id):
-        """Update Lead's form count and check if complete"""
+        """Update Lead's form count and check if complete (None if the update failed)"""
         if not self.sf or not lead_id:
             return
         
@@ -131,20 +209,16 @@ class SalesforceClient:
             count = result['totalSize']
             
             # Update Lead
-            update_data = {
-                'Forms_Submitted_Count__c': count,
-                'Forms_Complete__c': count >= 3,
-                'Last_Form_Received__c': datetime.utcnow().isoformat()
-            }
+            update_data = lead_count_update(count)
             
             self.sf.Lead.update(lead_id, update_data)
-            print(f"[SALESFORCE] Updated Lead form count: {count}/3")
+            log.info(f"Updated Lead form count: {count}/3")
             
             return count >= 3
             
         except Exception as e:
-            print(f"[SALESFORCE] Error updating Lead: {e}")
-            return False
+            log.error(f"Error updating Lead: {e}")
+            return None
     
     def create_classification(self, lead_id, classification_data, status='Preliminary'):
         """Create Classification__c record"""
@@ -152,25 +226,15 @@ class SalesforceClient:
             return None
         
         try:
-            import json
-            
-            classification_record = {
-                'Lead__c': lead_id,
-                'Recommended_Level__c': classification_data.get('recommended_level', '')[:100],
-                'Recommended_Programs__c': '\n'.join(classification_data.get('recommended_programs', []))[:32768],
-                'Confidence_Score__c': classification_data.get('confidence_score', 0),
-                'Classification_Date__c': datetime.utcnow().isoformat(),
-                'Gemini_Response_JSON__c': json.dumps(classification_data, ensure_ascii=False)[:131072],
-                'Status__c': status
-            }
+            record = classification_record(lead_id, classification_data, status)
             
-            result = self.sf.Classification__c.create(classification_record)
+            result = self.sf.Classification__c.create(record)
             classification_id = result['id']
-            print(f"[SALESFORCE] Created Classification ({status}): {classification_id}")
+            log.info(f"Created Classification ({status}): {classification_id}")
             return classification_id
             
         except Exception as e:
-            print(f"[SALESFORCE] Error creating Classification: {e}")
+            log.error(f"Error creating Classification: {e}")
             return None
     
     def get_all_form_submissions(self, lead_id):
@@ -189,7 +253,7 @@ class SalesforceClient:
             return results['records']
             
         except Exception as e:
-            print(f"[SALESFORCE] Error fetching submissions: {e}")
+            log.error(f"Error fetching submissions: {e}")
             return []
 
     def check_duplicate_form_type(self, lead_id, form_type):
@@ -202,11 +266,11 @@ class SalesforceClient:
             result = self.sf.query(query)
             return result['totalSize'] > 0
         except Exception as e:
-            print(f"[SALESFORCE] Error checking for duplicate: {e}")
+            log.error(f"Error checking for duplicate: {e}")
             return False
 
     def get_submitted_form_types(self, lead_id):
-        """Return list of form types already submitted by this Lead"""
+        """Return list of form types already submitted by this Lead (None if the query failed)"""
         if not self.sf or not lead_id:
             return []
 
@@ -215,5 +279,132 @@ class SalesforceClient:
             results = self.sf.query(query)
             return [r['Form_Type__c'] for r in results['records']]
         except Exception as e:
-            print(f"[SALESFORCE] Error fetching submitted form types: {e}")
-            return []
\ No newline at end of file
+            log.error(f"Error fetching submitted form types: {e}")
+            return None
+
+    # --- BULK / COLLECTION OPERATIONS (used by /webhook/batch) ---
+
+    COLLECTION_SIZE = 200  # sObject Collections API limit per request
+    IN_CLAUSE_SIZE = 200   # Keep SOQL under the query length limit
+
+    def _collection_request(self, method, records):
+        """Send records through the sObject Collections API in chunks of 200"""
+        results = []
+        for i in range(0, len(records), self.COLLECTION_SIZE):
+            chunk = records[i:i + self.COLLECTION_SIZE]
+            response = self.sf.restful(
+                'composite/sobjects',
+                method=method,
+                data=json.dumps({'allOrNone': False, 'records': chunk}, ensure_ascii=False)
+            )
+            results.extend(response)
+        return results
+
+    def find_leads_by_emails(self, emails):
+        """Return {normalized_email: lead_id} for existing Leads, one query per 200 emails (None if a query failed)"""
+        if not self.sf or not emails:
+            return {}
+
+        clean_emails = sorted({e.strip().lower() for e in emails if e})
+        leads = {}
+        try:
+            for i in range(0, len(clean_emails), self.IN_CLAUSE_SIZE):
+                chunk = clean_emails[i:i + self.IN_CLAUSE_SIZE]
+                emails_str = "','".join(e.replace("'", "\\'") for e in chunk)
+                # Oldest first so the latest Lead wins, matching find_or_create_lead
+                results = self.sf.query_all(
+                    f"SELECT Id, Email FROM Lead WHERE Email IN ('{emails_str}') ORDER BY CreatedDate ASC"
+                )
+                for record in results['records']:
+                    leads[(record.get('Email') or '').strip().lower()] = record['Id']
+            log.info(f"Bulk lookup found {len(leads)}/{len(clean_emails)} Leads")
+        except Exception as e:
+            log.error(f"Error in bulk Lead lookup: {e}")
+            return None
+        return leads
+
+    def create_leads(self, applicants):
+        """
+        Create Leads for [{'email', 'first_name', 'last_name'}, ...].
+        Returns {normalized_email: lead_id} for the ones that succeeded.
+        """
+        if not self.sf or not applicants:
+            return {}
+
+        records = [{
+            'attributes': {'type': 'Lead'},
+            **lead_record(a['email'].strip().lower(), a.get('first_name') or 'Unknown', a.get('last_name') or 'Unknown')
+        } for a in applicants]
+
+        created = {}
+        try:
+            for record, result in zip(records, self._collection_request('POST', records)):
+                if result.get('success'):
+                    created[record['Email']] = result['id']
+                else:
+                    log.error(f"Error creating Lead {record['Email']}: {result.get('errors')}")
+            log.info(f"Bulk created {len(created)}/{len(records)} Leads")
+        except Exception as e:
+            log.error(f"Error in bulk Lead creation: {e}")
+        return created
+
+    def get_submitted_form_types_bulk(self, lead_ids):
+        """Return {lead_id: [form_type, ...]} for many Leads at once (None if a query failed)"""
+        if not self.sf or not lead_ids:
+            return {}
+
+        lead_ids = list(lead_ids)
+        types = {lead_id: [] for lead_id in lead_ids}
+        try:
+            for i in range(0, len(lead_ids), self.IN_CLAUSE_SIZE):
+                ids_str = "','".join(lead_ids[i:i + self.IN_CLAUSE_SIZE])
+                results = self.sf.query_all(
+                    f"SELECT Lead__c, Form_Type__c FROM Form_Submission__c WHERE Lead__c IN ('{ids_str}')"
+                )
+                for record in results['records']:
+                    types.setdefault(record['Lead__c'], []).append(record['Form_Type__c'])
+        except Exception as e:
+            log.error(f"Error fetching submitted form types in bulk: {e}")
+            return None
+        return types
+
+    def create_form_submissions(self, submissions):
+        """
+        Create Form_Submission__c records for [{'lead_id', 'form_type', 'form_data_json'}, ...].
+        Returns a list of record ids (None where the insert failed), in input order.
+        """
+        if not self.sf or not submissions:
+            return [None] * len(submissions)
+
+        records = [{
+            'attributes': {'type': 'Form_Submission__c'},
+            **form_submission_record(s['lead_id'], s['form_type'], s['form_data_json'])
+        } for s in submissions]
+
+        try:
+            results = self._collection_request('POST', records)
+            ids = [r['id'] if r.get('success') else None for r in results]
+            log.info(f"Bulk created {sum(1 for i in ids if i)}/{len(records)} Form_Submissions")
+            return ids
+        except Exception as e:
+            log.error(f"Error in bulk Form_Submission creation: {e}")
+            return [None] * len(submissions)
+
+    def update_lead_form_counts(self, counts):
+        """Update Forms_Submitted_Count__c / Forms_Complete__c for {lead_id: count}"""
+        if not self.sf or not counts:
+            return False
+
+        records = [{
+            'attributes': {'type': 'Lead'},
+            'Id': lead_id,
+            **lead_count_update(count)
+        } for lead_id, count in counts.items()]
+
+        try:
+            results = self._collection_request('PATCH', records)
+            log.info(f"Bulk updated form counts on {len(results)} Leads")
+            return all(r.get('success') for r in results)
+        except Exception as e:
+            log.error(f"Error in bulk Lead update: {e}")
+            return False
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Stage Graph - Declarative pipeline stages with explicit dependencies
+Independent stages run concurrently on a thread pool, so the wall-clock time
+of a run is its critical path instead of the sum of every stage.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class Stage:
+    """
+    One unit of pipeline work.
+    func receives a dict of results from all completed stages (keyed by stage name).
+    """
+    name: str
+    func: Callable[[Dict], object]
+    deps: List[str] = field(default_factory=list)
+
+
+class StageFailed(Exception):
+    """Raised when a stage raises; dependents of the failed stage are skipped"""
+
+    def __init__(self, stage: str, error: Exception, timings: Dict):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+        self.timings = timings
+
+
+class StageGraph:
+    """Validates a set of stages and executes them in dependency order"""
+
+    def __init__(self, stages: List[Stage], max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self._validate()
+
+    def _validate(self):
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+        # Detect cycles with a depth-first walk
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self, on_stage_start: Optional[Callable[[str], None]] = None):
+        """
+        Execute all stages. Returns (results, timings) where timings maps
+        stage name -> {'start': offset_s, 'duration': seconds, 'status': ...}.
+        Raises StageFailed for the first stage that raised.
+        """
+        results: Dict[str, object] = {}
+        timings: Dict[str, Dict] = {}
+        pending = dict(self.stages)
+        running = {}
+        failure = None
+        lock = threading.Lock()
+        t0 = time.perf_counter()
+
+        def execute(stage: Stage):
+            if on_stage_start:
+                on_stage_start(stage.name)
+            started = time.perf_counter()
+            try:
+                with lock:
+                    snapshot = dict(results)
+                return stage.func(snapshot)
+            finally:
+                timings[stage.name] = {
+                    'start': round(started - t0, 3),
+                    'duration': round(time.perf_counter() - started, 3),
+                }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                if not failure:
+                    ready = [s for s in pending.values() if all(d in results for d in s.deps)]
+                    for stage in ready:
+                        del pending[stage.name]
+                        running[pool.submit(execute, stage)] = stage.name
+
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        value = future.result()
+                        with lock:
+                            results[name] = value
+                        timings[name]['status'] = 'ok'
+                    except Exception as e:
+                        timings[name]['status'] = 'failed'
+                        if not failure:
+                            failure = (name, e)
+
+        for name in pending:
+            timings[name] = {'status': 'skipped'}
+        timings['_total'] = {'duration': round(time.perf_counter() - t0, 3)}
+
+        if failure:
+            raise StageFailed(failure[0], failure[1], timings)
+        return results, timings
@@ -0,0 +1,161 @@
+"""
+Structured Logging - Leveled, sampled, non-blocking logs for the service
+Call sites log through get_logger('<category>'); records are handed to a
+QueueHandler and written to stdout by a background listener thread, so a
+slow log sink never stalls a webhook. Output is JSON lines by default
+(LOG_FORMAT=text for local runs).
+
+Environment:
+    LOG_LEVEL=INFO                      minimum level for every category
+    LOG_LEVELS=field_analysis=DEBUG     per-category overrides
+    LOG_SAMPLING=queue=0.1              keep this fraction of DEBUG/INFO records
+                                        (warnings and errors are never sampled)
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Dict
+
+ROOT_LOGGER = 'admissions'
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_loggers: Dict[str, 'StructuredLogger'] = {}
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    """'queue=0.1,gemini=0.5' -> {'queue': '0.1', 'gemini': '0.5'}"""
+    pairs = {}
+    for part in (spec or '').split(','):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            pairs[key.strip()] = value.strip()
+    return pairs
+
+
+_levels = {category: level.upper() for category, level in _parse_pairs(os.getenv('LOG_LEVELS', '')).items()}
+_sampling = {category: float(rate) for category, rate in _parse_pairs(os.getenv('LOG_SAMPLING', '')).items()}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, category, msg plus structured fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'category': record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        category = record.name[len(ROOT_LOGGER) + 1:].upper() or ROOT_LOGGER.upper()
+        fields = getattr(record, 'fields', {})
+        line = f"[{category}] {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Render the message and traceback on the caller's thread, keep the rest for the formatter"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger for one category. Extra keyword arguments become structured fields:
+        log.info("Created Lead", lead_id=lead_id)
+    """
+
+    def __init__(self, logger: logging.Logger, category: str):
+        super().__init__(logger, {})
+        self.category = category
+        self.sample_rate = _sampling.get(category, 1.0)
+
+    def sampled(self, level: int = logging.DEBUG) -> bool:
+        """True if a record at this level would be written (guard expensive log-only work)"""
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def log(self, level, msg, *args, exc_info=None, **fields):
+        if self.sampled(level):
+            self.emit(level, msg, *args, exc_info=exc_info, **fields)
+
+    def emit(self, level, msg, *args, exc_info=None, **fields):
+        """Write without sampling - for callers that already checked sampled()"""
+        self.logger.log(level, msg, *args, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, msg, *args, **fields):
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg, *args, **fields):
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg, *args, **fields):
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, exc_info=True, **fields)
+
+
+def configure():
+    """Route every admissions.* logger through a queue to a background writer (idempotent)"""
+    global _configured, _listener
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        root.addHandler(_QueueHandler(log_queue))
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        _configured = True
+
+
+def get_logger(category: str) -> StructuredLogger:
+    """Get the logger for a category (salesforce, gemini, queue, ...)"""
+    if category not in _loggers:
+        configure()
+        logger = logging.getLogger(f"{ROOT_LOGGER}.{category}")
+        if category in _levels:
+            logger.setLevel(_levels[category])
+        _loggers[category] = StructuredLogger(logger, category)
+    return _loggers[category]
@@ -0,0 +1,289 @@
+"""
+Structured Output - Response schemas and a tolerant JSON parser for Gemini
+Each classification stage asks Gemini for JSON constrained to a response
+schema, and its answer is read with parse(): code fences and surrounding prose
+are ignored, trailing commas removed, and a reply cut off mid-object (e.g. at
+max_output_tokens) is closed at the last complete value. The result is then
+checked against the schema's required keys and simple types, so a formatting
+glitch is fixed locally instead of costing another model call.
+
+FieldStream reads a streamed reply the same way and reports each field as
+soon as its value is complete, for live progress on the dashboard.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import structured_log
+
+log = structured_log.get_logger('classifier')
+
+# Schemas use the Vertex AI (OpenAPI subset) format. Gemini schemas can't
+# describe free-form maps, so program_explanations is requested as a list of
+# {program, explanation} and turned back into a dict by parse().
+SINGLE_FORM_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'recommended_level': {'type': 'STRING'},
+        'recommended_programs': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'justification': {'type': 'STRING'},
+        'admissions_notes': {'type': 'STRING'},
+        'confidence_score': {'type': 'INTEGER'},
+        'pending_documents': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+    },
+    'required': ['recommended_level', 'recommended_programs', 'justification', 'admissions_notes',
+                 'confidence_score'],
+}
+
+MULTI_FORM_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'recommended_level': {'type': 'STRING'},
+        'recommended_programs': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'program_explanations': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {'program': {'type': 'STRING'}, 'explanation': {'type': 'STRING'}},
+                'required': ['program', 'explanation'],
+            },
+        },
+        'confidence_score': {'type': 'INTEGER'},
+        'reasoning': {
+            'type': 'OBJECT',
+            'properties': {
+                'educational_assessment': {'type': 'STRING'},
+                'ministry_experience_assessment': {'type': 'STRING'},
+                'pastoral_recommendation_assessment': {'type': 'STRING'},
+                'documents_missing': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+                'pathway_explanation': {'type': 'STRING'},
+            },
+            'required': ['educational_assessment', 'ministry_experience_assessment',
+                         'pastoral_recommendation_assessment', 'documents_missing'],
+        },
+        'next_steps': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'admissions_notes': {'type': 'STRING'},
+    },
+    'required': ['recommended_level', 'recommended_programs', 'confidence_score', 'reasoning', 'next_steps'],
+}
+
+# Phase one of Stage 2: what a single uploaded document shows (see document_facts)
+DOCUMENT_FACTS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'document_type': {'type': 'STRING', 'enum': ['diploma', 'transcript', 'degree_certificate',
+                                                     'ministry_certificate', 'recommendation_letter',
+                                                     'identification', 'payment_receipt', 'photo', 'other']},
+        'degree_level': {'type': 'STRING', 'enum': ['none', 'high_school', 'technical', 'bachelor', 'master',
+                                                    'doctorate']},
+        'degree_title': {'type': 'STRING', 'nullable': True},
+        'institution': {'type': 'STRING', 'nullable': True},
+        'orientation': {'type': 'STRING', 'enum': ['ministerial', 'secular', 'unknown']},
+        'year': {'type': 'INTEGER', 'nullable': True},
+        'notes': {'type': 'STRING'},
+    },
+    'required': ['document_type', 'degree_level', 'orientation'],
+}
+
+# Older models (and callers without a schema) may still wrap the JSON in a fence
+FENCE = re.compile(r'```(?:json)?', re.IGNORECASE)
+CLOSERS = {'{': '}', '[': ']'}
+# Cut points tried (newest first) before giving up on a truncated reply
+MAX_CUTS = 64
+
+
+class ParseError(ValueError):
+    """The model's reply could not be turned into a valid classification"""
+
+
+def _scan(text: str) -> Tuple[str, List[str], bool, List[Tuple[int, List[str]]]]:
+    """
+    One pass over the first JSON object in text.
+    Returns (cleaned text, brackets still open, ended inside a string, cut points).
+    Trailing commas are dropped; anything after the object closes is ignored.
+    A cut point is a prefix length that ends between two members, with the
+    brackets open at that point.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[Tuple[int, List[str]]] = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+            out.append(char)
+            cuts.append((len(out), list(stack)))
+            continue
+        elif char in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+            continue
+        elif char == ',':
+            cuts.append((len(out), list(stack)))
+        out.append(char)
+    return ''.join(out), stack, in_string, cuts
+
+
+def _close(prefix: str, stack: List[str]) -> str:
+    prefix = prefix.rstrip()
+    if prefix.endswith(','):
+        prefix = prefix[:-1].rstrip()
+    if prefix.endswith(':'):
+        prefix += ' null'
+    return prefix + ''.join(reversed(stack))
+
+
+def loads(text: str) -> Tuple[Any, bool]:
+    """
+    Parse the JSON object in a model reply, repairing it if needed.
+    Returns (value, repaired). Raises ParseError when nothing usable is left.
+    """
+    text = FENCE.sub('', text or '').strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+
+    start = text.find('{')
+    if start < 0:
+        raise ParseError("No JSON object in response")
+    cleaned, stack, in_string, cuts = _scan(text[start:])
+
+    # Closed properly once stray commas/trailing prose are gone, or cut off mid-reply
+    candidates = [_close(cleaned + ('"' if in_string else ''), stack)]
+    candidates += [_close(cleaned[:length], open_stack) for length, open_stack in reversed(cuts[-MAX_CUTS:])]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            continue
+    raise ParseError("Response is not repairable JSON")
+
+
+def _coerce(value: Any, schema: Dict, path: str) -> Any:
+    """Check value against a schema node, fixing the harmless mismatches"""
+    kind = schema.get('type')
+    if kind == 'OBJECT':
+        if not isinstance(value, dict):
+            raise ParseError(f"{path or 'response'} is not an object")
+        missing = [key for key in schema.get('required', []) if value.get(key) is None]
+        if missing:
+            raise ParseError(f"{path or 'response'} is missing {', '.join(missing)}")
+        for key, child in schema.get('properties', {}).items():
+            if value.get(key) is not None:
+                value[key] = _coerce(value[key], child, f"{path}.{key}" if path else key)
+        return value
+    if kind == 'ARRAY':
+        if not isinstance(value, list):
+            value = [value]
+        items = []
+        for item in value:
+            # A malformed element (often the one a truncated reply cut short) is dropped, not fatal
+            try:
+                items.append(_coerce(item, schema.get('items', {}), f"{path}[]"))
+            except ParseError:
+                continue
+        return items
+    if kind == 'INTEGER':
+        if isinstance(value, bool):
+            raise ParseError(f"{path} is not a number")
+        try:
+            return int(round(float(str(value).strip().rstrip('%'))))
+        except ValueError:
+            raise ParseError(f"{path} is not a number")
+    if kind == 'STRING' and not isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+
+def parse(text: str, schema: Dict, stage: Optional[str] = None) -> Dict:
+    """
+    Read a classification from a model reply and validate it against schema.
+    Raises ParseError if it can't be repaired or lacks a required key.
+    """
+    try:
+        value, repaired = loads(text)
+        classification = _coerce(value, schema, '')
+    except ParseError as e:
+        metrics.GEMINI_PARSE_TOTAL.inc(stage=stage or 'unknown', outcome='failed')
+        log.error(f"Unusable Gemini response: {e}", stage=stage, response_chars=len(text or ''))
+        raise
+
+    explanations = classification.get('program_explanations')
+    if isinstance(explanations, list):
+        classification['program_explanations'] = {
+            item['program']: item['explanation'] for item in explanations if isinstance(item, dict)
+        }
+
+    metrics.GEMINI_PARSE_TOTAL.inc(stage=stage or 'unknown', outcome='repaired' if repaired else 'clean')
+    if repaired:
+        log.warning("Repaired malformed Gemini JSON", stage=stage, response_chars=len(text or ''))
+    return classification
+
+
+class FieldStream:
+    """
+    Incremental reader for a streamed reply. feed() each chunk of text and get
+    back the (field, value) pairs that became complete; members of the objects
+    named in `nested` (e.g. reasoning) are reported one by one as
+    "reasoning.educational_assessment". A value counts as complete once the
+    next field has started, so nothing is reported half-written.
+    """
+
+    def __init__(self, nested: Tuple[str, ...] = ('reasoning',)):
+        self.nested = nested
+        self.text = ''
+        self.emitted = set()
+
+    def _fields(self, value: Dict, done: bool) -> List[Tuple[str, Any]]:
+        fields = []
+        keys = list(value)
+        for index, key in enumerate(keys):
+            complete = done or index < len(keys) - 1
+            if key in self.nested and isinstance(value[key], dict):
+                members = list(value[key])
+                for member_index, member in enumerate(members):
+                    if complete or member_index < len(members) - 1:
+                        fields.append((f"{key}.{member}", value[key][member]))
+            elif complete:
+                fields.append((key, value[key]))
+        return fields
+
+    def _new(self, done: bool) -> List[Tuple[str, Any]]:
+        try:
+            value, _ = loads(self.text)
+        except ParseError:
+            return []
+        if not isinstance(value, dict):
+            return []
+        fields = [(name, field) for name, field in self._fields(value, done) if name not in self.emitted]
+        self.emitted.update(name for name, _ in fields)
+        return fields
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk or ''
+        return self._new(done=False)
+
+    def finish(self) -> List[Tuple[str, Any]]:
+        """Fields still unreported once the stream has ended"""
+        return self._new(done=True)
@@ -0,0 +1,36 @@
+"""
+Admission Rules Tests - Target level detection
+Run with: python -m pytest test_admission_rules.py
+"""
+
+import pytest
+
+import admission_rules
+
+
+@pytest.mark.parametrize('text, level', [
+    ("Undergraduate degree", 'pregrado'),
+    ("Pregrado", 'pregrado'),
+    ("Licenciatura en Teología", 'pregrado'),
+    ("Bachelor's", 'pregrado'),
+    ("Maestría en Divinidad", 'maestria'),
+    ("Master's degree", 'maestria'),
+    ("M.Div", 'maestria'),
+    ("Postgrado", 'maestria'),
+    ("Graduate studies", 'maestria'),
+    ("Doctorado", 'doctorado'),
+    ("Ph.D.", 'doctorado'),
+    ("D.Min", 'doctorado'),
+    ("Th.D.", 'doctorado'),
+    ("Certificación Básica", 'certificacion'),
+])
+def test_target_level(text, level):
+    assert admission_rules._target(text) == level
+
+
+@pytest.mark.parametrize('text', [
+    "Ministry with diverse communities",
+    "Mastery of the Bible",
+])
+def test_no_target_inside_words(text):
+    assert admission_rules._target(text) is None
@@ -0,0 +1,183 @@
+"""
+Token Budget - Fit a Gemini request under a configurable input ceiling
+Estimates the tokens of the prompt and of each attached document, and when
+the total is over GEMINI_INPUT_TOKEN_BUDGET (or the raw document bytes are
+over GEMINI_DOCUMENT_BYTES_BUDGET) shrinks the lowest-value documents first:
+images are downsampled, PDFs trimmed to their first pages, and whatever still
+doesn't fit is dropped. Every request logs what was kept, shrunk or dropped.
+
+Documents are read from disk through document_handles (never decoded into
+memory just to be measured), and shrunken copies are written back to disk.
+Documents sent by URI don't count against the bytes budget.
+
+Pillow and pypdf are optional; without them oversized documents are dropped
+instead of downsampled or trimmed.
+"""
+
+import io
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import document_handles
+import structured_log
+
+log = structured_log.get_logger('token_budget')
+
+INPUT_TOKEN_BUDGET = int(os.getenv('GEMINI_INPUT_TOKEN_BUDGET', '120000'))
+# Inline request payloads are capped well below the context window (base64 adds a third);
+# documents sent by URI (see document_handles) don't count
+DOCUMENT_BYTES_BUDGET = int(os.getenv('GEMINI_DOCUMENT_BYTES_BUDGET', str(14 * 1024 * 1024)))
+# Room left for the model's answer
+OUTPUT_RESERVE = int(os.getenv('GEMINI_OUTPUT_TOKEN_RESERVE', '8192'))
+CHARS_PER_TOKEN = float(os.getenv('GEMINI_CHARS_PER_TOKEN', '4'))
+
+# Gemini bills images per 768x768 tile and PDFs per page at this rate
+TOKENS_PER_TILE = 258
+TOKENS_PER_PAGE = 258
+TILE_SIDE = 768
+# Longest side of a downsampled image (one tile)
+DOWNSAMPLE_SIDE = int(os.getenv('GEMINI_IMAGE_MAX_SIDE', str(TILE_SIDE)))
+
+# Filename hints, most valuable first: credentials decide the level, receipts/IDs rarely matter
+HIGH_VALUE = re.compile(r'transcrip|t[ií]tulo|diploma|degree|licenciatura|maestr|bachiller|certificado|grado', re.I)
+LOW_VALUE = re.compile(r'foto|photo|selfie|\bid\b|identific|pasaporte|passport|pago|payment|recibo|receipt', re.I)
+
+PDF_PAGE = re.compile(rb'/Type\s*/Page[^s]')
+
+
+def estimate_text_tokens(text: str) -> int:
+    return int(len(text or '') / CHARS_PER_TOKEN) + 1
+
+
+def _open_image(document: Dict):
+    """Pillow image for a document (reads the file lazily - only the header for .size)"""
+    from PIL import Image
+    if 'path' in document:
+        return Image.open(document['path'])
+    with document_handles.view(document) as data:
+        return Image.open(io.BytesIO(data))
+
+
+def _image_size(document: Dict) -> Optional[Tuple[int, int]]:
+    try:
+        with _open_image(document) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def estimate_document_tokens(document: Dict) -> int:
+    """Tokens Gemini will bill for one uploaded_documents entry"""
+    mime_type = document.get('mime_type', '')
+    if mime_type.startswith('image/'):
+        size = _image_size(document)
+        if not size:
+            # Unknown dimensions: assume a typical phone photo (4 tiles)
+            return 4 * TOKENS_PER_TILE
+        tiles = -(-size[0] // TILE_SIDE) * -(-size[1] // TILE_SIDE)
+        return max(1, tiles) * TOKENS_PER_TILE
+    with document_handles.view(document) as data:
+        if mime_type == 'application/pdf':
+            # finditer over the mmap: pages are counted without copying the file
+            return max(1, sum(1 for _ in PDF_PAGE.finditer(data))) * TOKENS_PER_PAGE
+        return estimate_text_tokens(bytes(data).decode('utf-8', errors='ignore'))
+
+
+def document_value(document: Dict) -> int:
+    """Higher is more useful to the classification; ties go to the smaller document"""
+    filename = document.get('filename', '')
+    if HIGH_VALUE.search(filename):
+        return 3
+    if LOW_VALUE.search(filename):
+        return 0
+    return 2 if document.get('mime_type') == 'application/pdf' else 1
+
+
+def downsample_image(document: Dict) -> Optional[Dict]:
+    """Re-encode an image to fit one tile; None if Pillow is unavailable or it fails"""
+    try:
+        with _open_image(document) as image:
+            image = image.convert('RGB')
+            image.thumbnail((DOWNSAMPLE_SIDE, DOWNSAMPLE_SIDE))
+            out = io.BytesIO()
+            image.save(out, format='JPEG', quality=80)
+        return document_handles.write_derived(document, out.getvalue(), 'image/jpeg')
+    except Exception:
+        return None
+
+
+def trim_pdf(document: Dict, max_pages: int) -> Optional[Dict]:
+    """Keep the first max_pages pages; None if pypdf is unavailable or it fails"""
+    if max_pages < 1:
+        return None
+    try:
+        from pypdf import PdfReader, PdfWriter
+        if 'path' in document:
+            reader = PdfReader(document['path'])
+        else:
+            with document_handles.view(document) as data:
+                reader = PdfReader(io.BytesIO(data))
+        writer = PdfWriter()
+        for page in reader.pages[:max_pages]:
+            writer.add_page(page)
+        out = io.BytesIO()
+        writer.write(out)
+        return document_handles.write_derived(document, out.getvalue())
+    except Exception:
+        return None
+
+
+def fit(prompt_parts: List[str], documents: Optional[List[Dict]], budget: int = INPUT_TOKEN_BUDGET,
+        bytes_budget: int = DOCUMENT_BYTES_BUDGET) -> Tuple[List[Dict], Dict]:
+    """
+    Choose the documents to send with a prompt.
+    Returns (documents, decision): documents keep their original order, and
+    decision records the estimates and what happened to each file.
+    """
+    prompt_tokens = sum(estimate_text_tokens(part) for part in prompt_parts)
+    available = budget - OUTPUT_RESERVE - prompt_tokens
+
+    entries = []
+    for document in documents or []:
+        entries.append({'document': document, 'tokens': estimate_document_tokens(document),
+                        'bytes': document_handles.size(document), 'inline': document_handles.is_inline(document),
+                        'value': document_value(document), 'action': 'kept'})
+
+    def over():
+        kept = [e for e in entries if e['action'] != 'dropped']
+        inline_bytes = sum(e['bytes'] for e in kept if e['inline'])
+        return sum(e['tokens'] for e in kept) > available or inline_bytes > bytes_budget
+
+    # Shrink or drop the least valuable (then largest) documents until it fits
+    for entry in sorted(entries, key=lambda e: (e['value'], -e['tokens'])):
+        if not over():
+            break
+        document = entry['document']
+        smaller = None
+        if document.get('mime_type', '').startswith('image/') and entry['tokens'] > TOKENS_PER_TILE:
+            smaller, action = downsample_image(document), 'downsampled'
+        elif document.get('mime_type') == 'application/pdf':
+            others = sum(e['tokens'] for e in entries if e is not entry and e['action'] != 'dropped')
+            pages = (available - others) // TOKENS_PER_PAGE
+            smaller, action = trim_pdf(document, min(pages, entry['tokens'] // TOKENS_PER_PAGE - 1)), 'trimmed'
+        if smaller:
+            entry.update(document=smaller, bytes=smaller['size'], inline=document_handles.is_inline(smaller),
+                         tokens=estimate_document_tokens(smaller), action=action)
+        if over():
+            entry['action'] = 'dropped'
+
+    kept = [e for e in entries if e['action'] != 'dropped']
+    decision = {
+        'budget': budget,
+        'prompt_tokens': prompt_tokens,
+        'document_tokens': sum(e['tokens'] for e in kept),
+        'total_tokens': prompt_tokens + sum(e['tokens'] for e in kept),
+        'documents': [{'filename': e['document'].get('filename'), 'action': e['action'], 'tokens': e['tokens'],
+                       'bytes': e['bytes'], 'inline': e['inline'], 'value': e['value']}
+                      for e in entries],
+    }
+    if prompt_tokens > budget - OUTPUT_RESERVE:
+        log.warning("Prompt alone exceeds the token budget", prompt_tokens=prompt_tokens, budget=budget)
+    log.info(f"Sending {len(kept)}/{len(entries)} documents (~{decision['total_tokens']} input tokens)", **decision)
+    return [e['document'] for e in kept], decision